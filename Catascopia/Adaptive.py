@@ -0,0 +1,91 @@
+class AdaptivePeriodicity(object):
+    """Per-probe controller adapting the periodicity to the volatility of the collected values.
+       Every metric keeps its noise level, an exponentially weighted average of the absolute change between
+       rounds learned from every round, so that a lasting change of behaviour widens it. A round is volatile when a value changed by more than
+       threshold (relative to the previous value) and by more than confidence times its noise level.
+       Volatile rounds shrink the period towards min_period, stable ones grow it towards max_period
+    """
+
+    def __init__(self, min_period, max_period, threshold = 0.1, confidence = 3.0, alpha = 0.3, grow = 1.5,
+                 shrink = 0.25, warmup = 3, metrics = None):
+        if not 0 < min_period <= max_period:
+            raise CatascopiaAdaptiveException('AdaptivePeriodicity requires 0 < min_period <= max_period')
+        if not 0 < alpha <= 1:
+            raise CatascopiaAdaptiveException('AdaptivePeriodicity alpha must be in (0, 1]')
+        if grow < 1 or not 0 < shrink <= 1:
+            raise CatascopiaAdaptiveException('AdaptivePeriodicity requires grow >= 1 and 0 < shrink <= 1')
+        self.min_period = min_period
+        self.max_period = max_period
+        self.threshold = threshold
+        self.confidence = confidence
+        self.alpha = alpha
+        self.grow = grow
+        self.shrink = shrink
+        # rounds observed before a metric may count as volatile
+        self.warmup = warmup
+        # names of the metrics driving the periodicity, None for every numeric metric
+        self.metrics = None if metrics is None else set(metrics)
+        # mid -> [rounds, previous value, noise level]
+        self._state = dict()
+        self.volatile_rounds = 0
+        self.stable_rounds = 0
+        self.last_volatile = None
+
+    def get_min_period(self):
+        return self.min_period
+
+    def get_max_period(self):
+        return self.max_period
+
+    def clamp(self, period):
+        return min(max(period, self.min_period), self.max_period)
+
+    def observe(self, mid, val):
+        """method that feeds a value, returns True if it is volatile"""
+        st = self._state.get(mid)
+        if st is None:
+            self._state[mid] = [1, val, 0.0]
+            return False
+        n, prev, noise = st
+        delta = abs(val - prev)
+        volatile = False
+        if n > self.warmup:
+            volatile = delta > self.threshold * max(abs(prev), 1e-12) and delta > self.confidence * noise
+        st[0] = n + 1
+        st[1] = val
+        # volatile rounds widen the bound too, values that stay this noisy settle back into stable rounds
+        st[2] = noise + self.alpha * (delta - noise)
+        return volatile
+
+    def update(self, table, period):
+        """method that observes the current values of a MetricTable, returns the next periodicity"""
+        volatile = None
+        names = self.metrics
+        for mid, ts, val in table.fill_entries([]):
+            if val is None or isinstance(val, bool) or not isinstance(val, (int, float)) or val != val:
+                continue
+            if names is not None and table.get_descriptor(mid).name not in names:
+                continue
+            # every metric is observed even once the round is known to be volatile, to keep its noise level
+            if self.observe(mid, val) and volatile is None:
+                volatile = table.get_descriptor(mid).name
+        if volatile is not None:
+            self.volatile_rounds += 1
+            self.last_volatile = volatile
+            return self.clamp(period * self.shrink)
+        self.stable_rounds += 1
+        return self.clamp(period * self.grow)
+
+    def forget(self, mid):
+        self._state.pop(mid, None)
+
+    def get_stats(self):
+        return {'min_period': self.min_period,
+                'max_period': self.max_period,
+                'volatile_rounds': self.volatile_rounds,
+                'stable_rounds': self.stable_rounds,
+                'last_volatile': self.last_volatile}
+
+
+class CatascopiaAdaptiveException(Exception):
+    pass
@@ -0,0 +1,455 @@
+"""Config driven agent running the probes declared in a JSON, TOML or YAML file
+
+usage: python -m Catascopia.Agent config.json [--print] [--debug]
+
+{"workers": 4, "reload": 5,
+ "governor": {"cpu_budget": 2.0},
+ "probes": [{"class": "CPUProbe", "periodicity": 5},
+            {"name": "app", "class": "ProcessProbe", "periodicity": 1, "priority": "HIGH", "args": {"pid": 1234}},
+            {"class": "mypackage.probes:QueueProbe", "enabled": false}]}
+"""
+import argparse
+import importlib
+import inspect
+import json
+import logging
+import os
+import pkgutil
+import signal
+import sys
+import time
+from queue import Empty
+from threading import Thread, Event, Lock
+
+from Catascopia.Channel import RingBufferChannel, OverflowPolicy
+from Catascopia.Metrics import Priority
+from Catascopia.Scheduler import ProbeScheduler
+
+
+ENTRY_POINT_GROUP = 'catascopia.probes'
+
+_PRIORITIES = dict((Priority.type_as_string(p), p) for p in range(Priority.typeNum))
+
+
+def load_config(path):
+    """helper that parses the config file at path, by extension .json, .toml or .yaml/.yml"""
+    ext = os.path.splitext(path)[1].lower()
+    try:
+        with open(path, 'rb') as f:
+            data = f.read().decode('utf-8')
+    except OSError as e:
+        raise CatascopiaConfigException('cannot read config %s: %s' % (path, e))
+    try:
+        if ext == '.json':
+            return json.loads(data)
+        if ext == '.toml':
+            try:
+                import tomllib
+            except ImportError:
+                try:
+                    import tomli as tomllib
+                except ImportError:
+                    raise CatascopiaConfigException('TOML configs require Python 3.11+ or tomli, '
+                                                    'install it with pip install tomli')
+            return tomllib.loads(data)
+        if ext in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise CatascopiaConfigException('YAML configs require PyYAML, install it with pip install pyyaml')
+            return yaml.safe_load(data)
+    except CatascopiaConfigException:
+        raise
+    except Exception as e:
+        raise CatascopiaConfigException('invalid config %s: %s' % (path, e))
+    raise CatascopiaConfigException('unknown config format ' + path + ', expected .json, .toml, .yaml or .yml')
+
+
+class ProbeRegistry(object):
+    """Maps probe class names to 'module:Class' references without importing them, the modules of
+       Catascopia.probelib (a module per probe, named after its class) plus the probes other packages
+       publish under the catascopia.probes entry point group. A class is imported on resolve() only
+    """
+
+    def __init__(self):
+        self.refs = dict()
+        import Catascopia.probelib
+        for info in pkgutil.iter_modules(Catascopia.probelib.__path__):
+            self.refs[info.name] = 'Catascopia.probelib.%s:%s' % (info.name, info.name)
+        # entry points are only looked up for names not in probelib, scanning installed packages is slow
+        self._entry_points = None
+        self.classes = dict()
+        self.import_time = 0.0
+
+    def _load_entry_points(self):
+        refs = dict()
+        try:
+            from importlib.metadata import entry_points
+        except ImportError:
+            try:
+                from importlib_metadata import entry_points
+            except ImportError:
+                return refs
+        eps = entry_points()
+        if hasattr(eps, 'select'):
+            eps = eps.select(group = ENTRY_POINT_GROUP)
+        else:
+            eps = eps.get(ENTRY_POINT_GROUP, ())
+        for ep in eps:
+            refs[ep.name] = ep.value
+        return refs
+
+    def get_ref(self, name):
+        """method that returns the 'module:Class' reference of name, None if unknown"""
+        if ':' in name:
+            return name
+        ref = self.refs.get(name)
+        if ref is None:
+            if self._entry_points is None:
+                self._entry_points = self._load_entry_points()
+            ref = self._entry_points.get(name)
+        return ref
+
+    def get_names(self):
+        """method that returns every known probe name, probelib and entry points"""
+        if self._entry_points is None:
+            self._entry_points = self._load_entry_points()
+        return sorted(set(self.refs) | set(self._entry_points))
+
+    def resolve(self, name):
+        """method that imports and returns the probe class of name, a known name or 'module:Class'"""
+        ref = self.get_ref(name)
+        if ref is None:
+            raise CatascopiaConfigException('unknown probe class ' + name)
+        cls = self.classes.get(ref)
+        if cls is None:
+            module, _, attr = ref.partition(':')
+            start = time.perf_counter()
+            try:
+                cls = getattr(importlib.import_module(module), attr or module.rpartition('.')[2])
+            except (ImportError, AttributeError) as e:
+                raise CatascopiaConfigException('cannot import probe class %s (%s): %s' % (name, ref, e))
+            finally:
+                self.import_time += time.perf_counter() - start
+            self.classes[ref] = cls
+        return cls
+
+
+class ProbeSpec(object):
+    """one probe entry of the config"""
+
+    __slots__ = ('name', 'cls', 'enabled', 'periodicity', 'priority', 'args', 'batching')
+
+    def __init__(self, entry):
+        if not isinstance(entry, dict) or 'class' not in entry:
+            raise CatascopiaConfigException('probe entry without class: ' + str(entry))
+        self.cls = entry['class']
+        self.name = entry.get('name', self.cls.rpartition(':')[2])
+        self.enabled = bool(entry.get('enabled', True))
+        self.periodicity = entry.get('periodicity')
+        if self.periodicity is not None and self.periodicity <= 0:
+            raise CatascopiaConfigException('probe %s periodicity must be positive' % self.name)
+        # None keeps the periodicity and priority the probe class defaults to
+        priority = entry.get('priority')
+        if isinstance(priority, str):
+            priority = _PRIORITIES.get(priority.upper(), -1)
+        if priority is not None and not Priority.contains(priority):
+            raise CatascopiaConfigException('probe %s invalid priority %s' % (self.name, entry.get('priority')))
+        self.priority = priority
+        self.args = dict(entry.get('args') or {})
+        self.batching = bool(entry.get('batching', False))
+
+    def same_instance(self, other):
+        """method that tells whether other builds the same probe, changes to periodicity, priority and
+           enabled apply to a running probe
+        """
+        return self.cls == other.cls and self.args == other.args and self.batching == other.batching
+
+
+def parse_config(config):
+    """helper that validates a config dict, returns it along with the ProbeSpecs in config order"""
+    if not isinstance(config, dict):
+        raise CatascopiaConfigException('config must be a mapping')
+    specs = []
+    names = set()
+    for entry in config.get('probes') or ():
+        spec = ProbeSpec(entry)
+        if spec.name in names:
+            raise CatascopiaConfigException('duplicate probe name ' + spec.name)
+        names.add(spec.name)
+        specs.append(spec)
+    return specs
+
+
+class ProbeAgent(object):
+    """Runs the probes declared in a config (a file path or a dict) on a ProbeScheduler, all pushing to a
+       shared queue. Probe classes are imported only when enabled, so disabled entries cost nothing at
+       startup. reload() applies periodicity, priority and enabled changes to the running probes in place,
+       a periodicity or priority dropped from an entry reverts to the default of the probe class, only
+       probes whose class or args changed get restarted. With a reload interval in the config the file
+       is watched and reloaded on change, main() also reloads on SIGHUP
+    """
+
+    def __init__(self, config, queue = None, registry = None, debug = False):
+        self.path = config if isinstance(config, str) else None
+        self._debug = debug
+        self.logger = logging.getLogger('Catascopia.Agent')
+        self.registry = registry if registry is not None else ProbeRegistry()
+        self.timings = dict()
+        start = time.perf_counter()
+        self.config = load_config(self.path) if self.path is not None else config
+        self.specs = parse_config(self.config)
+        self.timings['config'] = time.perf_counter() - start
+        self.queue = queue if queue is not None else \
+            RingBufferChannel(self.config.get('capacity', 100000), OverflowPolicy.DROP_OLDEST)
+        self.scheduler = ProbeScheduler('AgentScheduler', self.config.get('workers'), debug)
+        self.governor = None
+        # name -> (ProbeSpec, Probe) of the running probes
+        self.probes = dict()
+        # Probe -> (periodicity, priority) it was built with before the config applied, restored when the
+        # config no longer sets them
+        self._defaults = dict()
+        self._lock = Lock()
+        self._mtime = None
+        self._watcher = None
+        self._stop = Event()
+        # set by request_reload(), e.g. from a signal handler, the watcher thread does the reload
+        self._reload_requested = Event()
+        self.reloads = 0
+
+    def start(self):
+        """method that builds and activates every enabled probe, raises CatascopiaConfigException if one fails"""
+        start = time.perf_counter()
+        with self._lock:
+            if self.config.get('governor') is not None:
+                from Catascopia.Governor import OverheadGovernor
+                self.governor = OverheadGovernor(**self.config['governor'])
+            built = [(spec, self._build(spec)) for spec in self.specs if spec.enabled]
+            self.timings['build'] = time.perf_counter() - start
+            self.timings['imports'] = self.registry.import_time
+            self.scheduler.start()
+            for spec, probe in built:
+                self._run(spec, probe)
+        if self.governor is not None:
+            self.governor.start()
+        interval = self.config.get('reload')
+        if interval and self.path is not None:
+            self.watch(interval)
+        self.timings['start'] = time.perf_counter() - start
+        self.logger.info('ProbeAgent started %d probes in %.1fms', len(self.probes), self.timings['start'] * 1e3)
+        return self
+
+    def _build(self, spec):
+        cls = self.registry.resolve(spec.cls)
+        kwargs = dict(spec.args)
+        kwargs['name'] = spec.name
+        if spec.periodicity is not None:
+            kwargs['periodicity'] = spec.periodicity
+        try:
+            probe = cls(**kwargs)
+        except Exception as e:
+            raise CatascopiaConfigException('cannot build probe %s: %s: %s' % (spec.name, type(e).__name__, e))
+        periodicity = probe.get_periodicity() if spec.periodicity is None else _default_periodicity(cls)
+        self._defaults[probe] = (periodicity, probe.get_priority())
+        if spec.priority is not None:
+            probe.set_priority(spec.priority)
+        if spec.batching:
+            probe.set_batching(True)
+        return probe
+
+    def _run(self, spec, probe):
+        probe.attachQueue(self.queue)
+        self.scheduler.add_probe(probe)
+        if self.governor is not None:
+            self.governor.add_probe(probe)
+        probe.activate()
+        self.probes[spec.name] = (spec, probe)
+
+    def _stop_probe(self, name):
+        spec, probe = self.probes.pop(name)
+        self._defaults.pop(probe, None)
+        if self.governor is not None:
+            self.governor.remove_probe(probe)
+        # the scheduler releases a TERMinated probe once its cleanUp() ran
+        probe.terminate()
+
+    def reload(self, config = None):
+        """method that applies config (by default the config file re-read) to the running probes, returns
+           the names of the probes added, removed, updated in place and restarted. Entries failing to build
+           are logged and skipped, the rest of the config still applies
+        """
+        if config is None:
+            if self.path is None:
+                raise CatascopiaConfigException('ProbeAgent reload() requires a config, none was read from a file')
+            config = load_config(self.path)
+        specs = parse_config(config)
+        changes = {'added': [], 'removed': [], 'updated': [], 'restarted': []}
+        with self._lock:
+            wanted = dict((spec.name, spec) for spec in specs if spec.enabled)
+            for name in list(self.probes):
+                if name not in wanted:
+                    self._stop_probe(name)
+                    changes['removed'].append(name)
+            for spec in specs:
+                if not spec.enabled:
+                    continue
+                running = self.probes.get(spec.name)
+                if running is not None and running[0].same_instance(spec):
+                    if self._update(running[1], running[0], spec):
+                        changes['updated'].append(spec.name)
+                    self.probes[spec.name] = (spec, running[1])
+                    continue
+                try:
+                    probe = self._build(spec)
+                except CatascopiaConfigException as e:
+                    self.logger.error('ProbeAgent reload skipped probe %s: %s', spec.name, e)
+                    continue
+                if running is not None:
+                    self._stop_probe(spec.name)
+                    changes['restarted'].append(spec.name)
+                else:
+                    changes['added'].append(spec.name)
+                self._run(spec, probe)
+            self.config = config
+            self.specs = specs
+            self.reloads += 1
+        self.logger.info('ProbeAgent reloaded config: %s', changes)
+        return changes
+
+    def _update(self, probe, old, new):
+        """method that applies the periodicity and priority of new, the defaults of the probe where unset"""
+        periodicity, priority = self._defaults.get(probe, (None, None))
+        changed = False
+        before = old.periodicity if old.periodicity is not None else periodicity
+        after = new.periodicity if new.periodicity is not None else periodicity
+        if after is not None and after != before:
+            # applies from the next round, the probe keeps running
+            probe.set_periodicity(after)
+            changed = True
+        before = old.priority if old.priority is not None else priority
+        after = new.priority if new.priority is not None else priority
+        if after is not None and after != before:
+            probe.set_priority(after)
+            changed = True
+        return changed
+
+    def watch(self, interval = 5.0):
+        """method that starts the watcher thread, reloading the config file every time its modification time
+           changes (checked every interval seconds, None to skip) and whenever request_reload() is called
+        """
+        if self.path is None:
+            raise CatascopiaConfigException('ProbeAgent can only watch a config read from a file')
+        if self._watcher is not None:
+            return
+        self._mtime = os.stat(self.path).st_mtime
+        self._watcher = Thread(target = self._watch, args = (interval,), name = 'AgentConfigWatcher', daemon = True)
+        self._watcher.start()
+
+    def request_reload(self):
+        """method that asks the watcher thread to reload the config file, safe to call from a signal handler
+           as it never waits on the agent lock
+        """
+        self._reload_requested.set()
+
+    def _watch(self, interval):
+        while True:
+            requested = self._reload_requested.wait(interval)
+            if self._stop.is_set():
+                return
+            self._reload_requested.clear()
+            try:
+                mtime = os.stat(self.path).st_mtime
+                if requested or mtime != self._mtime:
+                    self._mtime = mtime
+                    self.reload()
+            except Exception as e:
+                # a broken edit keeps the running probes as they are
+                self.logger.error('ProbeAgent reload of %s failed: %s', self.path, e)
+
+    def get_probe(self, name):
+        running = self.probes.get(name)
+        return running[1] if running is not None else None
+
+    def get_probes(self):
+        return [probe for spec, probe in self.probes.values()]
+
+    def get_queue(self):
+        return self.queue
+
+    def get_stats(self):
+        """method that returns the startup timings in seconds (config parsing, probe class imports, probe
+           building and the whole start()), the probes configured and running and the reload count
+        """
+        return {'timings': dict(self.timings),
+                'configured': len(self.specs),
+                'running': len(self.probes),
+                'imported': len(self.registry.classes),
+                'reloads': self.reloads}
+
+    def shutdown(self):
+        """method that stops the watcher and the governor and TERMinates every probe"""
+        self._stop.set()
+        # wakes the watcher up
+        self._reload_requested.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+        if self.governor is not None:
+            self.governor.shutdown()
+        with self._lock:
+            self.scheduler.shutdown(terminate_probes = True)
+            self.probes = dict()
+
+
+def _default_periodicity(cls):
+    """helper that returns the default periodicity of the constructor of a probe class, None if it has none"""
+    try:
+        param = inspect.signature(cls).parameters.get('periodicity')
+    except (TypeError, ValueError):
+        return None
+    if param is None or param.default is inspect.Parameter.empty:
+        return None
+    return param.default
+
+
+class CatascopiaConfigException(Exception):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('config')
+    parser.add_argument('--print', action = 'store_true', help = 'print every item the probes emit')
+    parser.add_argument('--debug', action = 'store_true')
+    args = parser.parse_args()
+    logging.basicConfig(level = logging.DEBUG if args.debug else logging.INFO)
+
+    try:
+        agent = ProbeAgent(args.config, debug = args.debug).start()
+    except CatascopiaConfigException as e:
+        print(e, file = sys.stderr)
+        sys.exit(1)
+
+    def on_hangup(signum, frame):
+        # the handler may interrupt the main thread anywhere, the reload itself runs on the watcher thread
+        agent.request_reload()
+
+    if hasattr(signal, 'SIGHUP'):
+        agent.watch(agent.config.get('reload'))
+        signal.signal(signal.SIGHUP, on_hangup)
+    try:
+        while True:
+            if not args.print:
+                time.sleep(1.0)
+                continue
+            try:
+                print(agent.get_queue().get(timeout = 1.0))
+            except Empty:
+                pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        agent.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+import math
+import time
+
+
+class QuantileSketch(object):
+    """Mergeable quantile sketch with relative accuracy alpha (DDSketch style log-spaced buckets).
+       Memory is bounded by max_bins, beyond it the buckets closest to zero are collapsed which only
+       affects the accuracy of the lowest quantiles
+    """
+
+    __slots__ = ('alpha', 'gamma', '_lg', 'max_bins', 'pos', 'neg', 'zero', 'count')
+
+    def __init__(self, alpha = 0.01, max_bins = 512):
+        if not 0 < alpha < 1:
+            raise CatascopiaAggregationException('QuantileSketch alpha must be in (0, 1)')
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self._lg = math.log(self.gamma)
+        self.max_bins = max_bins
+        # bucket index -> count, for positive values and for the magnitude of negative values
+        self.pos = dict()
+        self.neg = dict()
+        self.zero = 0
+        self.count = 0
+
+    def add(self, val):
+        if val > 0:
+            k = math.ceil(math.log(val) / self._lg)
+            self.pos[k] = self.pos.get(k, 0) + 1
+        elif val < 0:
+            k = math.ceil(math.log(-val) / self._lg)
+            self.neg[k] = self.neg.get(k, 0) + 1
+        else:
+            self.zero += 1
+        self.count += 1
+        if len(self.pos) + len(self.neg) > self.max_bins:
+            self._collapse()
+
+    def _collapse(self):
+        # fold the lowest magnitude buckets of the larger store into their neighbour
+        store = self.pos if len(self.pos) >= len(self.neg) else self.neg
+        excess = len(self.pos) + len(self.neg) - self.max_bins
+        keys = sorted(store)
+        if len(keys) < 2:
+            return
+        excess = min(excess, len(keys) - 1)
+        folded = sum(store.pop(k) for k in keys[:excess])
+        store[keys[excess]] += folded
+
+    def _value(self, k):
+        return 2 * self.gamma ** k / (self.gamma + 1)
+
+    def quantile(self, q):
+        """method that returns the approximate q-quantile (0 <= q <= 1), None if empty"""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for k in sorted(self.neg, reverse = True):
+            seen += self.neg[k]
+            if seen > rank:
+                return -self._value(k)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for k in sorted(self.pos):
+            seen += self.pos[k]
+            if seen > rank:
+                return self._value(k)
+        return self._value(max(self.pos)) if self.pos else 0.0
+
+    def merge(self, other):
+        if other.alpha != self.alpha:
+            raise CatascopiaAggregationException('cannot merge QuantileSketches with different alpha')
+        for k, c in other.pos.items():
+            self.pos[k] = self.pos.get(k, 0) + c
+        for k, c in other.neg.items():
+            self.neg[k] = self.neg.get(k, 0) + c
+        self.zero += other.zero
+        self.count += other.count
+        while len(self.pos) + len(self.neg) > self.max_bins:
+            self._collapse()
+        return self
+
+    def to_dict(self):
+        d = dict()
+        d['alpha'] = self.alpha
+        d['pos'] = [[k, c] for k, c in self.pos.items()]
+        d['neg'] = [[k, c] for k, c in self.neg.items()]
+        d['zero'] = self.zero
+        return d
+
+    @staticmethod
+    def from_dict(d, max_bins = 512):
+        s = QuantileSketch(d['alpha'], max_bins)
+        s.pos = {k: c for k, c in d['pos']}
+        s.neg = {k: c for k, c in d['neg']}
+        s.zero = d['zero']
+        s.count = s.zero + sum(s.pos.values()) + sum(s.neg.values())
+        return s
+
+
+class WindowSummary(object):
+    """count, min, max, mean and variance (Welford) plus a QuantileSketch over a window of samples,
+       mergeable with summaries of other windows, probes or hosts
+    """
+
+    __slots__ = ('count', 'min', 'max', 'mean', 'm2', 'sketch')
+
+    def __init__(self, alpha = 0.01, max_bins = 512):
+        self.count = 0
+        self.min = None
+        self.max = None
+        self.mean = 0.0
+        # sum of squared differences from the mean
+        self.m2 = 0.0
+        self.sketch = QuantileSketch(alpha, max_bins)
+
+    def add(self, val):
+        self.count += 1
+        if self.min is None or val < self.min:
+            self.min = val
+        if self.max is None or val > self.max:
+            self.max = val
+        delta = val - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (val - self.mean)
+        self.sketch.add(val)
+
+    def merge(self, other):
+        """method that merges another summary in (Chan et al. parallel variance)"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.min, self.max, self.mean, self.m2 = other.min, other.max, other.mean, other.m2
+        else:
+            n = self.count + other.count
+            delta = other.mean - self.mean
+            self.mean += delta * other.count / n
+            self.m2 += other.m2 + delta * delta * self.count * other.count / n
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        self.count += other.count
+        self.sketch.merge(other.sketch)
+        return self
+
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    def quantile(self, q):
+        return self.sketch.quantile(q)
+
+    def to_dict(self, quantiles = (0.5, 0.9, 0.99)):
+        d = dict()
+        d['count'] = self.count
+        d['min'] = self.min
+        d['max'] = self.max
+        d['mean'] = self.mean
+        d['var'] = self.variance()
+        d['m2'] = self.m2
+        d['quantiles'] = [[q, self.sketch.quantile(q)] for q in quantiles]
+        d['sketch'] = self.sketch.to_dict()
+        return d
+
+    @staticmethod
+    def from_dict(d, max_bins = 512):
+        s = WindowSummary(d['sketch']['alpha'], max_bins)
+        s.count = d['count']
+        s.min = d['min']
+        s.max = d['max']
+        s.mean = d['mean']
+        s.m2 = d['m2']
+        s.sketch = QuantileSketch.from_dict(d['sketch'], max_bins)
+        return s
+
+
+def merge_rollups(rollups, max_bins = 512):
+    """helper that merges rollup dicts (e.g. the same metric from many probes/hosts) into one WindowSummary"""
+    merged = None
+    for d in rollups:
+        s = WindowSummary.from_dict(d, max_bins)
+        merged = s if merged is None else merged.merge(s)
+    return merged
+
+
+class Aggregator(object):
+    """Per-probe aggregation stage, summarises every numeric metric and emits rollups every interval seconds.
+       With window None rollups cover the samples since the previous rollup (tumbling window), otherwise
+       the last window seconds kept as slices sub-windows (sliding window)
+    """
+
+    def __init__(self, interval, window = None, slices = 10, alpha = 0.01, max_bins = 512,
+                 quantiles = (0.5, 0.9, 0.99)):
+        if window is not None and window < interval:
+            raise CatascopiaAggregationException('Aggregator window must not be shorter than the interval')
+        self.interval = interval
+        self.window = window
+        self.slices = slices if window is not None else 1
+        self.alpha = alpha
+        self.max_bins = max_bins
+        self.quantiles = quantiles
+        # mid -> list of [slice epoch, WindowSummary]
+        self._summaries = dict()
+        self._slice_len = window / slices if window is not None else None
+        self._next_rollup = None
+        self._start = None
+
+    def get_interval(self):
+        return self.interval
+
+    def get_window(self):
+        return self.window
+
+    def add(self, mid, val, now = None):
+        """method that feeds a sample, non numeric values are ignored"""
+        if val is None or isinstance(val, bool) or not isinstance(val, (int, float)) or val != val:
+            return
+        ring = self._summaries.get(mid)
+        if ring is None:
+            ring = self._summaries[mid] = [[None, None] for _ in range(self.slices)]
+        if self.window is None:
+            cell = ring[0]
+        else:
+            epoch = int((time.monotonic() if now is None else now) // self._slice_len)
+            cell = ring[epoch % self.slices]
+            if cell[0] != epoch:
+                # slice belongs to a past window
+                cell[0] = epoch
+                cell[1] = None
+        if cell[1] is None:
+            cell[1] = WindowSummary(self.alpha, self.max_bins)
+        cell[1].add(val)
+
+    def forget(self, mid):
+        """method that drops the samples of a removed metric, no rollup is emitted for it any more"""
+        self._summaries.pop(mid, None)
+
+    def add_entries(self, entries, now = None):
+        now = time.monotonic() if now is None else now
+        for mid, ts, val in entries:
+            self.add(mid, val, now)
+
+    def due(self, now = None):
+        """method that tells whether a rollup should be emitted, starts the interval on first call"""
+        now = time.monotonic() if now is None else now
+        if self._next_rollup is None:
+            self._next_rollup = now + self.interval
+            self._start = time.time()
+            return False
+        return now >= self._next_rollup
+
+    def rollup(self, now = None):
+        """method that returns [mid, rollup dict] pairs and starts the next interval"""
+        now = time.monotonic() if now is None else now
+        end = time.time()
+        rollups = []
+        oldest = None if self.window is None else int(now // self._slice_len) - self.slices + 1
+        for mid, ring in self._summaries.items():
+            merged = WindowSummary(self.alpha, self.max_bins)
+            for cell in ring:
+                if cell[1] is not None and (oldest is None or cell[0] >= oldest):
+                    merged.merge(cell[1])
+            if self.window is None:
+                ring[0][1] = None
+            if merged.count == 0:
+                continue
+            d = merged.to_dict(self.quantiles)
+            d['start'] = self._start if self.window is None else end - self.window
+            d['end'] = end
+            rollups.append([mid, d])
+        self._start = end
+        self._next_rollup = (self._next_rollup if self._next_rollup is not None else now) + self.interval
+        if self._next_rollup <= now:
+            self._next_rollup = now + self.interval
+        return rollups
+
+
+class CatascopiaAggregationException(Exception):
+    pass
@@ -0,0 +1,247 @@
+import abc
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+
+from Catascopia.Batch import CatascopiaSerializationException
+from Catascopia.Probe import Probe, ProbeStatus, CatascopiaProbeStatusException
+from Catascopia.Channel import AsyncQueueChannel
+
+
+class AsyncProbe(Probe):
+    """Probe whose collect() is a coroutine, meant to be run by an AsyncProbeRunner so that many
+       I/O-bound probes share one event loop. Activated without a runner it falls back to its own
+       thread running each round on a fresh event loop
+    """
+
+    def __init__(self, name, periodicity, timeout = None, debug = False, logging = False):
+        super(AsyncProbe, self).__init__(name, periodicity, debug, logging)
+        # max seconds a collect() round may take before being cancelled, None waits forever
+        self.timeout = timeout
+
+    def get_timeout(self):
+        return self.timeout
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    @abc.abstractmethod
+    async def collect(self):
+        """Probe Developer must override this coroutine to collect values"""
+        pass
+
+    def _tick(self):
+        # thread or ProbeScheduler fallback
+        return asyncio.run(self._atick())
+
+    async def _atick(self):
+        """coroutine counterpart of Probe._tick(), returns the monotonic deadline of the next round"""
+        tick_ts = self._tick_started()
+        cpu = 0.0
+        try:
+            start = time.perf_counter()
+            if self.timeout is None:
+                await self.collect()
+            else:
+                await asyncio.wait_for(self.collect(), self.timeout)
+            self.instrumentation.collect.observe(time.perf_counter() - start)
+            # the CPU time of collect() is not counted, while awaiting the thread runs other tasks of the loop
+            cpu = time.thread_time()
+            self._emit(tick_ts)
+            self._notify_tick(tick_ts)
+            self._adapt()
+            self.errors = 0
+            cpu = time.thread_time() - cpu
+        except asyncio.TimeoutError:
+            self._tick_failed('collect() timed out after ' + str(self.timeout) + 's')
+        except (TypeError, AttributeError, CatascopiaSerializationException, OSError) as e:
+            # I/O-bound rounds fail on refused or reset connections (OSError), the probe keeps running
+            self._tick_failed(e)
+        self.instrumentation.observe_round(cpu)
+        return self._advance_deadline(time.monotonic(), max(self.errors, 1))
+
+
+class AsyncProbeRunner(object):
+    """Runs many probes on a single asyncio event loop, each with its own periodicity. AsyncProbes are
+       awaited on the loop, synchronous Probes (e.g. ProcessProbe) run their rounds in an executor.
+       Either await run() from an existing loop or start() the runner on a dedicated thread
+    """
+
+    __DEFAULT_WORKERS = 4
+
+    def __init__(self, name = 'AsyncProbeRunner', executor = None, debug = False):
+        self.name = name
+        self._debug = debug
+        # executor running the rounds of synchronous probes
+        self._executor = executor
+        self._own_executor = executor is None
+        self.probes = dict()
+        self._loop = None
+        self._thread = None
+        self._tasks = dict()
+        self._wakeups = dict()
+        self._stopped = None
+        self._channel = None
+
+    def add_probe(self, probe):
+        """method that hands the data collection of a (not yet started) Probe over to the runner"""
+        if probe.get_scheduler() is not None and probe.get_scheduler() is not self:
+            raise CatascopiaProbeStatusException('Probe ' + probe.get_name() + ' is already owned by a scheduler')
+        if probe.is_alive():
+            raise CatascopiaProbeStatusException('Probe ' + probe.get_name() + ' already runs its own thread')
+        probe._scheduler = self
+        self.probes[probe.get_probeid()] = probe
+        if self._channel is not None:
+            probe.attachQueue(self._channel)
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._spawn, probe)
+
+    def remove_probe(self, probe):
+        """method that releases a Probe, its data collection stops until added to a scheduler again"""
+        if self.probes.pop(probe.get_probeid(), None) is not None:
+            probe._scheduler = None
+            if self._loop is not None:
+                self._loop.call_soon_threadsafe(self._cancel, probe)
+
+    def get_probes(self):
+        return list(self.probes.values())
+
+    def get_loop(self):
+        return self._loop
+
+    def notify(self, probe):
+        """method invoked by Probes on status transitions (ACTIVE, TERM), may be called from any thread"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake, probe)
+
+    def attachAsyncQueue(self, loop = None, capacity = 10000):
+        """method that attaches one AsyncQueueChannel to every probe of the runner and returns it,
+           consumed with await channel.get() or async for on loop, by default the loop of the runner once
+           started, the running loop of the caller or else the loop of the first get()
+        """
+        if self._channel is None:
+            self._channel = AsyncQueueChannel(loop if loop is not None else self._loop, capacity)
+            for p in self.get_probes():
+                p.attachQueue(self._channel)
+        return self._channel
+
+    async def stream(self, capacity = 10000):
+        """async iterator over the items emitted by every probe of the runner"""
+        channel = self.attachAsyncQueue(asyncio.get_running_loop(), capacity)
+        while True:
+            yield await channel.get()
+
+    async def run(self):
+        """coroutine that runs the probes until shutdown() is called"""
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers = AsyncProbeRunner.__DEFAULT_WORKERS,
+                                                thread_name_prefix = self.name)
+        for probe in self.get_probes():
+            self._spawn(probe)
+        try:
+            await self._stopped.wait()
+        finally:
+            tasks = list(self._tasks.values())
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions = True)
+            self._tasks.clear()
+            self._wakeups.clear()
+            if self._own_executor:
+                self._executor.shutdown(wait = False)
+                self._executor = None
+            self._loop = None
+
+    def start(self):
+        """method that runs the runner on a dedicated thread with its own event loop"""
+        self._thread = Thread(target = asyncio.run, args = (self.run(),), name = self.name)
+        self._thread.start()
+        # wait for the loop to come up so that notify()/attachAsyncQueue() work right after start()
+        while self._loop is None and self._thread.is_alive():
+            time.sleep(0.001)
+
+    def shutdown(self, terminate_probes = True, wait = True):
+        """method that stops the runner, optionally TERMinating (and cleaning up) every probe beforehand"""
+        if terminate_probes:
+            for p in self.get_probes():
+                p.terminate()
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self._stop)
+        if wait and self._thread is not None:
+            self._thread.join()
+
+    def _stop(self):
+        # let terminated probes finish their cleanUp() before cancelling whatever is left
+        pending = [t for t in self._tasks.values() if not t.done()]
+        if pending:
+            asyncio.ensure_future(self._stop_when_done(pending))
+        else:
+            self._stopped.set()
+
+    async def _stop_when_done(self, pending):
+        await asyncio.wait(pending, timeout = 5)
+        self._stopped.set()
+
+    def _spawn(self, probe):
+        pid = probe.get_probeid()
+        if pid in self._tasks or pid not in self.probes:
+            return
+        self._wakeups[pid] = asyncio.Event()
+        self._tasks[pid] = asyncio.ensure_future(self._probe_loop(probe))
+
+    def _cancel(self, probe):
+        task = self._tasks.pop(probe.get_probeid(), None)
+        self._wakeups.pop(probe.get_probeid(), None)
+        if task is not None:
+            task.cancel()
+
+    def _wake(self, probe):
+        event = self._wakeups.get(probe.get_probeid())
+        if event is not None:
+            event.set()
+
+    async def _probe_loop(self, probe):
+        pid = probe.get_probeid()
+        wakeup = self._wakeups[pid]
+        loop = self._loop
+        try:
+            while True:
+                status = probe.get_probestatus()
+                if status == ProbeStatus.TERM:
+                    break
+                if status == ProbeStatus.INACTIVE:
+                    await wakeup.wait()
+                    wakeup.clear()
+                    continue
+                delay = probe._next_deadline() - time.monotonic()
+                if delay > 0:
+                    # woken up early on status transitions, the status is re-checked either way
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), delay)
+                        wakeup.clear()
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                try:
+                    if isinstance(probe, AsyncProbe):
+                        await probe._atick()
+                    else:
+                        await loop.run_in_executor(self._executor, probe._tick)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # anything escaping the probe's own error handling should not kill the loop
+                    if self._debug:
+                        print('AsyncProbeRunner, Probe ' + probe.get_name() + ' round FAILED with error: ' + str(e))
+                    probe._advance_deadline(time.monotonic())
+            if isinstance(probe, AsyncProbe):
+                probe.cleanUp()
+            else:
+                await loop.run_in_executor(self._executor, probe.cleanUp)
+        finally:
+            self._tasks.pop(pid, None)
+            self._wakeups.pop(pid, None)
@@ -0,0 +1,371 @@
+import abc
+import json
+import math
+import struct
+from uuid import UUID
+
+try:
+    import msgpack
+except ImportError:
+    # pure python fallback for the msgpack subset used by batches
+    msgpack = None
+
+
+class MetricBatch(object):
+    """All metric values collected by a Probe during a single data collection round"""
+
+    __slots__ = ('probeid', 'probe', 'timestamp', 'entries', 'descriptors', 'rollups')
+
+    def __init__(self, probeid, probe, timestamp, entries = None, descriptors = None, rollups = None):
+        self.probeid = str(probeid)
+        self.probe = probe
+        # wall-clock time of the data collection round
+        self.timestamp = timestamp
+        # list of (mid, timestamp, val) tuples
+        self.entries = entries if entries is not None else []
+        # list of MetricDescriptor dicts, only sent with the first batch and whenever metrics get registered
+        self.descriptors = descriptors
+        # list of [mid, WindowSummary dict] pairs emitted instead of entries when the probe aggregates
+        self.rollups = rollups
+
+    def add(self, mid, timestamp, val):
+        self.entries.append((mid, timestamp, val))
+
+    def to_dict(self):
+        d = dict()
+        d['probeid'] = self.probeid
+        d['probe'] = self.probe
+        d['timestamp'] = self.timestamp
+        d['metrics'] = [list(e) for e in self.entries]
+        if self.descriptors is not None:
+            d['descriptors'] = self.descriptors
+        if self.rollups is not None:
+            d['rollups'] = self.rollups
+        return d
+
+    @staticmethod
+    def from_dict(d):
+        return MetricBatch(d['probeid'], d['probe'], d['timestamp'], [tuple(e) for e in d['metrics']],
+                           d.get('descriptors'), d.get('rollups'))
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __eq__(self, other):
+        return isinstance(other, MetricBatch) and self.to_dict() == other.to_dict()
+
+    def __str__(self):
+        return str(self.to_dict())
+
+
+class BatchDecoder(object):
+    """Stateful decoder that keeps the descriptors sent by each probe to resolve the mids of later batches"""
+
+    def __init__(self):
+        # probeid -> {mid: descriptor dict}
+        self.descriptors = dict()
+
+    def decode(self, data):
+        batch = decode_batch(data)
+        if batch.descriptors is not None:
+            self.descriptors[batch.probeid] = {d['mid']: d for d in batch.descriptors}
+        return batch
+
+    def get_descriptor(self, probeid, mid):
+        return self.descriptors.get(str(probeid), {}).get(mid)
+
+    def resolve(self, batch):
+        """method that returns the batch entries as Metric.to_dict() shaped dicts"""
+        descriptors = self.descriptors.get(batch.probeid)
+        if descriptors is None:
+            raise CatascopiaSerializationException('no descriptors received from probe ' + batch.probeid)
+        metrics = []
+        for mid, ts, val in batch.entries:
+            d = dict(descriptors[mid])
+            del d['mid']
+            d['timestamp'] = ts
+            d['val'] = val
+            metrics.append(d)
+        return metrics
+
+    def resolve_rollups(self, batch):
+        """method that returns the batch rollups as dicts holding the metric name alongside the rollup"""
+        descriptors = self.descriptors.get(batch.probeid)
+        if descriptors is None:
+            raise CatascopiaSerializationException('no descriptors received from probe ' + batch.probeid)
+        rollups = []
+        for mid, r in batch.rollups or ():
+            d = dict(r)
+            d['name'] = descriptors[mid]['name']
+            d['group'] = descriptors[mid]['group']
+            rollups.append(d)
+        return rollups
+
+
+class BatchSerializer(metaclass = abc.ABCMeta):
+
+    @abc.abstractmethod
+    def encode(self, batch):
+        """method that encodes a MetricBatch to bytes"""
+        pass
+
+    @abc.abstractmethod
+    def decode(self, data):
+        """method that decodes bytes produced by encode() back to a MetricBatch"""
+        pass
+
+
+class JSONLinesSerializer(BatchSerializer):
+    """one JSON document per batch terminated by a newline"""
+
+    def encode(self, batch):
+        d = batch.to_dict()
+        try:
+            return json.dumps(d, separators = (',', ':'), allow_nan = False).encode('utf-8') + b'\n'
+        except ValueError:
+            # NaN and infinities (e.g. the bounds of unbounded metrics) are not JSON, sent as null
+            return json.dumps(json_safe(d), separators = (',', ':'), allow_nan = False).encode('utf-8') + b'\n'
+
+    def decode(self, data):
+        try:
+            return MetricBatch.from_dict(json.loads(data))
+        except (ValueError, KeyError, TypeError) as e:
+            raise CatascopiaSerializationException('invalid JSON batch: ' + str(e))
+
+
+class MsgpackSerializer(BatchSerializer):
+    """msgpack encoded batch, uses the msgpack package if installed otherwise a pure python encoder"""
+
+    def encode(self, batch):
+        if msgpack is not None:
+            return msgpack.packb(batch.to_dict(), use_bin_type = True)
+        out = bytearray()
+        _mp_pack(batch.to_dict(), out)
+        return bytes(out)
+
+    def decode(self, data):
+        try:
+            if msgpack is not None:
+                d = msgpack.unpackb(data, raw = False)
+            else:
+                d, _ = _mp_unpack(memoryview(data), 0)
+            return MetricBatch.from_dict(d)
+        except Exception as e:
+            raise CatascopiaSerializationException('invalid msgpack batch: ' + str(e))
+
+
+class StructSerializer(BatchSerializer):
+    """fixed layout binary batch for numeric metric values (None is packed as NaN), values of any other type
+       (e.g. histogram dicts or strings) go to a JSON side section along with their position in the batch
+
+       header: magic(2s) version(B) probeid(16s) timestamp(d) probe_len(H) descriptors_len(I) rollups_len(I)
+       extras_len(I) count(I), followed by the probe name, the JSON encoded descriptors, rollups and extras
+       (if any) and count entries of mid(I) timestamp(d) val(d)
+    """
+
+    MAGIC = b'\xca\x7a'
+    VERSION = 4
+    _HEADER = struct.Struct('<2sB16sdHIIII')
+    _ENTRY = struct.Struct('<Idd')
+
+    def encode(self, batch):
+        probe = batch.probe.encode('utf-8')
+        descriptors = b'' if batch.descriptors is None else json.dumps(batch.descriptors).encode('utf-8')
+        rollups = b'' if batch.rollups is None else json.dumps(batch.rollups).encode('utf-8')
+        nan = float('nan')
+        flat = []
+        # [position, mid, timestamp, val] of the non numeric values
+        extras = []
+        for pos, (mid, ts, val) in enumerate(batch.entries):
+            if val is not None and not isinstance(val, (int, float)):
+                extras.append([pos, mid, ts, val])
+                continue
+            flat.append(mid)
+            flat.append(nan if ts is None else ts)
+            flat.append(nan if val is None else val)
+        try:
+            extras = json.dumps(extras).encode('utf-8') if extras else b''
+            entries = struct.pack('<' + 'Idd' * (len(flat) // 3), *flat)
+        except (struct.error, TypeError, ValueError) as e:
+            raise CatascopiaSerializationException('StructSerializer cannot encode batch: ' + str(e))
+        return b''.join((StructSerializer._HEADER.pack(StructSerializer.MAGIC, StructSerializer.VERSION,
+                                                       UUID(batch.probeid).bytes, batch.timestamp, len(probe),
+                                                       len(descriptors), len(rollups), len(extras), len(flat) // 3),
+                         probe, descriptors, rollups, extras, entries))
+
+    def decode(self, data):
+        try:
+            header = StructSerializer._HEADER
+            magic, version, probeid, timestamp, plen, dlen, rlen, xlen, count = header.unpack_from(data, 0)
+            if magic != StructSerializer.MAGIC or version != StructSerializer.VERSION:
+                raise CatascopiaSerializationException('not a struct packed batch')
+            offset = header.size
+            probe = bytes(data[offset:offset + plen]).decode('utf-8')
+            offset += plen
+            descriptors = json.loads(bytes(data[offset:offset + dlen])) if dlen else None
+            offset += dlen
+            rollups = json.loads(bytes(data[offset:offset + rlen])) if rlen else None
+            offset += rlen
+            extras = json.loads(bytes(data[offset:offset + xlen])) if xlen else ()
+            offset += xlen
+            entries = []
+            end = offset + count * StructSerializer._ENTRY.size
+            for mid, ts, val in StructSerializer._ENTRY.iter_unpack(data[offset:end]):
+                entries.append((mid, None if math.isnan(ts) else ts, None if math.isnan(val) else val))
+            if len(entries) != count:
+                raise CatascopiaSerializationException('truncated struct packed batch')
+            # positions are ascending, inserting in order restores the original sequence
+            for pos, mid, ts, val in extras:
+                entries.insert(pos, (mid, ts, val))
+            return MetricBatch(UUID(bytes = probeid), probe, timestamp, entries, descriptors, rollups)
+        except (struct.error, ValueError) as e:
+            raise CatascopiaSerializationException('invalid struct packed batch: ' + str(e))
+
+
+def decode_batch(data):
+    """helper that decodes a batch produced by any of the serializers, detecting the format from its first bytes"""
+    if isinstance(data, MetricBatch):
+        return data
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    if data[:2] == StructSerializer.MAGIC:
+        return StructSerializer().decode(data)
+    if data[:1] == b'{':
+        return JSONLinesSerializer().decode(data)
+    return MsgpackSerializer().decode(data)
+
+
+def json_safe(obj):
+    """helper that returns obj with every NaN or infinite float inside dicts, lists and tuples replaced by None"""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: json_safe(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [json_safe(v) for v in obj]
+    return obj
+
+
+class CatascopiaSerializationException(Exception):
+    pass
+
+
+def _mp_pack(obj, out):
+    if obj is None:
+        out.append(0xc0)
+    elif obj is True:
+        out.append(0xc3)
+    elif obj is False:
+        out.append(0xc2)
+    elif isinstance(obj, int):
+        if 0 <= obj < 0x80:
+            out.append(obj)
+        elif -0x20 <= obj < 0:
+            out.append(obj & 0xff)
+        elif -(1 << 63) <= obj < (1 << 63):
+            out += struct.pack('>Bq', 0xd3, obj)
+        elif 0 <= obj < (1 << 64):
+            out += struct.pack('>BQ', 0xcf, obj)
+        else:
+            raise CatascopiaSerializationException('integer ' + str(obj) + ' out of msgpack range')
+    elif isinstance(obj, float):
+        out += struct.pack('>Bd', 0xcb, obj)
+    elif isinstance(obj, str):
+        b = obj.encode('utf-8')
+        n = len(b)
+        if n < 32:
+            out.append(0xa0 | n)
+        elif n < 0x100:
+            out += struct.pack('>BB', 0xd9, n)
+        elif n < 0x10000:
+            out += struct.pack('>BH', 0xda, n)
+        else:
+            out += struct.pack('>BI', 0xdb, n)
+        out += b
+    elif isinstance(obj, (bytes, bytearray)):
+        n = len(obj)
+        if n < 0x100:
+            out += struct.pack('>BB', 0xc4, n)
+        elif n < 0x10000:
+            out += struct.pack('>BH', 0xc5, n)
+        else:
+            out += struct.pack('>BI', 0xc6, n)
+        out += obj
+    elif isinstance(obj, (list, tuple)):
+        n = len(obj)
+        if n < 16:
+            out.append(0x90 | n)
+        elif n < 0x10000:
+            out += struct.pack('>BH', 0xdc, n)
+        else:
+            out += struct.pack('>BI', 0xdd, n)
+        for o in obj:
+            _mp_pack(o, out)
+    elif isinstance(obj, dict):
+        n = len(obj)
+        if n < 16:
+            out.append(0x80 | n)
+        elif n < 0x10000:
+            out += struct.pack('>BH', 0xde, n)
+        else:
+            out += struct.pack('>BI', 0xdf, n)
+        for k, v in obj.items():
+            _mp_pack(k, out)
+            _mp_pack(v, out)
+    else:
+        raise CatascopiaSerializationException('type ' + str(type(obj)) + ' not supported by msgpack encoder')
+
+
+_MP_FIXED = {0xcc: '>B', 0xcd: '>H', 0xce: '>I', 0xcf: '>Q',
+             0xd0: '>b', 0xd1: '>h', 0xd2: '>i', 0xd3: '>q',
+             0xca: '>f', 0xcb: '>d'}
+_MP_LEN = {0xd9: '>B', 0xda: '>H', 0xdb: '>I', 0xc4: '>B', 0xc5: '>H', 0xc6: '>I',
+           0xdc: '>H', 0xdd: '>I', 0xde: '>H', 0xdf: '>I'}
+
+
+def _mp_unpack(data, offset):
+    b = data[offset]
+    offset += 1
+    if b < 0x80:
+        return b, offset
+    if b >= 0xe0:
+        return b - 0x100, offset
+    if b == 0xc0:
+        return None, offset
+    if b == 0xc2:
+        return False, offset
+    if b == 0xc3:
+        return True, offset
+    if b in _MP_FIXED:
+        fmt = _MP_FIXED[b]
+        return struct.unpack_from(fmt, data, offset)[0], offset + struct.calcsize(fmt)
+    if 0xa0 <= b < 0xc0:
+        n, kind = b & 0x1f, 'str'
+    elif 0x90 <= b < 0xa0:
+        n, kind = b & 0x0f, 'array'
+    elif 0x80 <= b < 0x90:
+        n, kind = b & 0x0f, 'map'
+    elif b in _MP_LEN:
+        fmt = _MP_LEN[b]
+        n = struct.unpack_from(fmt, data, offset)[0]
+        offset += struct.calcsize(fmt)
+        kind = 'str' if b in (0xd9, 0xda, 0xdb) else 'bin' if b in (0xc4, 0xc5, 0xc6) \
+            else 'array' if b in (0xdc, 0xdd) else 'map'
+    else:
+        raise CatascopiaSerializationException('msgpack type ' + hex(b) + ' not supported')
+    if kind == 'str':
+        return bytes(data[offset:offset + n]).decode('utf-8'), offset + n
+    if kind == 'bin':
+        return bytes(data[offset:offset + n]), offset + n
+    if kind == 'array':
+        arr = []
+        for _ in range(n):
+            o, offset = _mp_unpack(data, offset)
+            arr.append(o)
+        return arr, offset
+    d = dict()
+    for _ in range(n):
+        k, offset = _mp_unpack(data, offset)
+        v, offset = _mp_unpack(data, offset)
+        d[k] = v
+    return d, offset
@@ -0,0 +1,340 @@
+import abc
+import time
+from collections import deque
+from queue import Empty
+from threading import Condition, Lock
+
+
+class OverflowPolicy:
+    """policies applied when a RingBufferChannel is full
+       DROP_OLDEST: evict the oldest item to make room for the new one
+       DROP_NEWEST: discard the new item
+       SAMPLE: admit one in every sample_every new items (evicting the oldest), discard the rest
+       BLOCK: wait up to the channel deadline for room, then discard the new item
+    """
+    typeNum = 4
+    DROP_OLDEST, DROP_NEWEST, SAMPLE, BLOCK = range(4)
+    _typeStrings = { 0 : 'DROP_OLDEST',
+                     1 : 'DROP_NEWEST',
+                     2 : 'SAMPLE',
+                     3 : 'BLOCK'
+                    }
+
+    @staticmethod
+    def contains(t):
+        return t in range(OverflowPolicy.typeNum)
+
+    @staticmethod
+    def type_as_string(t):
+        return OverflowPolicy._typeStrings.get(t)
+
+
+class Channel(metaclass = abc.ABCMeta):
+    """Probe to consumer channel that handles overflow itself, put() never raises queue.Full"""
+
+    @abc.abstractmethod
+    def put(self, item, block = True, timeout = None):
+        """method that pushes an item, returns False if the item got dropped"""
+        pass
+
+    @abc.abstractmethod
+    def qsize(self):
+        pass
+
+    @abc.abstractmethod
+    def get_stats(self):
+        """method that returns put/drop counters and the high-water mark"""
+        pass
+
+
+class RingBufferChannel(Channel):
+    """Bounded channel between any number of Probes and their consumer, a put() never raises and never waits
+       longer than the configured deadline. Producers serialize on a lock held for the capacity check, the
+       overflow policy and the counters, consumers pop without it (deque popleft is atomic) and only take it
+       to wait for an item or wake a blocked producer.
+       Offers the subset of the queue.Queue API consumers use: put, get, get_nowait, qsize, empty, full
+    """
+
+    def __init__(self, capacity = 100000, policy = OverflowPolicy.DROP_OLDEST, deadline = 0.1, sample_every = 10):
+        if capacity <= 0:
+            raise CatascopiaChannelException('RingBufferChannel capacity must be positive')
+        if not OverflowPolicy.contains(policy):
+            raise CatascopiaChannelException('RingBufferChannel invalid overflow policy')
+        self.capacity = capacity
+        self.policy = policy
+        # max seconds a put() waits for room with the BLOCK policy
+        self.deadline = deadline
+        self.sample_every = sample_every
+        self._buf = deque()
+        self._lock = Lock()
+        self._not_empty = Condition(self._lock)
+        self._not_full = Condition(self._lock)
+        # waiting consumers/producers, read without the lock to skip notify() when nobody waits
+        self._getters = 0
+        self._putters = 0
+        self._overflows = 0
+        self.puts = 0
+        self.drops = 0
+        self.high_water = 0
+
+    def get_capacity(self):
+        return self.capacity
+
+    def get_policy(self):
+        return self.policy
+
+    def put(self, item, block = True, timeout = None):
+        """method that pushes an item applying the overflow policy when full, returns False if the item got dropped
+           block/timeout are only considered by the BLOCK policy, timeout defaults to the channel deadline
+        """
+        buf = self._buf
+        with self._lock:
+            self.puts += 1
+            if len(buf) >= self.capacity:
+                policy = self.policy
+                if policy == OverflowPolicy.DROP_NEWEST:
+                    self.drops += 1
+                    return False
+                elif policy == OverflowPolicy.SAMPLE:
+                    self._overflows += 1
+                    if self._overflows % self.sample_every:
+                        self.drops += 1
+                        return False
+                    self._evict()
+                elif policy == OverflowPolicy.BLOCK:
+                    if not self._wait_for_room(self.deadline if timeout is None else timeout, block):
+                        self.drops += 1
+                        return False
+                else:
+                    self._evict()
+            buf.append(item)
+            n = len(buf)
+            if n > self.high_water:
+                self.high_water = n
+            if self._getters:
+                self._not_empty.notify()
+        return True
+
+    def put_nowait(self, item):
+        return self.put(item, block = False)
+
+    def _evict(self):
+        # called with the lock held
+        try:
+            self._buf.popleft()
+            self.drops += 1
+        except IndexError:
+            # a consumer emptied the buffer meanwhile
+            pass
+
+    def _wait_for_room(self, timeout, block):
+        # called with the lock held, waiting releases it for the consumers
+        if not block or timeout <= 0:
+            return len(self._buf) < self.capacity
+        end = time.monotonic() + timeout
+        self._putters += 1
+        try:
+            while len(self._buf) >= self.capacity:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._not_full.wait(remaining)
+            return True
+        finally:
+            self._putters -= 1
+
+    def get(self, block = True, timeout = None):
+        """method that pops the oldest item, raises queue.Empty like queue.Queue.get()"""
+        buf = self._buf
+        try:
+            item = buf.popleft()
+        except IndexError:
+            if not block:
+                raise Empty
+            item = self._wait_for_item(timeout)
+        if self._putters:
+            with self._lock:
+                self._not_full.notify()
+        return item
+
+    def get_nowait(self):
+        return self.get(block = False)
+
+    def _wait_for_item(self, timeout):
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            # producers read _getters under the lock after appending, so registering before re-checking
+            # never misses an item
+            self._getters += 1
+            try:
+                while True:
+                    try:
+                        return self._buf.popleft()
+                    except IndexError:
+                        pass
+                    if end is None:
+                        self._not_empty.wait()
+                    else:
+                        remaining = end - time.monotonic()
+                        if remaining <= 0:
+                            raise Empty
+                        self._not_empty.wait(remaining)
+            finally:
+                self._getters -= 1
+
+    def drain(self, max_items = None):
+        """method that pops up to max_items items without blocking, returns them as a list"""
+        buf = self._buf
+        items = []
+        n = len(buf) if max_items is None else min(max_items, len(buf))
+        try:
+            for _ in range(n):
+                items.append(buf.popleft())
+        except IndexError:
+            pass
+        if items and self._putters:
+            with self._lock:
+                self._not_full.notify_all()
+        return items
+
+    def qsize(self):
+        return len(self._buf)
+
+    def empty(self):
+        return not self._buf
+
+    def full(self):
+        return len(self._buf) >= self.capacity
+
+    def get_stats(self):
+        return {'capacity': self.capacity,
+                'policy': OverflowPolicy.type_as_string(self.policy),
+                'size': len(self._buf),
+                'puts': self.puts,
+                'drops': self.drops,
+                'high_water': self.high_water}
+
+    def reset_stats(self):
+        with self._lock:
+            self.puts = 0
+            self.drops = 0
+            self.high_water = len(self._buf)
+
+
+class AsyncQueueChannel(Channel):
+    """asyncio.Queue backed channel, probes push from any thread and consumers await get() or iterate
+       with async for. The channel binds to the given loop, else the running loop of the caller, else the
+       loop of the first get(), items pushed before that are kept until then. A full channel drops the oldest item
+    """
+
+    def __init__(self, loop = None, capacity = 10000):
+        # imported here, asyncio is a large import for the probes that never use this channel
+        import asyncio
+        if loop is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+        self._loop = loop
+        self.capacity = capacity
+        # created lazily on the loop, asyncio.Queue binds to the loop it is first used from
+        self._queue = None
+        # items pushed before a loop got bound
+        self._pending = deque()
+        self._lock = Lock()
+        self.puts = 0
+        self.drops = 0
+        self.high_water = 0
+
+    def get_loop(self):
+        return self._loop
+
+    def put(self, item, block = True, timeout = None):
+        import asyncio
+        self.puts += 1
+        loop = self._loop
+        if loop is None:
+            with self._lock:
+                loop = self._loop
+                if loop is None:
+                    if len(self._pending) >= self.capacity:
+                        self._pending.popleft()
+                        self.drops += 1
+                    self._pending.append(item)
+                    return True
+        try:
+            in_loop = asyncio.get_running_loop() is loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self._put_nowait(item)
+        else:
+            try:
+                loop.call_soon_threadsafe(self._put_nowait, item)
+            except RuntimeError:
+                # loop closed
+                self.drops += 1
+                return False
+        return True
+
+    def _bind(self):
+        """method that binds the channel to the running loop, called from the loop on the first get()"""
+        import asyncio
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.get_running_loop()
+                pending = self._pending
+                self._pending = deque()
+                for item in pending:
+                    self._put_nowait(item)
+
+    def _put_nowait(self, item):
+        queue = self._get_queue()
+        if queue.full():
+            queue.get_nowait()
+            self.drops += 1
+        queue.put_nowait(item)
+        n = queue.qsize()
+        if n > self.high_water:
+            self.high_water = n
+
+    def _get_queue(self):
+        if self._queue is None:
+            import asyncio
+            self._queue = asyncio.Queue(maxsize = self.capacity)
+        return self._queue
+
+    async def get(self):
+        if self._loop is None:
+            self._bind()
+        return await self._get_queue().get()
+
+    def get_nowait(self):
+        """method that pops the oldest item, raises asyncio.QueueEmpty, to be called from the loop thread"""
+        if self._loop is None:
+            self._bind()
+        return self._get_queue().get_nowait()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+    def qsize(self):
+        return len(self._pending) + (0 if self._queue is None else self._queue.qsize())
+
+    def empty(self):
+        return self.qsize() == 0
+
+    def get_stats(self):
+        return {'capacity': self.capacity,
+                'policy': OverflowPolicy.type_as_string(OverflowPolicy.DROP_OLDEST),
+                'size': self.qsize(),
+                'puts': self.puts,
+                'drops': self.drops,
+                'high_water': self.high_water}
+
+
+class CatascopiaChannelException(Exception):
+    pass
@@ -1,48 +1,400 @@
 import os
 import json
+import atexit
+import inspect
+from random import randint, random
+from collections import deque
 from functools import wraps
-from time import time, sleep
-from random import randint
+from threading import Thread, Event, Lock
+from time import time, sleep, perf_counter
+
+from Catascopia.Batch import json_safe
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric, ConcurrentCounterMetric, ConcurrentHistogramMetric
+
+
+class MetricSink(object):
+    """Buffers decorator records in memory, a background writer appends them to a file in batches
+       whenever flush_size records are pending or every flush_interval seconds, and once more at exit.
+       Records are (name, desc, timestamp, val) tuples, formatted as Metric.to_dict() lines by the writer.
+       Records of a failed write are kept, within capacity, for the next flush to retry
+    """
+
+    def __init__(self, path = '.' + os.sep + 'time_decorated_metrics.jsonl', format = 'json', encoding = 'utf-8',
+                 flush_size = 1000, flush_interval = 1.0, capacity = 100000):
+        self.path = path
+        self.format = format
+        self.encoding = encoding
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        # bounded, the oldest records are dropped if the writer falls behind
+        self._buf = deque(maxlen = capacity)
+        # records of a failed write, written first by the next flush
+        self._retry = []
+        self.drops = 0
+        # callables returning extra lines to write on every flush, e.g. histogram snapshots
+        self._snapshots = []
+        self._wakeup = Event()
+        self._closed = False
+        self._write_lock = Lock()
+        self._writer = Thread(target = self._run, name = 'CatascopiaMetricSink', daemon = True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def record(self, name, desc, timestamp, val):
+        buf = self._buf
+        if len(buf) == buf.maxlen:
+            self.drops += 1
+        buf.append((name, desc, timestamp, val))
+        if len(buf) >= self.flush_size:
+            self._wakeup.set()
+
+    def add_snapshot(self, snapshot):
+        self._snapshots.append(snapshot)
+
+    def _format(self, d):
+        if self.format == 'json':
+            try:
+                return json.dumps(d, allow_nan = False)
+            except ValueError:
+                # strict JSON, NaN and infinities are written as null
+                return json.dumps(json_safe(d), allow_nan = False)
+        return str(d)
+
+    def flush(self):
+        """method that writes every pending record, safe to call from any thread"""
+        with self._write_lock:
+            buf = self._buf
+            records = self._retry
+            self._retry = []
+            for _ in range(len(buf)):
+                records.append(buf.popleft())
+            lines = []
+            for name, desc, ts, val in records:
+                lines.append(self._format({'name': name, 'units': 's', 'desc': desc, 'timestamp': ts, 'val': val,
+                                           'higherIsBetter': False, 'minVal': 0.0, 'maxVal': None,
+                                           'group': None}))
+            for snapshot in self._snapshots:
+                lines.extend(self._format(d) for d in snapshot())
+            if lines:
+                try:
+                    with open(self.path, mode = 'a', encoding = self.encoding) as file:
+                        file.write(os.linesep.join(lines) + os.linesep)
+                except OSError:
+                    # the oldest records go first if the retries outgrow the capacity
+                    over = len(records) - buf.maxlen
+                    if over > 0:
+                        self.drops += over
+                        records = records[over:]
+                    self._retry = records
+                    raise
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._wakeup.set()
+            self._writer.join()
+            try:
+                self.flush()
+            except OSError:
+                # nothing left to retry at exit
+                pass
+
+    def _run(self):
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._closed:
+                break
+            try:
+                self.flush()
+            except OSError:
+                # keep buffering, the next flush retries
+                pass
+
+
+class DecoratorProbe(Probe):
+    """In-process Probe holding the metrics fed by CatascopiaDecorators, attach a queue and activate it
+       (or hand it to a ProbeScheduler/AsyncProbeRunner) like any other probe
+    """
+
+    def __init__(self, name = "DecoratorProbe", periodicity = 10):
+        super(DecoratorProbe, self).__init__(name, periodicity)
+        self._lock = Lock()
+
+    def get_desc(self):
+        return "DecoratorProbe collects timings, call and error counts of decorated functions..."
+
+    def get_or_add_metric(self, name, factory):
+        """method that returns metric name, registering factory() under it on first use"""
+        m = self.get_metric(name)
+        if m is None:
+            with self._lock:
+                m = self.get_metric(name)
+                if m is None:
+                    m = factory()
+                    self.add_metric(m)
+        return m
+
+    def collect(self):
+        # decorated calls update concurrent metrics, merged by Metric.refresh() right before emission
+        pass
+
+
+class ErrorRateMetric(SimpleMetric):
+    """percentage of the calls since the previous emission that raised, derived from two counters"""
+
+    __slots__ = ('calls', 'errors', '_last_calls', '_last_errors')
+
+    def __init__(self, name, calls, errors, desc = 'an error rate metric'):
+        super(ErrorRateMetric, self).__init__(name, '%', desc, minVal = 0, maxVal = 100, higherIsBetter = False)
+        self.calls = calls
+        self.errors = errors
+        self._last_calls = 0
+        self._last_errors = 0
+
+    def refresh(self):
+        calls = self.calls.get_count()
+        errors = self.errors.get_count()
+        dc = calls - self._last_calls
+        self.set_val(100.0 * (errors - self._last_errors) / dc if dc else 0.0)
+        self._last_calls = calls
+        self._last_errors = errors
+
+
+def _instrument(f, enter, leave):
+    """wraps f whether it is a function, a coroutine function, a generator or an async generator function.
+       enter() runs on every call, leave(elapsed, failed) once the call, the awaited coroutine or the
+       (async) generator completes. For generators elapsed only counts the time spent inside f,
+       not the time the consumer holds the generator suspended
+    """
+    if inspect.isasyncgenfunction(f):
+        @wraps(f)
+        async def wrap(*args, **kw):
+            enter()
+            gen = f(*args, **kw)
+            elapsed, failed = 0.0, True
+            method, arg = gen.asend, None
+            try:
+                while True:
+                    ts = perf_counter()
+                    try:
+                        value = await method(arg)
+                    except StopAsyncIteration:
+                        failed = False
+                        return
+                    finally:
+                        elapsed += perf_counter() - ts
+                    try:
+                        arg = yield value
+                        method = gen.asend
+                    except GeneratorExit:
+                        failed = False
+                        await gen.aclose()
+                        raise
+                    except BaseException as e:
+                        method, arg = gen.athrow, e
+            finally:
+                leave(elapsed, failed)
+    elif inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def wrap(*args, **kw):
+            enter()
+            failed = True
+            ts = perf_counter()
+            try:
+                result = await f(*args, **kw)
+                failed = False
+                return result
+            finally:
+                leave(perf_counter() - ts, failed)
+    elif inspect.isgeneratorfunction(f):
+        @wraps(f)
+        def wrap(*args, **kw):
+            enter()
+            gen = f(*args, **kw)
+            elapsed, failed = 0.0, True
+            method, arg = gen.send, None
+            try:
+                while True:
+                    ts = perf_counter()
+                    try:
+                        value = method(arg)
+                    except StopIteration as e:
+                        failed = False
+                        return e.value
+                    finally:
+                        elapsed += perf_counter() - ts
+                    try:
+                        arg = yield value
+                        method = gen.send
+                    except GeneratorExit:
+                        failed = False
+                        gen.close()
+                        raise
+                    except BaseException as e:
+                        method, arg = gen.throw, e
+            finally:
+                leave(elapsed, failed)
+    else:
+        @wraps(f)
+        def wrap(*args, **kw):
+            enter()
+            failed = True
+            ts = perf_counter()
+            try:
+                result = f(*args, **kw)
+                failed = False
+                return result
+            finally:
+                leave(perf_counter() - ts, failed)
+    return wrap
+
+
+def _noop():
+    pass
+
+
+def _qualified_name(f):
+    """helper that returns <module>.<qualname> of f, functions of the same name in other classes or modules
+       get metrics of their own
+    """
+    return '%s.%s' % (getattr(f, '__module__', None), getattr(f, '__qualname__', f.__name__))
 
-from Catascopia.Metrics import Metric, SimpleMetric
 
 class CatascopiaDecorators:
 
+    _probe = None
+    _sink = None
+    _sample_rate = 1.0
+    _aggregate = False
+    _bounds = None
+    _lock = Lock()
+
+    @classmethod
+    def get_probe(cls):
+        """method that returns the DecoratorProbe fed by the decorators, created on first use"""
+        if cls._probe is None:
+            with cls._lock:
+                if cls._probe is None:
+                    cls._probe = DecoratorProbe()
+        return cls._probe
+
+    @classmethod
+    def configure(cls, path = None, format = 'json', flush_size = 1000, flush_interval = 1.0, sample_rate = 1.0,
+                  aggregate = False, bounds = None):
+        """method that additionally writes timeit records to a file sink: path and format ('json' or 'str'),
+           batch size and interval of the background writer, the fraction of calls timed and whether calls
+           are written as per function histograms (one line per function per flush) instead of one line per call.
+           bounds only applies to functions decorated afterwards
+        """
+        with cls._lock:
+            if cls._sink is not None:
+                cls._sink.close()
+            kw = {} if path is None else {'path': path}
+            cls._sink = MetricSink(format = format, flush_size = flush_size, flush_interval = flush_interval, **kw)
+            cls._sample_rate = sample_rate
+            cls._aggregate = aggregate
+            cls._bounds = bounds
+            if aggregate:
+                cls._sink.add_snapshot(cls._histogram_snapshot)
+        return cls._sink
+
+    @classmethod
+    def get_sink(cls):
+        return cls._sink
+
+    @classmethod
+    def flush(cls):
+        if cls._sink is not None:
+            cls._sink.flush()
+
     @classmethod
     def timeit(cls, f):
-        @wraps(f)
-        def wrap(*args, **kw):
-            ts = time()
-            result = f(*args, **kw)
-            te = time()
-            name, unit, desc = "time__%s" % (f.__name__), 's', 'Execution duration from %s' % (f.__name__)
-            simple_metric = SimpleMetric(name, unit, desc, minVal=0.0, higherIsBetter=False)
-            simple_metric.set_val(te - ts)
-            cls.__store(simple_metric)
-            return result
-        return wrap
-
-    @classmethod
-    def __store(cls, metric: Metric,
-                fpath='.'+os.sep + 'time_decorated_metrics.jsonl', fmode='a', encoding='utf-8', format='json'):
-        with open(fpath, mode=fmode, encoding=encoding) as file:
-            if format == 'json':
-                s = json.dumps(metric.to_dict()) + os.linesep
-            else:
-                s = str(metric) + os.linesep
-            file.write(s)
-
-
-@CatascopiaDecorators.timeit
+        """decorator feeding the execution duration of f into the time__<module.qualname> histogram of the
+           DecoratorProbe
+        """
+        fname = _qualified_name(f)
+        name, desc = "time__%s" % fname, 'Execution duration from %s' % fname
+        observe = cls.get_probe().get_or_add_metric(
+            name, lambda: ConcurrentHistogramMetric(name, 's', desc, bounds = cls._bounds)).observe
+
+        def leave(elapsed, failed):
+            if cls._sample_rate < 1.0 and random() >= cls._sample_rate:
+                return
+            observe(elapsed)
+            sink = cls._sink
+            if sink is not None and not cls._aggregate:
+                sink.record(name, desc, time(), elapsed)
+        return _instrument(f, _noop, leave)
+
+    @classmethod
+    def countit(cls, f):
+        """decorator counting the calls of f into the calls__<module.qualname> counter of the DecoratorProbe"""
+        fname = _qualified_name(f)
+        name, desc = "calls__%s" % fname, 'Number of calls to %s' % fname
+        shards = cls.get_probe().get_or_add_metric(name, lambda: ConcurrentCounterMetric(name, '#', desc))._shards
+        if not (inspect.iscoroutinefunction(f) or inspect.isgeneratorfunction(f) or inspect.isasyncgenfunction(f)):
+            # counting path of plain functions, a single shard update per call
+            @wraps(f)
+            def wrap(*args, **kw):
+                shards.cell()[0] += 1
+                return f(*args, **kw)
+            return wrap
+
+        def enter():
+            shards.cell()[0] += 1
+        return _instrument(f, enter, lambda elapsed, failed: None)
+
+    @classmethod
+    def errorrate(cls, f):
+        """decorator counting calls and raised exceptions of f into the calls__<module.qualname> and
+           errors__<module.qualname> counters and the error_rate__<module.qualname> metric (% of calls raising
+           since the previous emission) of the DecoratorProbe
+        """
+        probe = cls.get_probe()
+        fname = _qualified_name(f)
+        calls = probe.get_or_add_metric('calls__' + fname, lambda: ConcurrentCounterMetric(
+            'calls__' + fname, '#', 'Number of calls to %s' % fname))
+        errors = probe.get_or_add_metric('errors__' + fname, lambda: ConcurrentCounterMetric(
+            'errors__' + fname, '#', 'Number of calls to %s that raised' % fname))
+        probe.get_or_add_metric('error_rate__' + fname, lambda: ErrorRateMetric(
+            'error_rate__' + fname, calls, errors, 'Percentage of calls to %s that raised' % fname))
+        calls_shards = calls._shards
+        errors_shards = errors._shards
+
+        def enter():
+            calls_shards.cell()[0] += 1
+
+        def leave(elapsed, failed):
+            if failed:
+                errors_shards.cell()[0] += 1
+        return _instrument(f, enter, leave)
+
+    @classmethod
+    def _histogram_snapshot(cls):
+        snapshots = []
+        for h in list(cls.get_probe().get_metrics().values()):
+            if isinstance(h, ConcurrentHistogramMetric) and h.get_name().startswith('time__'):
+                d = h.to_dict()
+                d['val'] = h.get_histogram()
+                d['timestamp'] = time()
+                if d['val']['count']:
+                    snapshots.append(d)
+        return snapshots
+
+
 def intensive_workload_function():
     sleep(randint(1, 10))
 
 
 def main():
 
-    intensive_workload_function()
+    CatascopiaDecorators.timeit(intensive_workload_function)()
+    for m in CatascopiaDecorators.get_probe().get_metrics_as_list():
+        m.refresh()
+        print(m)
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,243 @@
+import logging
+import time
+from threading import Thread, Event, Lock
+
+from Catascopia.Metrics import Priority
+
+
+class ShedAction:
+    """load shedding steps of the OverheadGovernor, in the order they get applied"""
+    typeNum = 3
+    STRETCH, MUTE, AGGREGATE = range(3)
+    _typeStrings = { 0 : 'STRETCH',
+                     1 : 'MUTE',
+                     2 : 'AGGREGATE'
+                    }
+
+    @staticmethod
+    def contains(t):
+        return t in range(ShedAction.typeNum)
+
+    @staticmethod
+    def type_as_string(t):
+        return ShedAction._typeStrings.get(t)
+
+
+class OverheadGovernor(Thread):
+    """Keeps the monitoring overhead of the probes of a process within a budget, cpu_budget as a % of one core
+       (CPU time of the probe rounds, from their ProbeInstrumentation) and memory_budget as MB held by the
+       probes (items waiting in their queues, history arrays and store segments, see Probe.get_footprint()).
+       Every interval seconds it compares usage with the budget and when exceeded sheds one step of load,
+       LOW priority probes before NORMAL ones and the costliest probe first:
+         STRETCH   multiplies the stretch of the probe by stretch, up to max_stretch, on top of whatever
+                   periodicity the developer, a config reload or adaptive periodicity sets
+         MUTE      disables the LOW priority metrics of the probe
+         AGGREGATE switches the probe to aggregated emission (rollups every aggregation_interval)
+       HIGH priority probes are never touched. Once usage stays below hysteresis times the budget for calm
+       evaluations in a row, the last step applied is undone
+    """
+
+    def __init__(self, cpu_budget = 2.0, memory_budget = None, interval = 5.0, hysteresis = 0.7, calm = 3,
+                 stretch = 2.0, max_stretch = 8.0, aggregation_interval = None, debug = False):
+        super(OverheadGovernor, self).__init__(name = 'OverheadGovernor', daemon = True)
+        if cpu_budget is not None and cpu_budget <= 0:
+            raise CatascopiaGovernorException('OverheadGovernor cpu_budget must be positive')
+        if memory_budget is not None and memory_budget <= 0:
+            raise CatascopiaGovernorException('OverheadGovernor memory_budget must be positive')
+        if not 0 < hysteresis < 1 or stretch <= 1 or max_stretch < 1:
+            raise CatascopiaGovernorException('OverheadGovernor requires 0 < hysteresis < 1, stretch > 1 '
+                                              'and max_stretch >= 1')
+        self.cpu_budget = cpu_budget
+        self.memory_budget = memory_budget
+        self.interval = interval
+        self.hysteresis = hysteresis
+        self.calm = calm
+        self.stretch = stretch
+        self.max_stretch = max_stretch
+        # None aggregates over 10 periods of the probe
+        self.aggregation_interval = aggregation_interval
+        self._debug = debug
+        self.logger = logging.getLogger('Catascopia.Governor')
+        self.probes = []
+        # probe -> instrumentation cpu time at the last evaluation
+        self._cpu_seen = dict()
+        # applied steps as (action, probe, saved state), undone last in first out
+        self._actions = []
+        self._lock = Lock()
+        self._exit = Event()
+        self._last = None
+        self._calm = 0
+        self.cpu_usage = 0.0
+        self.memory_usage = 0.0
+        self.evaluations = 0
+        self.shed = 0
+        self.restored = 0
+        self.exhausted = 0
+
+    def add_probe(self, probe):
+        with self._lock:
+            if probe not in self.probes:
+                self.probes.append(probe)
+                self._cpu_seen[probe] = probe.get_instrumentation().cpu_time
+
+    def remove_probe(self, probe):
+        """method that stops governing probe, undoing the steps applied to it"""
+        with self._lock:
+            if probe not in self.probes:
+                return
+            self.probes.remove(probe)
+            for entry in reversed([a for a in self._actions if a[1] is probe]):
+                self._undo(entry)
+            self._actions = [a for a in self._actions if a[1] is not probe]
+            self._cpu_seen.pop(probe, None)
+
+    def get_probes(self):
+        return list(self.probes)
+
+    def run(self):
+        while not self._exit.wait(self.interval):
+            try:
+                self.evaluate()
+            except Exception as e:
+                # a probe misbehaving must not stop the governor
+                self.logger.exception('OverheadGovernor evaluation failed: %s', e)
+
+    def shutdown(self, restore = True):
+        """method that stops the governor, by default undoing every step applied"""
+        self._exit.set()
+        if self.is_alive():
+            self.join()
+        if restore:
+            with self._lock:
+                while self._actions:
+                    self._undo(self._actions.pop())
+
+    def evaluate(self):
+        """method that measures usage since the previous evaluation and sheds or restores one step,
+           returns the (action, probe) applied or undone, None otherwise. run() calls it every interval
+        """
+        with self._lock:
+            now = time.monotonic()
+            cpu = dict((p, p.get_instrumentation().cpu_time) for p in self.probes)
+            last, self._last = self._last, now
+            if last is None or now <= last:
+                self._cpu_seen.update(cpu)
+                return None
+            elapsed = now - last
+            # probe -> % of one core since the last evaluation
+            costs = dict((p, 100.0 * max(c - self._cpu_seen.get(p, c), 0.0) / elapsed) for p, c in cpu.items())
+            self._cpu_seen.update(cpu)
+            self.cpu_usage = sum(costs.values())
+            self.memory_usage = self._footprint()
+            self.evaluations += 1
+
+            if self._over(1.0):
+                self._calm = 0
+                step = self._shed(costs)
+                if step is None:
+                    self.exhausted += 1
+                    return None
+                self.shed += 1
+                self._log('shed', step)
+                return step[:2]
+            if not self._actions or self._over(self.hysteresis):
+                self._calm = 0
+                return None
+            self._calm += 1
+            if self._calm < self.calm:
+                return None
+            self._calm = 0
+            step = self._actions.pop()
+            self._undo(step)
+            self.restored += 1
+            self._log('restored', step)
+            return step[:2]
+
+    def _over(self, fraction):
+        if self.cpu_budget is not None and self.cpu_usage > fraction * self.cpu_budget:
+            return True
+        return self.memory_budget is not None and self.memory_usage > fraction * self.memory_budget
+
+    def _footprint(self):
+        """method that returns the MB held by the probes, counting a queue shared by several probes once"""
+        if self.memory_budget is None:
+            return 0.0
+        total = 0
+        # queue id -> largest estimate of the probes attached to it
+        queues = dict()
+        for probe in self.probes:
+            footprint = probe.get_footprint()
+            total += footprint['history'] + footprint['store']
+            key = id(probe.get_queue())
+            queues[key] = max(queues.get(key, 0), footprint['queue'])
+        return (total + sum(queues.values())) / float(1 << 20)
+
+    def _shed(self, costs):
+        for priority in (Priority.LOW, Priority.NORMAL):
+            ranked = sorted((p for p in self.probes if p.get_priority() == priority),
+                            key = lambda p: costs.get(p, 0.0), reverse = True)
+            for action in range(ShedAction.typeNum):
+                for probe in ranked:
+                    saved = self._apply(action, probe)
+                    if saved is not None:
+                        step = (action, probe, saved)
+                        self._actions.append(step)
+                        return step
+        return None
+
+    def _apply(self, action, probe):
+        """method that applies action to probe, returns the state to restore or None if not applicable"""
+        if action == ShedAction.STRETCH:
+            stretch = probe.get_stretch()
+            stretched = min(stretch * self.stretch, self.max_stretch)
+            if stretched <= stretch:
+                return None
+            probe.set_stretch(stretched)
+            return stretch
+        if action == ShedAction.MUTE:
+            names = [name for name, m in probe.get_metrics().items()
+                     if m.get_priority() == Priority.LOW and probe.is_metric_enabled(name)]
+            for name in names:
+                probe.disable_metric(name)
+            return names or None
+        if probe.get_aggregator() is not None:
+            return None
+        interval = self.aggregation_interval or 10 * probe.get_effective_periodicity()
+        return probe.set_aggregation(interval)
+
+    def _undo(self, step):
+        action, probe, saved = step
+        if action == ShedAction.STRETCH:
+            probe.set_stretch(saved)
+        elif action == ShedAction.MUTE:
+            for name in saved:
+                probe.enable_metric(name)
+        elif probe.get_aggregator() is saved:
+            # only if the aggregator is still the one the governor set
+            probe.clear_aggregation()
+
+    def _log(self, what, step):
+        action, probe, saved = step
+        msg = 'OverheadGovernor %s %s of probe %s (cpu %.2f%% of %s%%, memory %.1fMB of %sMB)' % \
+              (what, ShedAction.type_as_string(action), probe.get_name(), self.cpu_usage, self.cpu_budget,
+               self.memory_usage, self.memory_budget)
+        self.logger.info(msg)
+        if self._debug:
+            print(msg)
+
+    def get_stats(self):
+        """method that returns the usage measured at the last evaluation, the budgets and the steps applied"""
+        with self._lock:
+            return {'cpu_usage': self.cpu_usage,
+                    'cpu_budget': self.cpu_budget,
+                    'memory_usage': self.memory_usage,
+                    'memory_budget': self.memory_budget,
+                    'evaluations': self.evaluations,
+                    'shed': self.shed,
+                    'restored': self.restored,
+                    'exhausted': self.exhausted,
+                    'actions': [(ShedAction.type_as_string(a), p.get_name()) for a, p, s in self._actions]}
+
+
+class CatascopiaGovernorException(Exception):
+    pass
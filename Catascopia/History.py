@@ -0,0 +1,228 @@
+try:
+    import numpy as np
+except ImportError:
+    # the history is optional, probes work without NumPy as long as it is not enabled
+    np = None
+
+
+class MetricHistory(object):
+    """Fixed capacity ring buffer of (timestamp, value) samples of one metric, backed by two NumPy arrays.
+       Queries run vectorized over the samples in chronological order, assuming timestamps never go
+       backwards. Time bounds are inclusive wall-clock timestamps, None leaves the bound open
+    """
+
+    __slots__ = ('capacity', 'ts', 'vals', '_pos', 'count')
+
+    __REDUCERS = ('mean', 'min', 'max', 'sum', 'count', 'first', 'last')
+
+    def __init__(self, capacity = 3600):
+        if np is None:
+            raise CatascopiaHistoryException('MetricHistory requires NumPy, install it with pip install numpy')
+        if capacity <= 0:
+            raise CatascopiaHistoryException('MetricHistory capacity must be positive')
+        self.capacity = capacity
+        self.ts = np.empty(capacity, dtype = np.float64)
+        self.vals = np.empty(capacity, dtype = np.float64)
+        # index of the next sample to write
+        self._pos = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, ts, val):
+        pos = self._pos
+        self.ts[pos] = ts
+        self.vals[pos] = val
+        self._pos = (pos + 1) % self.capacity
+        if self.count < self.capacity:
+            self.count += 1
+
+    def extend(self, ts, vals):
+        """method that appends arrays of samples, keeping the newest capacity ones"""
+        ts = np.asarray(ts, dtype = np.float64)[-self.capacity:]
+        vals = np.asarray(vals, dtype = np.float64)[-self.capacity:]
+        n = len(ts)
+        first = min(n, self.capacity - self._pos)
+        self.ts[self._pos:self._pos + first] = ts[:first]
+        self.vals[self._pos:self._pos + first] = vals[:first]
+        self.ts[:n - first] = ts[first:]
+        self.vals[:n - first] = vals[first:]
+        self._pos = (self._pos + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
+
+    def clear(self):
+        self._pos = 0
+        self.count = 0
+
+    def samples(self):
+        """method that returns the (timestamps, values) arrays in chronological order"""
+        if self.count < self.capacity:
+            return self.ts[:self.count], self.vals[:self.count]
+        pos = self._pos
+        if pos == 0:
+            return self.ts, self.vals
+        return np.concatenate((self.ts[pos:], self.ts[:pos])), np.concatenate((self.vals[pos:], self.vals[:pos]))
+
+    def range(self, start = None, end = None):
+        """method that returns the (timestamps, values) arrays of the samples between start and end"""
+        ts, vals = self.samples()
+        lo = 0 if start is None else np.searchsorted(ts, start, 'left')
+        hi = len(ts) if end is None else np.searchsorted(ts, end, 'right')
+        return ts[lo:hi], vals[lo:hi]
+
+    def window(self, seconds, now = None):
+        """method that returns the samples of the last seconds, up to now or the newest sample"""
+        ts, vals = self.samples()
+        if not len(ts):
+            return ts, vals
+        end = ts[-1] if now is None else now
+        return self.range(end - seconds, end)
+
+    def last(self, n = 1):
+        ts, vals = self.samples()
+        return ts[-n:], vals[-n:]
+
+    def stats(self, start = None, end = None):
+        """method that returns count, min, max, mean and standard deviation of the samples in range"""
+        ts, vals = self.range(start, end)
+        if not len(vals):
+            return {'count': 0, 'min': None, 'max': None, 'mean': None, 'std': None}
+        return {'count': int(len(vals)),
+                'min': float(vals.min()),
+                'max': float(vals.max()),
+                'mean': float(vals.mean()),
+                'std': float(vals.std())}
+
+    def percentile(self, q, start = None, end = None):
+        """method that returns the q-th percentile(s) (0 <= q <= 100) of the samples in range, None if empty"""
+        ts, vals = self.range(start, end)
+        if not len(vals):
+            return None
+        return np.percentile(vals, q)
+
+    def derivative(self, start = None, end = None, counter = False):
+        """method that returns the (timestamps, per second rate) arrays between consecutive samples in range.
+           With counter set a decrease is taken as a counter reset, the rate then counts from zero
+        """
+        ts, vals = self.range(start, end)
+        if len(vals) < 2:
+            return ts[:0], vals[:0]
+        dv = np.diff(vals)
+        if counter:
+            dv = np.where(dv < 0, vals[1:], dv)
+        dt = np.diff(ts)
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            rate = np.where(dt > 0, dv / dt, 0.0)
+        return ts[1:], rate
+
+    def rate(self, start = None, end = None, counter = False):
+        """method that returns the average per second rate over the range, None with less than two samples"""
+        ts, vals = self.range(start, end)
+        if len(vals) < 2 or ts[-1] <= ts[0]:
+            return None
+        dv = np.diff(vals)
+        if counter:
+            dv = np.where(dv < 0, vals[1:], dv)
+        return float(dv.sum() / (ts[-1] - ts[0]))
+
+    def change(self, start = None, end = None):
+        """method that returns the % change between consecutive samples in range, as DiffMetric does"""
+        ts, vals = self.range(start, end)
+        if len(vals) < 2:
+            return ts[:0], vals[:0]
+        prev = vals[:-1]
+        with np.errstate(divide = 'ignore', invalid = 'ignore'):
+            pct = np.where(prev != 0, np.diff(vals) / prev * 100.0, 0.0)
+        return ts[1:], pct
+
+    def downsample(self, bucket, start = None, end = None, how = 'mean'):
+        """method that returns (bucket start timestamps, values) aggregating the samples in range into buckets
+           of bucket seconds with how: 'mean', 'min', 'max', 'sum', 'count', 'first' or 'last'.
+           Buckets are aligned to multiples of bucket, empty buckets are left out
+        """
+        if how not in MetricHistory.__REDUCERS:
+            raise CatascopiaHistoryException('MetricHistory unknown downsampling ' + str(how))
+        ts, vals = self.range(start, end)
+        if not len(vals):
+            return ts, vals
+        idx = np.floor(ts / bucket).astype(np.int64)
+        # samples are sorted, so every bucket is a contiguous run
+        starts = np.flatnonzero(np.concatenate(([True], idx[1:] != idx[:-1])))
+        ends = np.append(starts[1:], len(vals))
+        if how == 'mean':
+            out = np.add.reduceat(vals, starts) / (ends - starts)
+        elif how == 'sum':
+            out = np.add.reduceat(vals, starts)
+        elif how == 'min':
+            out = np.minimum.reduceat(vals, starts)
+        elif how == 'max':
+            out = np.maximum.reduceat(vals, starts)
+        elif how == 'count':
+            out = (ends - starts).astype(np.float64)
+        elif how == 'first':
+            out = vals[starts]
+        else:
+            out = vals[ends - 1]
+        return idx[starts] * float(bucket), out
+
+
+class HistoryStore(object):
+    """Per-probe history, a MetricHistory of the numeric values of every metric (or only the named ones)
+       of a MetricTable, fed once per round
+    """
+
+    def __init__(self, table, capacity = 3600, metrics = None):
+        if np is None:
+            raise CatascopiaHistoryException('HistoryStore requires NumPy, install it with pip install numpy')
+        self.table = table
+        self.capacity = capacity
+        self.metrics = None if metrics is None else set(metrics)
+        # mid -> MetricHistory
+        self.histories = dict()
+        # mid -> (timestamp, value) last recorded, a value not updated since is not recorded again
+        self._last = dict()
+
+    def record(self, entries, tick_ts = None):
+        """method that appends the (mid, timestamp, val) entries of a round, stamped with the wall-clock tick_ts
+           of the round if given, as metric timestamps may only have whole seconds (SimpleMetric)
+        """
+        histories = self.histories
+        last = self._last
+        names = self.metrics
+        for mid, ts, val in entries:
+            if ts is None or val is None or isinstance(val, bool) or not isinstance(val, (int, float)):
+                continue
+            if last.get(mid) == (ts, val):
+                continue
+            h = histories.get(mid)
+            if h is None:
+                if names is not None and self.table.get_descriptor(mid).name not in names:
+                    continue
+                h = histories[mid] = MetricHistory(self.capacity)
+            h.append(ts if tick_ts is None else tick_ts, val)
+            last[mid] = (ts, val)
+
+    def get(self, metric):
+        """method that returns the MetricHistory of a metric name or mid, None if nothing was recorded"""
+        if isinstance(metric, str):
+            for d in self.table.get_descriptors():
+                if d is not None and d.name == metric and d.mid in self.histories:
+                    return self.histories[d.mid]
+            return None
+        return self.histories.get(metric)
+
+    def forget(self, mid):
+        self.histories.pop(mid, None)
+        self._last.pop(mid, None)
+
+    def nbytes(self):
+        """method that returns the bytes of the preallocated arrays of every MetricHistory"""
+        return sum(h.ts.nbytes + h.vals.nbytes for h in self.histories.values())
+
+    def names(self):
+        return [self.table.get_descriptor(mid).name for mid in self.histories]
+
+
+class CatascopiaHistoryException(Exception):
+    pass
@@ -0,0 +1,249 @@
+import io
+import threading
+import time
+from bisect import bisect_left
+
+
+class DurationHistogram(object):
+    """fixed bucket histogram of durations in seconds, plus count, sum and max"""
+
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'max', 'last')
+
+    DEFAULT_BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                      2.5, 5.0, 10.0)
+
+    def __init__(self, bounds = None):
+        self.bounds = tuple(sorted(bounds)) if bounds else DurationHistogram.DEFAULT_BOUNDS
+        self.reset()
+
+    def reset(self):
+        # one count per bound plus one for +inf
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, val):
+        self.counts[bisect_left(self.bounds, val)] += 1
+        self.count += 1
+        self.sum += val
+        self.last = val
+        if val > self.max:
+            self.max = val
+
+    def mean(self):
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q):
+        """method that returns the upper bound of the bucket holding the q-th quantile (0 < q <= 1)"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for bound, n in zip(self.bounds, self.counts):
+            cumulative += n
+            if cumulative >= rank:
+                return bound
+        return self.max
+
+    def to_dict(self):
+        buckets = []
+        cumulative = 0
+        for bound, n in zip(self.bounds + (float('inf'),), self.counts):
+            cumulative += n
+            buckets.append([bound, cumulative])
+        return {'count': self.count, 'sum': self.sum, 'max': self.max, 'last': self.last, 'buckets': buckets}
+
+
+class ProbeInstrumentation(object):
+    """What monitoring costs, kept by every Probe: collect() duration histogram, CPU time of the rounds,
+       serialization time, queue put latency and depth, drops and errors. Updated from the collecting thread
+       only. With emission enabled the figures are registered as array-backed metrics of the probe (group
+       'catascopia') and emitted with every round through the same channel as the probe's own metrics
+    """
+
+    # name, units, desc of the emitted self metrics
+    METRICS = (('self_collect_time', 's', 'duration of the last collect()'),
+               ('self_collect_time_p99', 's', 'bucket bound of the 99th percentile collect() duration'),
+               ('self_cpu_time', 's', 'CPU time of the last round (collect and emit)'),
+               ('self_cpu_overhead', '%', 'CPU time of the rounds over wall-clock time since the first round'),
+               ('self_encode_time', 's', 'duration of the last batch serialization'),
+               ('self_put_latency', 's', 'duration of the last queue put'),
+               ('self_queue_depth', '#', 'items waiting in the attached queue'),
+               ('self_drops', '#', 'items dropped by the attached queue'),
+               ('self_errors', '#', 'failed data collection rounds'))
+
+    GROUP = 'catascopia'
+
+    def __init__(self):
+        # mid per METRICS entry once emission is enabled
+        self.mids = None
+        self.reset()
+
+    def reset(self):
+        self.collect = DurationHistogram()
+        self.encode = DurationHistogram()
+        self.put = DurationHistogram()
+        self.cpu_time = 0.0
+        self.cpu_last = 0.0
+        self.rounds = 0
+        self.errors = 0
+        self.queue_depth = 0
+        # estimated size of the last item pushed, see Probe.get_footprint()
+        self.item_bytes = 0
+        self.drops = 0
+        self.started = None
+
+    def observe_round(self, cpu):
+        if self.started is None:
+            # wall-clock time of the first round counts from its start
+            self.started = time.monotonic() - cpu
+        self.rounds += 1
+        self.cpu_time += cpu
+        self.cpu_last = cpu
+
+    def overhead(self):
+        """method that returns the CPU time of the rounds as a % of the wall-clock time since the first round"""
+        if self.started is None:
+            return 0.0
+        elapsed = time.monotonic() - self.started
+        return 100.0 * self.cpu_time / elapsed if elapsed > 0 else 0.0
+
+    def enable(self, table):
+        """method that registers the self metrics in table"""
+        if self.mids is None:
+            self.mids = [table.register(name, units, desc, 0, group = ProbeInstrumentation.GROUP)
+                         for name, units, desc in ProbeInstrumentation.METRICS]
+
+    def disable(self, table):
+        if self.mids is not None:
+            for mid in self.mids:
+                table.unregister(mid)
+            self.mids = None
+
+    def update(self, table, ts):
+        """method that sets the self metrics in table, values of the round in progress where known"""
+        mids = self.mids
+        if mids is None:
+            return
+        set_val = table.set_val
+        set_val(mids[0], self.collect.last, ts)
+        set_val(mids[1], self.collect.quantile(0.99), ts)
+        set_val(mids[2], self.cpu_last, ts)
+        set_val(mids[3], self.overhead(), ts)
+        set_val(mids[4], self.encode.last, ts)
+        set_val(mids[5], self.put.last, ts)
+        set_val(mids[6], self.queue_depth, ts)
+        set_val(mids[7], self.drops, ts)
+        set_val(mids[8], self.errors, ts)
+
+    def to_dict(self):
+        return {'rounds': self.rounds,
+                'errors': self.errors,
+                'collect': self.collect.to_dict(),
+                'collect_mean': self.collect.mean(),
+                'collect_p50': self.collect.quantile(0.5),
+                'collect_p99': self.collect.quantile(0.99),
+                'encode': self.encode.to_dict(),
+                'put': self.put.to_dict(),
+                'cpu_time': self.cpu_time,
+                'cpu_last': self.cpu_last,
+                'cpu_overhead': self.overhead(),
+                'queue_depth': self.queue_depth,
+                'drops': self.drops}
+
+
+class CollectProfiler(object):
+    """Sampling profiler hook around collect(), profiles one round in every `every` with cProfile and
+       accumulates the samples, so unsampled rounds only pay for a counter increment.
+       Safe to share among probes running on different ProbeScheduler workers: the profile of a round is
+       kept per thread and sampled rounds run one at a time (cProfile profiles a single thread at once),
+       a sampled round starting while another one is profiled is skipped
+    """
+
+    def __init__(self, every = 100):
+        if every <= 0:
+            raise CatascopiaInstrumentationException('CollectProfiler every must be positive')
+        self.every = every
+        self.rounds = 0
+        self.sampled = 0
+        self.skipped = 0
+        self._stats = None
+        # cProfile.Profile of the round profiled by each thread
+        self._local = threading.local()
+        # guards the profiling slot and the accumulated stats
+        self._lock = threading.Lock()
+        self._busy = False
+
+    def sample(self):
+        """method that returns True if the coming round is to be profiled, claiming the profiling slot"""
+        # unlocked, a lost increment under concurrent rounds only shifts the next sample
+        self.rounds += 1
+        if self.rounds % self.every != 1 and self.every != 1:
+            return False
+        with self._lock:
+            if self._busy:
+                self.skipped += 1
+                return False
+            self._busy = True
+        return True
+
+    def start(self, probe):
+        # imported on the first sampled round, most probes never get profiled
+        import cProfile
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active in the interpreter, e.g. a second CollectProfiler
+            profile = None
+        self._local.profile = profile
+
+    def stop(self, probe):
+        profile = getattr(self._local, 'profile', None)
+        self._local.profile = None
+        if profile is not None:
+            profile.disable()
+        with self._lock:
+            self._busy = False
+            if profile is None:
+                self.skipped += 1
+                return
+            self.sampled += 1
+            if self._stats is None:
+                import pstats
+                self._stats = pstats.Stats(profile)
+            else:
+                self._stats.add(profile)
+
+    def get_stats(self):
+        """method that returns the accumulated pstats.Stats, None before the first sampled round"""
+        return self._stats
+
+    def report(self, sort = 'cumulative', limit = 20):
+        """method that returns the top limit functions of the sampled rounds as text"""
+        with self._lock:
+            if self._stats is None:
+                return ''
+            out = io.StringIO()
+            self._stats.stream = out
+            self._stats.sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def dump(self, path):
+        """method that writes the accumulated samples for pstats, snakeviz or gprof2dot"""
+        with self._lock:
+            if self._stats is not None:
+                self._stats.dump_stats(path)
+
+    def reset(self):
+        with self._lock:
+            self.rounds = 0
+            self.sampled = 0
+            self.skipped = 0
+            self._stats = None
+
+
+class CatascopiaInstrumentationException(Exception):
+    pass
@@ -1,8 +1,28 @@
 import time
 import threading
+from array import array
+from bisect import bisect_left
+from functools import wraps
+from collections import namedtuple
+
+from Catascopia.Timers import TimerService
+
+
+class MetricDescriptor(namedtuple('MetricDescriptor',
+                                  ['mid', 'name', 'units', 'desc', 'minVal', 'maxVal', 'higherIsBetter', 'group'])):
+    """immutable static part of a metric, registered once per probe and referenced by its mid afterwards"""
+
+    __slots__ = ()
+
+    def to_dict(self):
+        return dict(self._asdict())
+
 
 class Metric(object):
 
+    __slots__ = ('name', 'units', 'desc', 'higherIsBetter', 'minVal', 'maxVal', 'group', 'val', 'timestamp', 'mid',
+                 'filter', 'priority')
+
     def __init__(self, name, units, desc, minVal = None, maxVal = None, higherIsBetter=True):
         self.name = name
         self.units = units
@@ -13,6 +33,12 @@ class Metric(object):
         self.group = None
         self.val = None
         self.timestamp = None
+        # metric id assigned when registered to a probe
+        self.mid = None
+        # EmissionFilter deciding whether the value is emitted each round, None emits every round
+        self.filter = None
+        # LOW priority metrics are the first muted by the OverheadGovernor when over budget
+        self.priority = Priority.NORMAL
 
     def get_name(self):
         return self.name
@@ -30,13 +56,13 @@ class Metric(object):
         return self.desc
 
     def set_desc(self, desc):
-        self.desc
+        self.desc = desc
 
     def get_timestamp(self):
         return self.timestamp
 
     def set_timestamp(self, timestamp):
-        self.timestamp
+        self.timestamp = timestamp
 
     def get_val(self):
         return self.val
@@ -68,6 +94,34 @@ class Metric(object):
     def set_maxval(self, maxVal):
         self.maxVal = maxVal
 
+    def get_mid(self):
+        return self.mid
+
+    def get_filter(self):
+        return self.filter
+
+    def set_filter(self, filter):
+        self.filter = filter
+
+    def get_priority(self):
+        return self.priority
+
+    def set_priority(self, priority):
+        if not Priority.contains(priority):
+            raise CatascopiaMetricValueException('Metric ' + self.name + ', attempted to set invalid priority')
+        self.priority = priority
+
+    def refresh(self):
+        """hook invoked by the probe right before emission, metrics accumulating values outside
+           collect() (e.g. from many threads) override it to publish them with set_val()
+        """
+        pass
+
+    def get_descriptor(self):
+        """method that returns the static part of the metric, changes made after registration are not re-sent"""
+        return MetricDescriptor(self.mid, self.name, self.units, self.desc, self.minVal, self.maxVal,
+                                self.higherIsBetter, self.group)
+
     def to_dict(self):
         d = dict()
         d['name'] = self.name
@@ -87,6 +141,8 @@ class Metric(object):
 
 class SimpleMetric(Metric):
 
+    __slots__ = ()
+
     def __init__(self, name, units, desc, minVal = float('-inf'), maxVal = float('inf'), higherIsBetter=True):
         super(SimpleMetric, self).__init__(name, units, desc, minVal, maxVal, higherIsBetter)
 
@@ -96,30 +152,40 @@ class SimpleMetric(Metric):
 
 
 class CounterMetric(SimpleMetric):
+
+    __slots__ = ('step', 'counter', 'reset', '_lock')
+
     def __init__(self, name, units, desc, minVal = 0, maxVal = float('inf'), higherIsBetter=True, step=1, reset=True):
         super(CounterMetric, self).__init__(name, units, desc, minVal, maxVal, higherIsBetter)
         self.step = step
         self.counter = minVal
         self.reset = reset
+        # increments may come from many threads, use ConcurrentCounterMetric for hot paths
+        self._lock = threading.Lock()
 
     def inc(self):
         self.inc_with_step(self.step)
 
     def inc_with_step(self, step):
         if isinstance(step, int):
-            self.counter += step
-            if self.counter > self.maxVal:
-                if self.reset:
-                    self.counter = self.minVal
-                else:
-                    raise CatascopiaMetricValueException('CounterMetric ' + self.name + ' counter max value overflow')
-            self.set_val(self.counter)
+            with self._lock:
+                self.counter += step
+                if self.counter > self.maxVal:
+                    if self.reset:
+                        self.counter = self.minVal
+                    else:
+                        raise CatascopiaMetricValueException('CounterMetric ' + self.name
+                                                             + ' counter max value overflow')
+                self.set_val(self.counter)
         else:
-            raise CatascopiaMetricValueException('CounterMetric ' + self.name + ' step ' + step + ' is not an integer')
+            raise CatascopiaMetricValueException('CounterMetric ' + self.name + ' step ' + str(step)
+                                                 + ' is not an integer')
 
 
 class DiffMetric(SimpleMetric):
 
+    __slots__ = ('prev', 'cur', 'diff')
+
     def __init__(self, name, units='%', desc='a diff metric', minVal = float('-inf'), maxVal = float('inf'), higherIsBetter=True):
         super(DiffMetric, self).__init__(name, units, desc, minVal, maxVal, higherIsBetter)
         self.prev = 0
@@ -142,64 +208,497 @@ class DiffMetric(SimpleMetric):
 #TODO add some exceptions
 class TimerMetric(SimpleMetric):
 
+    __slots__ = ('tstart', 'tval', 'timer', 'timer_status', '_lock')
+
     IDLE, STARTED, PAUSED, FINISHED = range(4)
 
     # maxVal is the max time the timer will wait each time before returning a value, default 24hours
-    # ensures timer not blocking forever
+    # ensures timer not blocking forever, enforced by the shared TimerService instead of a thread per timer
     def __init__(self, name, units='s', desc='a timer metric', minVal=0, maxVal=86400, higherIsBetter=False):
         super(TimerMetric, self).__init__(name, units, desc, minVal, maxVal, higherIsBetter)
-        self.tstart = 0;
+        self.tstart = 0
         self.tval = 0
+        # TimerHandle of the maxVal watchdog
         self.timer = None
         self.timer_status = TimerMetric.IDLE
+        # the watchdog ends the timer from the TimerService thread
+        self._lock = threading.Lock()
 
     def timer_start(self):
-        if self.timer_status == TimerMetric.IDLE or self.timer_status == TimerMetric.PAUSED:
-            self.timer = threading.Timer(0.0, self._waiting_clock_expire, [self.maxVal])
-            self.tstart = time.time()
-            self.timer.start()
-            self.timer_status = TimerMetric.STARTED
-            return True
-        return False
+        with self._lock:
+            if self.timer_status == TimerMetric.IDLE or self.timer_status == TimerMetric.PAUSED:
+                self.tstart = time.perf_counter()
+                self.timer = TimerService.get_default().schedule(self.maxVal, self._waiting_clock_expire)
+                self.timer_status = TimerMetric.STARTED
+                return True
+            return False
 
     def timer_pause(self):
-        if self.timer_status == TimerMetric.STARTED:
-            self.tval += time.time() - self.tstart
-            self.timer.cancel()
-            self.timer_status = TimerMetric.PAUSED
-            self.set_val(self.tval)
-            return True
-        return False
+        with self._lock:
+            if self.timer_status == TimerMetric.STARTED:
+                self.tval += time.perf_counter() - self.tstart
+                self._cancel_watchdog()
+                self.timer_status = TimerMetric.PAUSED
+                self.set_val(self.tval)
+                return True
+            return False
 
     def timer_end(self):
+        with self._lock:
+            return self._timer_end()
+
+    def _timer_end(self):
         if self.timer_status == TimerMetric.STARTED:
-            self.tval += time.time() - self.tstart
+            self.tval += time.perf_counter() - self.tstart
         if self.timer_status == TimerMetric.STARTED or self.timer_status == TimerMetric.PAUSED:
             self.set_val(self.tval)
-            if self.timer:
-                self.timer.cancel()
+            self._cancel_watchdog()
             self.timer_status = TimerMetric.FINISHED
-            print(self.val)
             return True
         return False
 
     def timer_reset(self):
-        self.timer_status = TimerMetric.IDLE
-        self.tval = 0
-        self.tstart = 0
-        if self.timer:
-            self.timer.cancel()
-        self.timer = None
-        return True
+        with self._lock:
+            self.timer_status = TimerMetric.IDLE
+            self.tval = 0
+            self.tstart = 0
+            self._cancel_watchdog()
+            return True
 
     def timer_reset_and_start(self):
         r = self.timer_reset()
         s = self.timer_start()
         return r and s
 
-    def _waiting_clock_expire(self, max_wait_time):
-        time.sleep(max_wait_time)
+    def _cancel_watchdog(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+    def _waiting_clock_expire(self):
+        with self._lock:
+            # only the watchdog of the current run may end the timer
+            if self.timer is not None and self.timer.fired:
+                self.timer = None
+                self._timer_end()
+
+    def __enter__(self):
+        self.timer_reset_and_start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
         self.timer_end()
+        return False
+
+    def timeit(self, f):
+        """decorator timing every call of f into this timer, e.g. @metric.timeit"""
+        @wraps(f)
+        def wrap(*args, **kw):
+            with self:
+                return f(*args, **kw)
+        return wrap
+
+
+class _Shards(object):
+    """per-thread accumulator cells, every thread only writes its own cell so updates need no lock,
+       readers merge the cells. Cells of finished threads are folded into a retired cell on merge
+    """
+
+    __slots__ = ('_local', '_cells', '_lock', '_size', 'retired')
+
+    def __init__(self, size):
+        self._local = threading.local()
+        # (thread, cell) pairs
+        self._cells = []
+        self._lock = threading.Lock()
+        self._size = size
+        self.retired = [0] * size
+
+    def cell(self):
+        try:
+            return self._local.cell
+        except AttributeError:
+            c = self._local.cell = [0] * self._size
+            with self._lock:
+                self._cells.append((threading.current_thread(), c))
+            return c
+
+    def merge(self):
+        """method that returns the element-wise sum of all cells"""
+        with self._lock:
+            alive = []
+            total = list(self.retired)
+            for t, c in self._cells:
+                if t.is_alive():
+                    alive.append((t, c))
+                    for i, v in enumerate(c):
+                        total[i] += v
+                else:
+                    for i, v in enumerate(c):
+                        self.retired[i] += v
+                        total[i] += v
+            self._cells = alive
+        return total
+
+
+class ConcurrentCounterMetric(SimpleMetric):
+    """counter for millions of inc() per second from many threads, increments go to per-thread shards
+       without locking nor timestamping, the probe merges them right before emission.
+       With delta=True the value reported is the increase since the previous emission
+    """
+
+    __slots__ = ('_shards', 'delta', '_last')
+
+    def __init__(self, name, units = '#', desc = 'a concurrent counter metric', minVal = 0, maxVal = float('inf'),
+                 higherIsBetter = True, delta = False):
+        super(ConcurrentCounterMetric, self).__init__(name, units, desc, minVal, maxVal, higherIsBetter)
+        self._shards = _Shards(1)
+        self.delta = delta
+        self._last = 0
+
+    def inc(self, n = 1):
+        self._shards.cell()[0] += n
+
+    def get_count(self):
+        return self._shards.merge()[0]
+
+    def refresh(self):
+        total = self._shards.merge()[0]
+        if self.delta:
+            self.set_val(total - self._last)
+            self._last = total
+        else:
+            self.set_val(total)
+
+
+class ConcurrentGaugeMetric(SimpleMetric):
+    """gauge updated from many threads, add()/sub() go to per-thread shards (e.g. requests in flight),
+       set() stores an absolute value that later add()/sub() calls move from
+    """
+
+    __slots__ = ('_shards', '_base', '_offset')
+
+    def __init__(self, name, units = '#', desc = 'a concurrent gauge metric', minVal = float('-inf'),
+                 maxVal = float('inf'), higherIsBetter = True):
+        super(ConcurrentGaugeMetric, self).__init__(name, units, desc, minVal, maxVal, higherIsBetter)
+        self._shards = _Shards(1)
+        self._base = 0
+        self._offset = 0
+
+    def add(self, n = 1):
+        self._shards.cell()[0] += n
+
+    def sub(self, n = 1):
+        self._shards.cell()[0] -= n
+
+    def set(self, val):
+        # add()/sub() racing with set() may be attributed to either side of it
+        self._offset = self._shards.merge()[0]
+        self._base = val
+
+    def get_gauge(self):
+        return self._base + self._shards.merge()[0] - self._offset
+
+    def refresh(self):
+        self.set_val(self.get_gauge())
+
+
+class ConcurrentHistogramMetric(SimpleMetric):
+    """histogram fed from many threads, observe() bumps a bucket of the calling thread's shard.
+       The emitted value is a dict with count, sum and cumulative bucket counts [[upper bound, count], ...]
+    """
+
+    __slots__ = ('bounds', '_shards')
+
+    # default bounds suited to durations in seconds
+    DEFAULT_BOUNDS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                      2.5, 5.0, 10.0)
+
+    def __init__(self, name, units = 's', desc = 'a concurrent histogram metric', bounds = None,
+                 minVal = float('-inf'), maxVal = float('inf'), higherIsBetter = False):
+        super(ConcurrentHistogramMetric, self).__init__(name, units, desc, minVal, maxVal, higherIsBetter)
+        self.bounds = tuple(sorted(bounds)) if bounds else ConcurrentHistogramMetric.DEFAULT_BOUNDS
+        # one count per bound, one for +inf, then the sum of observations
+        self._shards = _Shards(len(self.bounds) + 2)
+
+    def observe(self, val):
+        c = self._shards.cell()
+        c[bisect_left(self.bounds, val)] += 1
+        c[-1] += val
+
+    def get_histogram(self):
+        merged = self._shards.merge()
+        buckets = []
+        cumulative = 0
+        for bound, n in zip(self.bounds + (float('inf'),), merged[:-1]):
+            cumulative += n
+            buckets.append([bound, cumulative])
+        return {'count': cumulative, 'sum': merged[-1], 'buckets': buckets}
+
+    def refresh(self):
+        self.set_val(self.get_histogram())
+
+
+class EmissionFilter(object):
+    """Per metric emission filter, a value is emitted when it differs from the last emitted one by more than
+       deadband (absolute) or relative (fraction of the last emitted value), by any amount if neither is set
+       and on_change, and whenever heartbeat seconds passed since the last emission. A filter keeps the state
+       of a single metric
+    """
+
+    __slots__ = ('on_change', 'deadband', 'relative', 'heartbeat', 'last_val', 'last_emit', 'emitted', 'suppressed')
+
+    def __init__(self, on_change = True, deadband = None, relative = None, heartbeat = None):
+        self.on_change = on_change
+        self.deadband = deadband
+        self.relative = relative
+        # max seconds of silence, None never forces an emission
+        self.heartbeat = heartbeat
+        self.last_val = None
+        # monotonic time of the last emission, None until the first one
+        self.last_emit = None
+        self.emitted = 0
+        self.suppressed = 0
+
+    def copy(self):
+        """method that returns a filter with the same settings and a fresh state"""
+        return EmissionFilter(self.on_change, self.deadband, self.relative, self.heartbeat)
+
+    def passes(self, val, now):
+        """method that tells whether val is emitted at monotonic time now, updating the filter state"""
+        emit = self.last_emit is None or (self.heartbeat is not None and now - self.last_emit >= self.heartbeat)
+        if not emit:
+            last = self.last_val
+            if (self.deadband is not None or self.relative is not None) and isinstance(val, (int, float)) \
+                    and isinstance(last, (int, float)):
+                delta = abs(val - last)
+                emit = (self.deadband is not None and delta > self.deadband) or \
+                       (self.relative is not None and delta > self.relative * abs(last))
+            elif self.on_change:
+                emit = val != last
+            else:
+                emit = True
+        if emit:
+            self.last_val = val
+            self.last_emit = now
+            self.emitted += 1
+        else:
+            self.suppressed += 1
+        return emit
+
+    def reset(self):
+        self.last_val = None
+        self.last_emit = None
+
+
+class MutedFilter(EmissionFilter):
+    """filter of a disabled metric, suppresses every value"""
+
+    __slots__ = ()
+
+    def __init__(self):
+        super(MutedFilter, self).__init__(False)
+
+    def copy(self):
+        return MutedFilter()
+
+    def passes(self, val, now):
+        self.suppressed += 1
+        return False
+
+
+class MetricTable(object):
+    """Registry of metric descriptors plus array-backed value storage indexed by mid.
+       Metric objects registered via register_metric() keep their own value, values registered via
+       register() live in two arrays of doubles. With its descriptor and table slots an array-backed value
+       costs ~240 bytes against ~450 for a Metric object (memory case of benchmarks/suite.py)
+    """
+
+    __slots__ = ('descriptors', 'metrics', 'timestamps', 'vals', 'filters', 'version', '_free', '_lock')
+
+    def __init__(self):
+        self.descriptors = []
+        # Metric object per mid, None for array-backed values
+        self.metrics = []
+        # NaN timestamp marks a value never set
+        self.timestamps = array('d')
+        self.vals = array('d')
+        # EmissionFilter per array-backed mid, Metric objects hold their own
+        self.filters = []
+        # bumped on every registration so emitters know when to re-send descriptors
+        self.version = 0
+        # mids released by unregister(), reused by later registrations
+        self._free = []
+        # serializes registrations, emitters iterate the table without it
+        self._lock = threading.Lock()
+
+    def _allocate(self):
+        # called with the lock held
+        if self._free:
+            return self._free.pop()
+        self.descriptors.append(None)
+        self.timestamps.append(_NAN)
+        self.vals.append(_NAN)
+        self.filters.append(None)
+        # emitters iterate metrics, the slot gets published last once every column holds it
+        self.metrics.append(None)
+        return len(self.metrics) - 1
+
+    def register(self, name, units, desc, minVal = float('-inf'), maxVal = float('inf'), higherIsBetter = True,
+                 group = None):
+        """method that registers an array-backed numeric metric and returns its mid, safe from any thread"""
+        with self._lock:
+            mid = self._allocate()
+            self.descriptors[mid] = MetricDescriptor(mid, name, units, desc, minVal, maxVal, higherIsBetter, group)
+            self.version += 1
+        return mid
+
+    def register_metric(self, metric):
+        """method that registers a Metric object, assigns and returns its mid, safe from any thread"""
+        with self._lock:
+            mid = self._allocate()
+            metric.mid = mid
+            self.descriptors[mid] = metric.get_descriptor()
+            self.metrics[mid] = metric
+            self.version += 1
+        return mid
+
+    def unregister(self, mid):
+        """method that releases mid, its value is no longer emitted and the mid goes to the next registration"""
+        with self._lock:
+            m = self.metrics[mid]
+            if m is not None:
+                m.mid = None
+                self.metrics[mid] = None
+            # a released mid has no descriptor until reused, emitters re-send the descriptors without it
+            self.descriptors[mid] = None
+            self.timestamps[mid] = _NAN
+            self.vals[mid] = _NAN
+            self.filters[mid] = None
+            self._free.append(mid)
+            self.version += 1
+
+    def set_val(self, mid, val, timestamp = None):
+        self.vals[mid] = val
+        self.timestamps[mid] = time.time() if timestamp is None else timestamp
+
+    def get_val(self, mid):
+        m = self.metrics[mid]
+        if m is not None:
+            return m.val
+        return None if self.timestamps[mid] != self.timestamps[mid] else self.vals[mid]
+
+    def get_timestamp(self, mid):
+        m = self.metrics[mid]
+        if m is not None:
+            return m.timestamp
+        ts = self.timestamps[mid]
+        return None if ts != ts else ts
+
+    def get_descriptor(self, mid):
+        return self.descriptors[mid]
+
+    def get_descriptors(self):
+        """method that returns the descriptors indexed by mid, None for mids released by unregister()"""
+        return self.descriptors
+
+    def get_descriptor_dicts(self):
+        """method that returns the dicts of the registered descriptors, as sent along with batches"""
+        return [d.to_dict() for d in self.descriptors if d is not None]
+
+    def get_filter(self, mid):
+        m = self.metrics[mid]
+        return m.filter if m is not None else self.filters[mid]
+
+    def set_filter(self, mid, filter):
+        """method that sets the EmissionFilter of mid, None emits it every round"""
+        m = self.metrics[mid]
+        if m is not None:
+            m.filter = filter
+        else:
+            self.filters[mid] = filter
+
+    def fill_entries(self, entries):
+        """method that appends an (mid, timestamp, val) entry per metric holding a value to entries"""
+        timestamps = self.timestamps
+        vals = self.vals
+        for mid, m in enumerate(self.metrics):
+            if m is not None:
+                entries.append((mid, m.timestamp, m.val))
+            else:
+                ts = timestamps[mid]
+                # NaN != NaN, skips values never set
+                if ts == ts:
+                    entries.append((mid, ts, vals[mid]))
+        return entries
+
+    def fill_array_entries(self, entries, now = None):
+        """method that appends an (mid, timestamp, val) entry per array-backed value set, if now is given only
+           the values passing their EmissionFilter at monotonic time now
+        """
+        timestamps = self.timestamps
+        vals = self.vals
+        filters = self.filters
+        for mid, m in enumerate(self.metrics):
+            if m is None:
+                ts = timestamps[mid]
+                if ts == ts:
+                    f = filters[mid]
+                    val = vals[mid]
+                    if now is None or f is None or f.passes(val, now):
+                        entries.append((mid, ts, val))
+        return entries
+
+    def to_metric_dict(self, mid, timestamp, val):
+        """method that returns a value of mid shaped as Metric.to_dict()"""
+        d = self.descriptors[mid]
+        return {'name': d.name, 'units': d.units, 'desc': d.desc, 'timestamp': timestamp, 'val': val,
+                'higherIsBetter': d.higherIsBetter, 'minVal': d.minVal, 'maxVal': d.maxVal, 'group': d.group}
+
+    def fill_filtered_entries(self, entries, now):
+        """method like fill_entries() that skips the values held back by their EmissionFilter at monotonic time now"""
+        timestamps = self.timestamps
+        vals = self.vals
+        filters = self.filters
+        for mid, m in enumerate(self.metrics):
+            if m is not None:
+                f = m.filter
+                if f is None or f.passes(m.val, now):
+                    entries.append((mid, m.timestamp, m.val))
+            else:
+                ts = timestamps[mid]
+                if ts == ts:
+                    f = filters[mid]
+                    val = vals[mid]
+                    if f is None or f.passes(val, now):
+                        entries.append((mid, ts, val))
+        return entries
+
+    def __len__(self):
+        return len(self.descriptors)
+
+
+_NAN = float('nan')
+
+
+class Priority:
+    """priorities of probes and metrics, the OverheadGovernor sheds load from LOW first, then NORMAL,
+       and never touches HIGH
+    """
+    typeNum = 3
+    LOW, NORMAL, HIGH = range(3)
+    _typeStrings = { 0 : 'LOW',
+                     1 : 'NORMAL',
+                     2 : 'HIGH'
+                    }
+
+    @staticmethod
+    def contains(t):
+        return t in range(Priority.typeNum)
+
+    @staticmethod
+    def type_as_string(t):
+        return Priority._typeStrings.get(t)
 
 
 class CatascopiaMetricValueException(Exception):
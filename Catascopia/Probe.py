@@ -1,11 +1,20 @@
 import abc
+import sys
 import time
 import os
-import logging.handlers
+import logging
 from threading import Thread, Event
-from queue import Queue
+from queue import Full
 from uuid import uuid4
 
+from Catascopia.Batch import MetricBatch, CatascopiaSerializationException
+from Catascopia.Metrics import Metric, MetricTable, EmissionFilter, MutedFilter, Priority
+from Catascopia.Aggregation import Aggregator
+from Catascopia.Adaptive import AdaptivePeriodicity
+from Catascopia.SegmentStore import SegmentStore
+from Catascopia.Instrumentation import ProbeInstrumentation
+from Catascopia.Channel import Channel, RingBufferChannel, AsyncQueueChannel, OverflowPolicy
+
 
 class Probe(Thread, metaclass = abc.ABCMeta):
 
@@ -33,10 +42,60 @@ class Probe(Thread, metaclass = abc.ABCMeta):
         if self.logging:
             self.set_logging()
         self.metrics = dict()
+        # disabled metric name -> the filter it had before getting muted
+        self._disabled = dict()
+        # registry of metric descriptors, mids index into it
+        self.table = MetricTable()
+        # table version whose descriptors were last emitted
+        self._descriptors_sent = None
+        # metrics overriding Metric.refresh()
+        self._refreshable = []
         # queue to be attached by data consumer
         self.queue = None
+        # disk-backed store-and-forward buffer receiving the numeric values of every round
+        self.store = None
+        # table version whose descriptors were last persisted to the store
+        self._store_version = None
+        # items dropped and max size seen for queues other than a Channel
+        self._queue_drops = 0
+        self._queue_high_water = 0
+        # flag to push one MetricBatch per round instead of one str(metric) per metric
+        self.batching = False
+        # BatchSerializer encoding batches before pushed to the queue, if None the MetricBatch is pushed as is
+        self.serializer = None
+        # if set, samples are summarised and emitted as periodic rollups instead of raw values
+        self.aggregator = None
+        # EmissionFilter copied to metrics added without their own, None emits them every round
+        self._default_filter = None
+        # values pushed for consumption, suppressed ones are counted by the EmissionFilters
+        self._emitted = 0
+        # if set, the recent values of every numeric metric are kept in NumPy ring buffers
+        self.history = None
+        # if set, the periodicity follows the volatility of the collected values
+        self.adaptive = None
+        # periodicity set by the Probe Developer, restored when adaptive periodicity is cleared
+        self._base_periodicity = periodicity
+        # factor the OverheadGovernor stretches the period of the rounds by, on top of the periodicity
+        self.stretch = 1.0
+        # callables invoked with (probe, tick_ts) after every round emitted, e.g. an ExpositionServer
+        self._tick_listeners = []
+        # what the rounds of this probe cost, see get_self_stats()
+        self.instrumentation = ProbeInstrumentation()
+        # sampling profiler hook (e.g. CollectProfiler) wrapping collect(), None to disable
+        self.profiler = None
+        # LOW priority probes are the first slowed down by the OverheadGovernor when over budget
+        self.priority = Priority.NORMAL
         #consecutive error counter
         self.errors = 0
+        # scheduler owning the Probe, if None the Probe runs its own thread
+        self._scheduler = None
+        # what to do with deadlines missed because collect() overran the periodicity
+        self.overrun_policy = OverrunPolicy.SKIP
+        # flag to align deadlines to wall-clock multiples of the periodicity (same instants across hosts)
+        self.align = False
+        # monotonic deadline of the next data collection round, None until (re)activated
+        self._deadline = None
+        self.reset_timing_stats()
 
     def set_logging(self, path=None):
         """method that configures logging"""
@@ -55,9 +114,11 @@ class Probe(Thread, metaclass = abc.ABCMeta):
             self.logger = logging.getLogger(self.name)
             self.logger.setLevel(logging.INFO)
             # Add the log message handler to the logger
-            handler = logging.handlers.RotatingFileHandler(logfile,
-                                                           maxBytes=2 * 1024 * 1024,
-                                                           backupCount=5)
+            # imported here, most probes never log to a file
+            from logging.handlers import RotatingFileHandler
+            handler = RotatingFileHandler(logfile,
+                                          maxBytes=2 * 1024 * 1024,
+                                          backupCount=5)
             formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
             handler.setFormatter(formatter)
             self.logger.addHandler(handler)
@@ -69,27 +130,290 @@ class Probe(Thread, metaclass = abc.ABCMeta):
             if self._debug:
                 print('Probe ' + self.name + ' logging could not be initialized')
                 print(e)
-            raise CatascopiaProbeStatusException('Probe ' + self.name + ' logging could not be initialized'
-                                                 + 'error reported ' + e)
+            raise CatascopiaProbeStatusException('Probe ' + self.name + ' logging could not be initialized, '
+                                                 + 'error reported ' + str(e))
 
     # TODO support configurable log level e.g. info, debug, critical...
     def _writeToLog(self, msg):
         if self.logging:
             self.logger.info(msg)
 
-    def attachQueue(self, queue=None):
-        # if no queue is provided then a new one is created and returned
+    def attachQueue(self, queue=None, capacity=100000, policy=OverflowPolicy.DROP_OLDEST):
+        # if no queue is provided then a new RingBufferChannel is created and returned
         if queue is None:
-            self.queue = Queue(maxsize = 1000000) # maxsize should not be hardcoded
+            self.queue = RingBufferChannel(capacity, policy)
         else:
+            # a Channel or any object with a queue.Queue like put(item, timeout=), a full queue drops the item
             self.queue = queue
+        self._queue_drops = 0
+        self._queue_high_water = 0
+        # a new consumer needs the metric descriptors
+        self._descriptors_sent = None
         self._writeToLog('Queue attached to Probe')
         return self.queue
 
+    def attachAsyncQueue(self, loop = None, capacity = 10000):
+        """method that attaches and returns an AsyncQueueChannel, consumed with await get() or async for,
+           bound to the given loop, the running loop of the caller or else the loop of the first get()
+        """
+        return self.attachQueue(AsyncQueueChannel(loop, capacity))
+
     def dettachQueue(self):
         self.queue = None
         self._writeToLog('Queue detached from Probe')
 
+    def attachStore(self, store = None, path = None, **kwargs):
+        """method that appends the numeric values emitted every round to a SegmentStore, consumers catch up with
+           store.cursor(). If no store is provided one is created under path/store/<probe name>,
+           kwargs go to the SegmentStore (segment_records, max_bytes, max_age, sync_interval)
+        """
+        if store is None:
+            folder = Probe.__DEFAULT_LOGGING_PATH if path is None else path
+            store = SegmentStore(folder + os.sep + 'store' + os.sep + self.name, **kwargs)
+        self.store = store
+        self._store_version = None
+        self._writeToLog('Store attached to Probe')
+        return self.store
+
+    def dettachStore(self):
+        store = self.store
+        self.store = None
+        if store is not None:
+            store.close()
+        self._writeToLog('Store detached from Probe')
+
+    def get_store(self):
+        return self.store
+
+    def _store(self, entries):
+        store = self.store
+        if self._store_version != self.table.version:
+            self._store_version = self.table.version
+            store.set_descriptors(self.table.get_descriptor_dicts())
+        store.append_entries(entries)
+
+    def get_instrumentation(self):
+        return self.instrumentation
+
+    def get_self_stats(self):
+        """method that returns what the probe costs: collect() duration histogram, CPU time of the rounds and
+           its share of wall-clock time, serialization time, queue put latency, queue depth, drops and errors
+        """
+        stats = self.instrumentation.to_dict()
+        stats['timing'] = self.get_timing_stats()
+        if self.profiler is not None:
+            stats['profiled_rounds'] = self.profiler.sampled
+        return stats
+
+    def set_self_metrics(self, enabled = True):
+        """method that emits the self metrics (group 'catascopia', see ProbeInstrumentation.METRICS) with every
+           round, through the same queue as the probe's own metrics
+        """
+        if enabled:
+            self.instrumentation.enable(self.table)
+        else:
+            self.instrumentation.disable(self.table)
+
+    def get_profiler(self):
+        return self.profiler
+
+    def set_profiler(self, profiler):
+        """method that wraps the sampled collect() rounds with profiler.start(probe)/stop(probe),
+           profiler.sample() picks the rounds, e.g. CollectProfiler(every = 100). None disables it
+        """
+        self.profiler = profiler
+
+    def get_queue(self):
+        return self.queue
+
+    def get_footprint(self):
+        """method that returns estimates in bytes of the memory held by the probe: the items waiting in its queue
+           (shared with the other probes attached to the same queue), the history arrays and the store segments
+        """
+        stats = self.instrumentation
+        return {'queue': stats.queue_depth * stats.item_bytes if self.queue is not None else 0,
+                'history': self.history.nbytes() if self.history is not None else 0,
+                'store': self.store.get_stats()['bytes'] if self.store is not None else 0}
+
+    def get_queue_stats(self):
+        """method that returns drop counters and high-water mark of the attached queue"""
+        if self.queue is None:
+            return None
+        if isinstance(self.queue, Channel):
+            return self.queue.get_stats()
+        return {'size': _qsize(self.queue),
+                'drops': self._queue_drops,
+                'high_water': self._queue_high_water}
+
+    def _push(self, item):
+        """method that pushes an item to the attached queue, a full queue never raises nor stalls the probe"""
+        queue = self.queue
+        if queue is None:
+            return False
+        stats = self.instrumentation
+        start = time.perf_counter()
+        if isinstance(queue, Channel):
+            ok = queue.put(item)
+        else:
+            try:
+                # a full queue drops the item rather than stall the round, once per metric on the legacy path
+                queue.put_nowait(item)
+                ok = True
+            except Full:
+                self._queue_drops += 1
+                ok = False
+        stats.put.observe(time.perf_counter() - start)
+        stats.item_bytes = _item_size(item)
+        n = _qsize(queue)
+        stats.queue_depth = n
+        if not ok:
+            stats.drops += 1
+        elif n > self._queue_high_water:
+            self._queue_high_water = n
+        return ok
+
+    def get_batching(self):
+        return self.batching
+
+    def set_batching(self, batching, serializer = None):
+        """method that switches emission to a single MetricBatch per data collection round,
+           optionally encoded by a BatchSerializer (JSONLinesSerializer, MsgpackSerializer, StructSerializer)
+        """
+        self.batching = batching
+        self.serializer = serializer if batching else None
+
+    def get_serializer(self):
+        return self.serializer
+
+    def get_aggregator(self):
+        return self.aggregator
+
+    def set_aggregation(self, interval, window = None, slices = 10, alpha = 0.01, max_bins = 512,
+                        quantiles = (0.5, 0.9, 0.99)):
+        """method that switches emission to rollups (count, min, max, mean, variance, quantiles and mergeable
+           sketch per numeric metric) every interval seconds, over a tumbling window or the last window seconds.
+           Rollups are always emitted as MetricBatch.rollups, encoded by the serializer if one is set
+        """
+        self.aggregator = Aggregator(interval, window, slices, alpha, max_bins, quantiles)
+        return self.aggregator
+
+    def clear_aggregation(self):
+        self.aggregator = None
+
+    def set_emission_filter(self, on_change = True, deadband = None, relative = None, heartbeat = None,
+                            metrics = None):
+        """method that only emits values differing from the last emitted one (on_change), by more than deadband
+           (absolute) or relative (fraction of it), and at least every heartbeat seconds. Applies to the named
+           metrics, or if metrics is None to every metric of the probe including the ones added later through
+           add_metric(). Use Metric.set_filter() or MetricTable.set_filter() to configure metrics one by one
+        """
+        f = EmissionFilter(on_change, deadband, relative, heartbeat)
+        if metrics is None:
+            self._default_filter = f
+            for mid in range(len(self.table)):
+                self._set_filter(mid, f.copy())
+        else:
+            for name in metrics:
+                m = self.metrics.get(name)
+                if m is None:
+                    raise CatascopiaProbeStatusException('Probe ' + self.name + ', no metric named ' + str(name))
+                self._set_filter(m.mid, f.copy())
+
+    def clear_emission_filters(self):
+        self._default_filter = None
+        for mid in range(len(self.table)):
+            self._set_filter(mid, None)
+
+    def _set_filter(self, mid, filter):
+        d = self.table.get_descriptor(mid)
+        if d is None:
+            # released mid, its filter is reset once reused
+            return
+        # a disabled metric stays muted, it gets the new filter back once enabled
+        name = d.name
+        if name in self._disabled and isinstance(self.table.get_filter(mid), MutedFilter):
+            self._disabled[name] = filter
+        else:
+            self.table.set_filter(mid, filter)
+
+    def disable_metric(self, name):
+        """method that stops emitting a metric without removing it, its value is still collected and refreshed
+           on enable_metric(). Disabled metrics count as suppressed in get_emission_stats()
+        """
+        m = self.metrics.get(name)
+        if m is None:
+            raise CatascopiaProbeStatusException('Probe ' + self.name + ', no metric named ' + str(name))
+        if name not in self._disabled:
+            self._disabled[name] = m.filter
+            m.set_filter(MutedFilter())
+            if m in self._refreshable:
+                self._refreshable.remove(m)
+
+    def enable_metric(self, name):
+        """method that resumes emitting a metric disabled by disable_metric()"""
+        m = self.metrics.get(name)
+        if name not in self._disabled or m is None:
+            return
+        m.set_filter(self._disabled.pop(name))
+        if type(m).refresh is not Metric.refresh:
+            self._refreshable.append(m)
+
+    def is_metric_enabled(self, name):
+        return name not in self._disabled
+
+    def get_disabled_metrics(self):
+        return list(self._disabled)
+
+    def get_emission_stats(self):
+        """method that returns the number of values emitted and suppressed by emission filters, overall and per
+           filtered metric, the suppression ratio is the fraction of the values held back
+        """
+        suppressed = 0
+        per_metric = dict()
+        for mid in range(len(self.table)):
+            f = self.table.get_filter(mid)
+            if f is not None:
+                suppressed += f.suppressed
+                per_metric[self.table.get_descriptor(mid).name] = {'emitted': f.emitted, 'suppressed': f.suppressed}
+        total = self._emitted + suppressed
+        return {'emitted': self._emitted,
+                'suppressed': suppressed,
+                'suppression_ratio': suppressed / total if total else 0.0,
+                'metrics': per_metric}
+
+    def get_history(self):
+        return self.history
+
+    def set_history(self, capacity = 3600, metrics = None):
+        """method that keeps the last capacity values of every numeric metric (or of the named ones) in a
+           HistoryStore for range, downsampling, rate and percentile queries, requires NumPy
+        """
+        # imported on first use, NumPy is a large import most probes never need
+        from Catascopia.History import HistoryStore
+        self.history = HistoryStore(self.table, capacity, metrics)
+        return self.history
+
+    def clear_history(self):
+        self.history = None
+
+    def get_adaptive(self):
+        return self.adaptive
+
+    def set_adaptive(self, min_period, max_period, threshold = 0.1, confidence = 3.0, alpha = 0.3, grow = 1.5,
+                     shrink = 0.25, metrics = None):
+        """method that lets the periodicity float between min_period and max_period, shrinking it by shrink when a
+           metric changes by more than threshold (relative) and by more than confidence times its usual change,
+           growing it by grow after every stable round. metrics restricts the metric names considered
+        """
+        self.adaptive = AdaptivePeriodicity(min_period, max_period, threshold, confidence, alpha, grow, shrink,
+                                            metrics = metrics)
+        self.periodicity = self.adaptive.clamp(self.periodicity)
+        return self.adaptive
+
+    def clear_adaptive(self):
+        self.adaptive = None
+        self.periodicity = self._base_periodicity
+
     @abc.abstractmethod
     def get_desc(self):
         """method that returns Probe desc as provided by Probe Developer"""
@@ -111,9 +435,66 @@ class Probe(Thread, metaclass = abc.ABCMeta):
     def get_periodicity(self):
         return self.periodicity
 
+    def get_stretch(self):
+        return self.stretch
+
+    def set_stretch(self, stretch):
+        """method that stretches the period of the rounds by stretch (1 to undo), whatever sets the periodicity"""
+        if stretch < 1:
+            raise CatascopiaProbeStatusException('Probe ' + self.name + ', stretch must be at least 1')
+        self.stretch = stretch
+
+    def get_effective_periodicity(self):
+        """method that returns the period the rounds actually run at, the periodicity times the stretch"""
+        return self.periodicity * self.stretch
+
+    def get_priority(self):
+        return self.priority
+
+    def set_priority(self, priority):
+        if not Priority.contains(priority):
+            raise CatascopiaProbeStatusException('Probe ' + self.name + ', attempted to set invalid priority')
+        self.priority = priority
+
     def set_periodicity(self, periodicity):
         # periodicity set in seconds
         self.periodicity = periodicity
+        self._base_periodicity = periodicity
+        if self.adaptive is not None:
+            self.periodicity = self.adaptive.clamp(periodicity)
+
+    def get_overrun_policy(self):
+        return self.overrun_policy
+
+    def set_overrun_policy(self, policy):
+        if OverrunPolicy.contains(policy):
+            self.overrun_policy = policy
+        else:
+            raise CatascopiaProbeStatusException('Probe ' + self.name + ', attempted to set invalid overrun policy')
+
+    def get_alignment(self):
+        return self.align
+
+    def set_alignment(self, align):
+        # takes effect on next activation
+        self.align = align
+
+    def get_timing_stats(self):
+        """method that returns data collection timing stats, lateness in seconds"""
+        return {'ticks': self._ticks,
+                'missed_ticks': self._missed_ticks,
+                'late_ticks': self._late_ticks,
+                'lateness_last': self._lateness_last,
+                'lateness_max': self._lateness_max,
+                'lateness_avg': self._lateness_sum / self._ticks if self._ticks else 0.0}
+
+    def reset_timing_stats(self):
+        self._ticks = 0
+        self._missed_ticks = 0
+        self._late_ticks = 0
+        self._lateness_last = 0.0
+        self._lateness_max = 0.0
+        self._lateness_sum = 0.0
 
     def get_probestatus(self):
         """method that returns probe status... INACTIVE, ACTIVE, TERM
@@ -128,7 +509,40 @@ class Probe(Thread, metaclass = abc.ABCMeta):
 
     def add_metric(self, metric):
         metric.set_group(self.name) # make this optional?
+        if metric.filter is None and self._default_filter is not None:
+            metric.set_filter(self._default_filter.copy())
+        self.table.register_metric(metric)
         self.metrics[metric.get_name()] = metric
+        if type(metric).refresh is not Metric.refresh:
+            self._refreshable.append(metric)
+
+    def remove_metric(self, name):
+        """method that removes a metric from the probe, returns it or None if not found"""
+        metric = self.metrics.pop(name, None)
+        if metric is not None:
+            if name in self._disabled:
+                metric.set_filter(self._disabled.pop(name))
+            if self.adaptive is not None:
+                self.adaptive.forget(metric.mid)
+            if self.history is not None:
+                self.history.forget(metric.mid)
+            if self.aggregator is not None:
+                self.aggregator.forget(metric.mid)
+            self.table.unregister(metric.mid)
+            if metric in self._refreshable:
+                self._refreshable.remove(metric)
+        return metric
+
+    def get_metric_table(self):
+        """method that returns the MetricTable, use its register()/set_val() for large numbers of numeric metrics"""
+        return self.table
+
+    def get_descriptors(self):
+        return self.table.get_descriptors()
+
+    def resend_descriptors(self):
+        """method that forces descriptors into the next emitted batch"""
+        self._descriptors_sent = None
 
     def get_metric(self, name):
         return self.metrics.get(name)
@@ -145,16 +559,24 @@ class Probe(Thread, metaclass = abc.ABCMeta):
     def set_debugmode(self, debug):
         self._debug = True
 
+    def get_scheduler(self):
+        return self._scheduler
+
     def activate(self):
         """method to ACTIVATE data collection"""
         if self.get_probestatus() == ProbeStatus.INACTIVE:
-            # only want to start the thread once
-            if self._first:
-                self.start()
-                self._first = False
-            # thread you can now 'unpause'
-            self._activateEvent.set()
+            # restart the deadline grid, inactive periods do not count as missed ticks
+            self._deadline = None
+            if self._scheduler is None:
+                # only want to start the thread once
+                if self._first:
+                    self.start()
+                    self._first = False
+                # thread you can now 'unpause'
+                self._activateEvent.set()
             self.probestatus = ProbeStatus.ACTIVE
+            if self._scheduler is not None:
+                self._scheduler.notify(self)
             if self._debug:
                 print('Probe ' + self.name + ' Data collection ACTIVATED')
             self._writeToLog('Data collection ACTIVATED')
@@ -172,9 +594,11 @@ class Probe(Thread, metaclass = abc.ABCMeta):
 
     def terminate(self):
         """method to TERM Probe"""
-        if not self._activateEvent.isSet():
+        if not self._activateEvent.is_set():
             self._activateEvent.set()
         self.probestatus = ProbeStatus.TERM
+        if self._scheduler is not None:
+            self._scheduler.notify(self)
         if self._debug:
             print('Probe ' + self.name + ' Data collection TERMINATED')
         self._writeToLog('Data collection TERMINATED')
@@ -186,38 +610,243 @@ class Probe(Thread, metaclass = abc.ABCMeta):
         # loop until Probe termination is requested
         while (self.probestatus != ProbeStatus.TERM):
             # if probe ACTIVE collect data
-            if self.probestatus == ProbeStatus.ACTIVE and self._activateEvent.isSet():
-                try:
-                    self.collect()
-                    for m in self.metrics.values():
-                        # if probe has queue attached then push for consumption
-                        if self.queue:
-                            self.queue.put(str(m), timeout = 1) #timeout should not be hardcoded
-                        if self._debug:
-                            print(m)
-                except (TypeError, AttributeError) as e:
-                    s = 'CRITICAL data collection FAILED with error: ' + str(e)
-                    if self._debug:
-                        print('Probe ' + self.name + ', ' + s)
-                    self._writeToLog(s)
-                    self.errors += 1
-                    if self.errors > Probe.__MAX_CONSECUTIVE_ERRORS:
-                        self._writeToLog('TERMINATING due to too many ERRORS')
-                        self.terminate()
-                    else:
-                        time.sleep(self.period * self.errors)
-                self.errors = 0
-                time.sleep(self.periodicity)
+            if self.probestatus == ProbeStatus.ACTIVE and self._activateEvent.is_set():
+                delay = self._next_deadline() - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                    # status may have changed while sleeping
+                    continue
+                self._tick()
             else:
                 # if INACTIVE wait until activated
                 self._activateEvent.wait()
         # clean up before termination
         self.cleanUp()
 
+    def _next_deadline(self):
+        """method that returns the monotonic deadline of the next data collection round"""
+        if self._deadline is None:
+            self._deadline = time.monotonic()
+            if self.align:
+                self._deadline += -time.time() % (self.periodicity * self.stretch)
+        return self._deadline
+
+    def _tick(self):
+        """method that runs a single data collection round, shared by run() and the ProbeScheduler
+           returns the monotonic deadline of the next round
+        """
+        tick_ts = self._tick_started()
+        cpu = time.thread_time()
+        try:
+            self._collect_timed()
+            self._emit(tick_ts)
+            self._notify_tick(tick_ts)
+            self._adapt()
+            self.errors = 0
+        except (TypeError, AttributeError, CatascopiaSerializationException) as e:
+            # a round whose values cannot be encoded fails like a collect() error, the probe keeps running
+            self._tick_failed(e)
+        self.instrumentation.observe_round(time.thread_time() - cpu)
+        # back off proportionally to the consecutive errors
+        return self._advance_deadline(time.monotonic(), max(self.errors, 1))
+
+    def _collect_timed(self):
+        """method that runs collect(), timed and wrapped by the profiler hook on sampled rounds"""
+        profiler = self.profiler
+        start = time.perf_counter()
+        if profiler is not None and profiler.sample():
+            profiler.start(self)
+            try:
+                self.collect()
+            finally:
+                profiler.stop(self)
+        else:
+            self.collect()
+        self.instrumentation.collect.observe(time.perf_counter() - start)
+
+    def add_tick_listener(self, listener):
+        """method that registers listener(probe, tick_ts), invoked from the collecting thread after every round"""
+        if listener not in self._tick_listeners:
+            # copy on write, rounds iterate the list without a lock
+            self._tick_listeners = self._tick_listeners + [listener]
+
+    def remove_tick_listener(self, listener):
+        self._tick_listeners = [f for f in self._tick_listeners if f != listener]
+
+    def _notify_tick(self, tick_ts):
+        for listener in self._tick_listeners:
+            try:
+                listener(self, tick_ts)
+            except Exception as e:
+                # a failing consumer must not count as a failed data collection round
+                self._writeToLog('tick listener FAILED with error: ' + str(e))
+                if self._debug:
+                    print('Probe ' + self.name + ', tick listener FAILED with error: ' + str(e))
+
+    def _adapt(self):
+        """method that sets the periodicity of the next round according to the adaptive controller, if any"""
+        if self.adaptive is not None:
+            period = self.adaptive.update(self.table, self.periodicity)
+            if period != self.periodicity:
+                if self._debug:
+                    print('Probe ' + self.name + ', periodicity adapted to ' + str(period) + 's')
+                self.periodicity = period
+
+    def _tick_started(self):
+        """method that updates the timing stats at the start of a round, returns the round wall-clock timestamp"""
+        start = time.monotonic()
+        lateness = max(start - self._next_deadline(), 0.0)
+        self._ticks += 1
+        self._lateness_last = lateness
+        self._lateness_sum += lateness
+        if lateness > self._lateness_max:
+            self._lateness_max = lateness
+        if lateness >= self.periodicity * self.stretch:
+            self._late_ticks += 1
+        return time.time()
+
+    def _tick_failed(self, e):
+        s = 'CRITICAL data collection FAILED with error: ' + str(e)
+        if self._debug:
+            print('Probe ' + self.name + ', ' + s)
+        self._writeToLog(s)
+        self.errors += 1
+        self.instrumentation.errors += 1
+        if self.errors > Probe.__MAX_CONSECUTIVE_ERRORS:
+            self._writeToLog('TERMINATING due to too many ERRORS')
+            self.terminate()
+
+    def _advance_deadline(self, now, backoff = 1):
+        """method that moves the deadline along the grid deadline + k*periodicity,
+           deadlines already passed are handled according to the overrun policy
+        """
+        base = self._deadline
+        if base is None:
+            # activate() restarted the grid while collecting, e.g. after a deactivate() from collect()
+            return self._next_deadline()
+        period = self.periodicity * self.stretch * backoff
+        deadline = base + period
+        if deadline <= now and backoff == 1:
+            # number of grid deadlines that passed while collecting
+            passed = int((now - base) // period)
+            if self.overrun_policy == OverrunPolicy.SKIP:
+                # wait for the first deadline still ahead
+                self._missed_ticks += passed
+                deadline = base + (passed + 1) * period
+            elif self.overrun_policy == OverrunPolicy.COALESCE:
+                # a single immediate round stands in for every passed deadline
+                self._missed_ticks += passed - 1
+                deadline = base + passed * period
+            # CATCHUP keeps the next grid deadline, rounds run back to back until caught up
+        elif deadline <= now:
+            # when backing off from errors never run rounds back to back
+            passed = int((now - base) // period)
+            deadline = base + (passed + 1) * period
+        self._deadline = deadline
+        return deadline
+
+    def _emit(self, tick_ts):
+        """method that pushes the metrics collected in a round for consumption"""
+        for m in self._refreshable:
+            m.refresh()
+        if self.instrumentation.mids is not None:
+            self.instrumentation.update(self.table, tick_ts)
+        if self.history is not None:
+            self.history.record(self.table.fill_entries([]), tick_ts)
+        if self.aggregator is not None:
+            self._emit_rollups(tick_ts)
+        elif self.batching:
+            version = self.table.version
+            batch = self.get_batch(tick_ts, self._descriptors_sent != version, filtered = True)
+            self._descriptors_sent = version
+            self._emitted += len(batch.entries)
+            if self.store is not None:
+                self._store(batch.entries)
+            # if probe has queue attached then push for consumption
+            if self.queue is not None:
+                self._push(self._encode(batch))
+            if self._debug:
+                print(batch)
+        else:
+            now = time.monotonic()
+            stored = [] if self.store is not None else None
+            # metrics may get added while emitting (e.g. functions decorated at runtime)
+            for m in tuple(self.metrics.values()):
+                f = m.filter
+                if f is not None and not f.passes(m.val, now):
+                    continue
+                self._emitted += 1
+                if stored is not None:
+                    stored.append((m.mid, m.timestamp, m.val))
+                # if probe has queue attached then push for consumption
+                if self.queue is not None:
+                    self._push(str(m))
+                if self._debug:
+                    print(m)
+            # values registered with table.register() (and the self metrics), pushed shaped as Metric.to_dict()
+            table = self.table
+            for mid, ts, val in table.fill_array_entries([], now):
+                self._emitted += 1
+                if stored is not None:
+                    stored.append((mid, ts, val))
+                if self.queue is not None or self._debug:
+                    d = table.to_metric_dict(mid, ts, val)
+                    if self.queue is not None:
+                        self._push(str(d))
+                    if self._debug:
+                        print(d)
+            if stored:
+                self._store(stored)
+
+    def _emit_rollups(self, tick_ts):
+        aggregator = self.aggregator
+        now = time.monotonic()
+        entries = self.table.fill_entries([])
+        if self._disabled:
+            muted = set(self.metrics[name].mid for name in self._disabled)
+            entries = [e for e in entries if e[0] not in muted]
+        # the store keeps the raw samples behind the rollups
+        if self.store is not None:
+            self._store(entries)
+        aggregator.add_entries(entries, now)
+        if not aggregator.due(now):
+            return
+        version = self.table.version
+        batch = MetricBatch(self.probeid, self.name, tick_ts, rollups = aggregator.rollup(now))
+        if self._descriptors_sent != version:
+            batch.descriptors = self.table.get_descriptor_dicts()
+            self._descriptors_sent = version
+        if self.queue is not None:
+            self._push(self._encode(batch))
+        if self._debug:
+            print(batch)
+
+    def _encode(self, batch):
+        """method that returns the batch encoded by the serializer if any, timing the serialization"""
+        if self.serializer is None:
+            return batch
+        start = time.perf_counter()
+        data = self.serializer.encode(batch)
+        self.instrumentation.encode.observe(time.perf_counter() - start)
+        return data
+
+    def get_batch(self, tick_ts = None, descriptors = False, filtered = False):
+        """method that returns the current metric values as a MetricBatch of (mid, timestamp, val) entries,
+           if filtered only the values passing their EmissionFilter (which updates the filter state)
+        """
+        batch = MetricBatch(self.probeid, self.name, time.time() if tick_ts is None else tick_ts)
+        if filtered:
+            self.table.fill_filtered_entries(batch.entries, time.monotonic())
+        else:
+            self.table.fill_entries(batch.entries)
+        if descriptors:
+            batch.descriptors = self.table.get_descriptor_dicts()
+        return batch
+
     def push_to_queue(self, metrics):
-        if self.queue:
+        if self.queue is not None:
             for m in metrics:
-                self.queue.put(str(m), timeout=1)
+                self._push(str(m))
 
 
     @abc.abstractmethod
@@ -231,6 +860,26 @@ class Probe(Thread, metaclass = abc.ABCMeta):
         pass
 
 
+def _qsize(queue):
+    """helper that returns the approximate size of a queue, 0 for queues that cannot tell (e.g. multiprocessing
+       queues on macOS)
+    """
+    try:
+        return queue.qsize()
+    except (AttributeError, NotImplementedError):
+        return 0
+
+
+def _item_size(item):
+    """helper that estimates the bytes held by an item pushed to the queue"""
+    if isinstance(item, (bytes, bytearray, str)):
+        return len(item)
+    if isinstance(item, MetricBatch):
+        # list slot, (mid, timestamp, val) tuple and two floats per entry
+        return sys.getsizeof(item) + 120 * len(item.entries)
+    return sys.getsizeof(item)
+
+
 class ProbeStatus:
     typeNum = 3
     INACTIVE, ACTIVE, TERM = range(3)
@@ -248,6 +897,28 @@ class ProbeStatus:
         return ProbeStatus._typeStrings.get(t)
 
 
+class OverrunPolicy:
+    """policies for deadlines missed because a data collection round took longer than the periodicity
+       SKIP: drop the missed rounds and wait for the next deadline still ahead
+       CATCHUP: run the missed rounds back to back until back on schedule
+       COALESCE: run one immediate round for all missed ones and then continue on schedule
+    """
+    typeNum = 3
+    SKIP, CATCHUP, COALESCE = range(3)
+    _typeStrings = { 0 : 'SKIP',
+                     1 : 'CATCHUP',
+                     2 : 'COALESCE'
+                    }
+
+    @staticmethod
+    def contains(t):
+        return t in range(OverrunPolicy.typeNum)
+
+    @staticmethod
+    def type_as_string(t):
+        return OverrunPolicy._typeStrings.get(t)
+
+
 class CatascopiaProbeStatusException(Exception):
     pass
 
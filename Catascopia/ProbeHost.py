@@ -0,0 +1,371 @@
+import importlib
+import logging
+import multiprocessing
+import time
+from queue import Full
+from threading import Thread, Lock, Event
+
+from Catascopia.Batch import BatchSerializer, StructSerializer, MsgpackSerializer, BatchDecoder, \
+    CatascopiaSerializationException
+from Catascopia.Channel import Channel, RingBufferChannel, OverflowPolicy
+from Catascopia.Probe import ProbeStatus, CatascopiaProbeStatusException
+from Catascopia.Scheduler import ProbeScheduler
+from Catascopia.SharedRing import SharedRing
+
+
+class ProbeHost(object):
+    """Runs groups of probes in worker processes, so CPU heavy collect() rounds do not hold the GIL of the
+       monitored application. Each worker runs its probes on a ProbeScheduler and ships every round as a
+       struct packed batch over its own SharedRing, a reader thread decodes them into the attached queue.
+       Probes are declared with add_probe() before start(), by class (importable from the worker) and
+       arguments, and controlled afterwards through the RemoteProbe proxies it returns
+    """
+
+    __DEFAULT_CAPACITY = 1 << 22
+
+    def __init__(self, name = 'ProbeHost', processes = 1, workers = None, capacity = None, start_method = 'spawn',
+                 poll_interval = 0.005, debug = False):
+        if processes <= 0:
+            raise CatascopiaProbeStatusException('ProbeHost requires at least one process')
+        self.name = name
+        self.processes = processes
+        # scheduler threads per worker process
+        self.workers = workers
+        # bytes of every ring, a power of two
+        self.capacity = capacity if capacity else ProbeHost.__DEFAULT_CAPACITY
+        self.start_method = start_method
+        self.poll_interval = poll_interval
+        self._debug = debug
+        self.probes = dict()
+        # declaration order -> RemoteProbe, bound to its worker once started
+        self._proxies = dict()
+        self._specs = [[] for _ in range(processes)]
+        self._workers = []
+        self.queue = None
+        self._decoder = BatchDecoder()
+        # probeids whose next batch must carry descriptors, e.g. for a queue attached late
+        self._resend = set()
+        self._reader = None
+        self._stop = Event()
+        self.batches = 0
+        self.undecodable = 0
+        # batches a full consumer queue refused, and deliveries that raised
+        self.drops = 0
+        self.errors = 0
+        self.logger = logging.getLogger('Catascopia.ProbeHost')
+
+    def add_probe(self, cls, *args, **kwargs):
+        """method that declares a probe, cls(*args, **kwargs) runs in the next worker process (round robin).
+           cls is a Probe subclass or a 'module:Class' string, returns the RemoteProbe controlling it
+        """
+        if self._workers:
+            raise CatascopiaProbeStatusException('ProbeHost probes must be added before start()')
+        seq = len(self._proxies)
+        proxy = self._proxies[seq] = RemoteProbe(self, seq % self.processes)
+        self._specs[proxy.index].append((cls, args, kwargs, seq))
+        return proxy
+
+    def attachQueue(self, queue = None, capacity = 100000, policy = OverflowPolicy.DROP_OLDEST):
+        """method that attaches the queue receiving the MetricBatch of every remote round, as Probe.attachQueue()"""
+        self.queue = RingBufferChannel(capacity, policy) if queue is None else queue
+        self._resend = set(self._decoder.descriptors)
+        return self.queue
+
+    def dettachQueue(self):
+        self.queue = None
+
+    def start(self):
+        """method that spawns the worker processes and waits until every probe got built"""
+        ctx = multiprocessing.get_context(self.start_method)
+        for index, specs in enumerate(self._specs):
+            if not specs:
+                continue
+            ring = SharedRing.create(self.capacity)
+            conn, child = ctx.Pipe()
+            process = ctx.Process(target = _worker_main, name = '%s-%d' % (self.name, index),
+                                  args = (specs, ring.path, child, self.workers, self._debug), daemon = True)
+            process.start()
+            child.close()
+            self._workers.append(_Worker(index, process, conn, ring))
+        for worker in self._workers:
+            reply = worker.recv()
+            if reply[0] != 'ready':
+                self.terminate()
+                raise CatascopiaProbeStatusException('ProbeHost worker %d failed: %s' % (worker.index, reply[1]))
+            for seq, name, probeid, status, periodicity in reply[1]:
+                proxy = self._proxies[seq]
+                proxy._bind(worker, name, probeid, status, periodicity)
+                self.probes[name] = proxy
+        self._stop.clear()
+        self._reader = Thread(target = self._read, name = self.name + 'Reader', daemon = True)
+        self._reader.start()
+        return self
+
+    def _read(self):
+        while not self._stop.is_set():
+            idle = True
+            for worker in self._workers:
+                for data in worker.ring.drain():
+                    idle = False
+                    self._safe_deliver(data)
+            if idle:
+                time.sleep(self.poll_interval)
+
+    def _safe_deliver(self, data):
+        # one bad delivery (e.g. a consumer queue raising) must not stop the reader
+        try:
+            self._deliver(data)
+        except Exception:
+            self.errors += 1
+            self.logger.exception('ProbeHost delivery failed')
+
+    def _deliver(self, data):
+        try:
+            batch = self._decoder.decode(data)
+        except CatascopiaSerializationException:
+            self.undecodable += 1
+            return
+        self.batches += 1
+        queue = self.queue
+        if queue is None:
+            return
+        if batch.probeid in self._resend:
+            self._resend.discard(batch.probeid)
+            if batch.descriptors is None:
+                batch.descriptors = list(self._decoder.descriptors[batch.probeid].values())
+        if isinstance(queue, Channel):
+            ok = queue.put(batch, block = False)
+        else:
+            try:
+                # a full queue drops the batch rather than stall the reader, as Probe._push()
+                queue.put_nowait(batch)
+                ok = True
+            except Full:
+                ok = False
+        if not ok:
+            self.drops += 1
+
+    def get_probe(self, name):
+        return self.probes.get(name)
+
+    def get_probes(self):
+        return list(self.probes.values())
+
+    def get_stats(self):
+        """method that returns per worker liveness and ring stats, plus decoded batch counters"""
+        return {'batches': self.batches,
+                'undecodable': self.undecodable,
+                'drops': self.drops,
+                'errors': self.errors,
+                'workers': [{'pid': w.process.pid, 'alive': w.process.is_alive(), 'ring': w.ring.get_stats()}
+                            for w in self._workers]}
+
+    def terminate(self, timeout = 5.0):
+        """method that TERMinates every remote probe, stops the worker processes and the reader"""
+        for worker in self._workers:
+            try:
+                worker.request(('stop', None, None))
+            except (OSError, EOFError, CatascopiaProbeStatusException):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.kill()
+        self._stop.set()
+        if self._reader is not None:
+            self._reader.join()
+            self._reader = None
+        for worker in self._workers:
+            for data in worker.ring.drain():
+                self._safe_deliver(data)
+            worker.ring.close(unlink = True)
+            worker.conn.close()
+        for proxy in self.probes.values():
+            proxy.probestatus = ProbeStatus.TERM
+        self._workers = []
+
+
+class RemoteProbe(object):
+    """Proxy of a probe running in a ProbeHost worker, forwarding status and periodicity changes"""
+
+    def __init__(self, host, index):
+        self.host = host
+        self.index = index
+        self.name = None
+        self.probeid = None
+        self.probestatus = ProbeStatus.INACTIVE
+        self.periodicity = None
+        self._worker = None
+
+    def _bind(self, worker, name, probeid, status, periodicity):
+        self._worker = worker
+        self.name = name
+        self.probeid = probeid
+        self.probestatus = status
+        self.periodicity = periodicity
+
+    def _call(self, cmd, arg = None):
+        if self._worker is None:
+            raise CatascopiaProbeStatusException('RemoteProbe not started, call ProbeHost.start() first')
+        self.probestatus, self.periodicity = self._worker.request((cmd, self.name, arg))
+
+    def get_name(self):
+        return self.name
+
+    def get_probeid(self):
+        return self.probeid
+
+    def get_probestatus(self):
+        """method that returns the remote probe status, as of the last command"""
+        return self.probestatus
+
+    def get_periodicity(self):
+        return self.periodicity
+
+    def set_periodicity(self, periodicity):
+        self._call('periodicity', periodicity)
+
+    def activate(self):
+        self._call('activate')
+
+    def deactivate(self):
+        self._call('deactivate')
+
+    def terminate(self):
+        self._call('terminate')
+
+    def refresh(self):
+        """method that fetches the current status and periodicity from the worker"""
+        self._call('status')
+        return self.probestatus
+
+
+class _Worker(object):
+
+    def __init__(self, index, process, conn, ring):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.ring = ring
+        self._lock = Lock()
+
+    def recv(self):
+        try:
+            return self.conn.recv()
+        except EOFError:
+            return ('error', 'worker process exited')
+
+    def request(self, msg):
+        with self._lock:
+            self.conn.send(msg)
+            reply = self.recv()
+        if reply[0] != 'ok':
+            raise CatascopiaProbeStatusException('ProbeHost worker %d: %s' % (self.index, reply[1]))
+        return reply[1]
+
+
+class _HostSerializer(BatchSerializer):
+    """struct packed batches, msgpack for the rounds holding values the JSON side section cannot encode"""
+
+    def __init__(self):
+        self.packed = StructSerializer()
+        self.fallback = MsgpackSerializer()
+
+    def encode(self, batch):
+        try:
+            return self.packed.encode(batch)
+        except CatascopiaSerializationException:
+            return self.fallback.encode(batch)
+
+    def decode(self, data):
+        return self.packed.decode(data)
+
+
+class _RingChannel(Channel):
+    """worker side channel writing every pushed batch to the SharedRing"""
+
+    def __init__(self, ring):
+        self.ring = ring
+        self._lock = Lock()
+        self.puts = 0
+        self.drops = 0
+
+    def put(self, item, block = True, timeout = None):
+        # the ring has a single producer, probes of the worker may emit from several scheduler threads
+        with self._lock:
+            ok = self.ring.put(item)
+        if ok:
+            self.puts += 1
+        else:
+            self.drops += 1
+        return ok
+
+    def qsize(self):
+        return 0
+
+    def get_stats(self):
+        return {'puts': self.puts, 'drops': self.drops, 'ring': self.ring.get_stats()}
+
+
+def _build(cls, args, kwargs):
+    if isinstance(cls, str):
+        module, _, name = cls.partition(':')
+        cls = getattr(importlib.import_module(module), name)
+    return cls(*args, **kwargs)
+
+
+def _worker_main(specs, ring_path, conn, workers, debug):
+    """entry point of a ProbeHost worker process"""
+    ring = SharedRing(ring_path)
+    channel = _RingChannel(ring)
+    scheduler = ProbeScheduler('ProbeHostScheduler', workers, debug)
+    probes = dict()
+    try:
+        built = []
+        for cls, args, kwargs, seq in specs:
+            probe = _build(cls, args, kwargs)
+            if probe.get_name() in probes:
+                raise CatascopiaProbeStatusException('duplicate probe name ' + probe.get_name())
+            probe.set_batching(True, _HostSerializer())
+            probe.attachQueue(channel)
+            probes[probe.get_name()] = probe
+            scheduler.add_probe(probe)
+            built.append((seq, probe.get_name(), str(probe.get_probeid()), probe.get_probestatus(),
+                          probe.get_periodicity()))
+        scheduler.start()
+    except Exception as e:
+        conn.send(('error', '%s: %s' % (type(e).__name__, e)))
+        return
+    conn.send(('ready', built))
+    while True:
+        try:
+            cmd, name, arg = conn.recv()
+        except (EOFError, OSError):
+            # the host went away
+            cmd, name, arg = 'stop', None, None
+        if cmd == 'stop':
+            scheduler.shutdown(terminate_probes = True)
+            try:
+                conn.send(('ok', (ProbeStatus.TERM, None)))
+            except (OSError, EOFError):
+                pass
+            ring.close()
+            return
+        probe = probes.get(name)
+        if probe is None:
+            conn.send(('error', 'unknown probe ' + str(name)))
+            continue
+        try:
+            if cmd == 'activate':
+                probe.activate()
+            elif cmd == 'deactivate':
+                probe.deactivate()
+            elif cmd == 'terminate':
+                probe.terminate()
+            elif cmd == 'periodicity':
+                probe.set_periodicity(arg)
+            elif cmd != 'status':
+                raise CatascopiaProbeStatusException('unknown command ' + str(cmd))
+            conn.send(('ok', (probe.get_probestatus(), probe.get_periodicity())))
+        except Exception as e:
+            conn.send(('error', '%s: %s' % (type(e).__name__, e)))
@@ -0,0 +1,304 @@
+import os
+from collections import namedtuple
+
+
+CpuTimes = namedtuple('CpuTimes', ['user', 'nice', 'system', 'idle', 'iowait', 'irq', 'softirq', 'steal'])
+MemoryStats = namedtuple('MemoryStats', ['total', 'available', 'used', 'free', 'buffers', 'cached',
+                                         'swap_total', 'swap_used'])
+DiskCounters = namedtuple('DiskCounters', ['read_count', 'write_count', 'read_bytes', 'write_bytes', 'busy_time'])
+NetCounters = namedtuple('NetCounters', ['bytes_recv', 'packets_recv', 'errin', 'dropin',
+                                         'bytes_sent', 'packets_sent', 'errout', 'dropout'])
+# cpu times in seconds, rss in bytes, create_time as a unix timestamp
+ProcessSample = namedtuple('ProcessSample', ['user', 'system', 'children_user', 'children_system', 'iowait',
+                                             'rss', 'create_time'])
+
+
+class ProcFile(object):
+    """/proc file kept open and re-read from offset 0 with preadv() into a preallocated buffer,
+       the buffer doubles whenever a read fills it
+    """
+
+    __slots__ = ('path', 'fd', 'buf', 'view')
+
+    def __init__(self, path, size = 4096):
+        self.path = path
+        self.fd = os.open(path, os.O_RDONLY)
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+
+    def read(self):
+        """method that returns the current content of the file as bytes"""
+        while True:
+            n = os.preadv(self.fd, [self.buf], 0)
+            if n < len(self.buf):
+                return self.view[:n].tobytes()
+            self.view.release()
+            self.buf = bytearray(2 * len(self.buf))
+            self.view = memoryview(self.buf)
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class ProcessReader(object):
+    """/proc/<pid>/stat reader of a single process, raises CatascopiaProcessGoneException once it exits"""
+
+    __slots__ = ('pid', '_stat', '_clk', '_page', '_boot', '_start')
+
+    def __init__(self, pid, clk, page, boot):
+        self.pid = pid
+        self._clk = clk
+        self._page = page
+        self._boot = boot
+        self._start = None
+        try:
+            self._stat = ProcFile('/proc/%d/stat' % pid, 1024)
+        except (FileNotFoundError, ProcessLookupError):
+            raise CatascopiaProcessGoneException('process ' + str(pid) + ' not found')
+
+    def sample(self):
+        try:
+            data = self._stat.read()
+        except ProcessLookupError:
+            raise CatascopiaProcessGoneException('process ' + str(self.pid) + ' exited')
+        if not data:
+            raise CatascopiaProcessGoneException('process ' + str(self.pid) + ' exited')
+        # the command name may hold spaces and parentheses, fields start after the last ')'
+        f = data[data.rindex(b')') + 2:].split()
+        clk = self._clk
+        if self._start is None:
+            self._start = int(f[19])
+        elif int(f[19]) != self._start:
+            # same pid, different process
+            raise CatascopiaProcessGoneException('process ' + str(self.pid) + ' exited, pid reused')
+        return ProcessSample(int(f[11]) / clk, int(f[12]) / clk, int(f[13]) / clk, int(f[14]) / clk,
+                             int(f[39]) / clk, int(f[21]) * self._page, self._boot + self._start / clk)
+
+    def close(self):
+        self._stat.close()
+
+
+class ProcFSBackend(object):
+    """Linux backend reading /proc directly, the files are opened once and only the requested fields parsed"""
+
+    name = 'procfs'
+
+    def __init__(self):
+        self._clk = os.sysconf('SC_CLK_TCK')
+        self._page = os.sysconf('SC_PAGE_SIZE')
+        self._files = dict()
+        for line in self._file('/proc/stat').read().splitlines():
+            if line.startswith(b'btime'):
+                self._boot = int(line.split()[1])
+                break
+
+    def _file(self, path):
+        f = self._files.get(path)
+        if f is None:
+            f = self._files[path] = ProcFile(path)
+        return f
+
+    def cpu_times(self):
+        """method that returns the host CpuTimes in seconds, summed over every cpu"""
+        data = self._file('/proc/stat').read()
+        # the aggregated cpu line comes first
+        f = data[:data.index(b'\n')].split()
+        clk = self._clk
+        return CpuTimes(*[int(v) / clk for v in f[1:9]])
+
+    def cpu_count(self):
+        return os.cpu_count()
+
+    def memory(self):
+        """method that returns the host MemoryStats in bytes, defined as psutil.virtual_memory() on Linux:
+           used is total minus available and cached includes the reclaimable slab, as free(1) reports
+        """
+        fields = {b'MemTotal:': 0, b'MemAvailable:': 0, b'MemFree:': 0, b'Buffers:': 0, b'Cached:': 0,
+                  b'SReclaimable:': 0, b'SwapTotal:': 0, b'SwapFree:': 0}
+        missing = len(fields)
+        for line in self._file('/proc/meminfo').read().splitlines():
+            key, _, rest = line.partition(b' ')
+            if key in fields:
+                # values are in kB
+                fields[key] = int(rest.split()[0]) * 1024
+                missing -= 1
+                if not missing:
+                    break
+        total = fields[b'MemTotal:']
+        return MemoryStats(total, fields[b'MemAvailable:'], total - fields[b'MemAvailable:'], fields[b'MemFree:'],
+                           fields[b'Buffers:'], fields[b'Cached:'] + fields[b'SReclaimable:'], fields[b'SwapTotal:'],
+                           fields[b'SwapTotal:'] - fields[b'SwapFree:'])
+
+    def disk_io(self, disks = None):
+        """method that returns {device: DiskCounters}, for the given devices or for every one"""
+        counters = dict()
+        for line in self._file('/proc/diskstats').read().splitlines():
+            f = line.split()
+            name = f[2].decode()
+            if disks is not None and name not in disks:
+                continue
+            # sectors are 512 bytes whatever the device block size
+            counters[name] = DiskCounters(int(f[3]), int(f[7]), int(f[5]) * 512, int(f[9]) * 512,
+                                          int(f[12]) / 1000.0)
+        return counters
+
+    def net_io(self, nics = None):
+        """method that returns {interface: NetCounters}, for the given interfaces or for every one"""
+        counters = dict()
+        # two header lines
+        for line in self._file('/proc/net/dev').read().splitlines()[2:]:
+            name, _, rest = line.partition(b':')
+            name = name.strip().decode()
+            if nics is not None and name not in nics:
+                continue
+            f = rest.split()
+            counters[name] = NetCounters(int(f[0]), int(f[1]), int(f[2]), int(f[3]),
+                                         int(f[8]), int(f[9]), int(f[10]), int(f[11]))
+        return counters
+
+    def process(self, pid = None):
+        """method that returns a ProcessReader, of the current process if pid is None"""
+        return ProcessReader(os.getpid() if pid is None else pid, self._clk, self._page, self._boot)
+
+    def descendants(self, pid):
+        """method that returns the pids of every process below pid, from one pass over /proc"""
+        kids = dict()
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open('/proc/' + entry + '/stat', 'rb') as f:
+                    data = f.read()
+            except OSError:
+                # exited meanwhile
+                continue
+            ppid = int(data[data.rindex(b')') + 2:].split(None, 2)[1])
+            kids.setdefault(ppid, []).append(int(entry))
+        found = []
+        stack = list(kids.get(pid, ()))
+        while stack:
+            p = stack.pop()
+            found.append(p)
+            stack.extend(kids.get(p, ()))
+        return found
+
+    def close(self):
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+
+class PsutilProcessReader(object):
+    """ProcessReader counterpart on top of psutil.Process, batching the reads of a sample with oneshot()"""
+
+    __slots__ = ('pid', 'proc', '_psutil')
+
+    def __init__(self, pid, psutil):
+        self._psutil = psutil
+        self.pid = pid
+        try:
+            self.proc = psutil.Process(pid)
+        except psutil.Error:
+            raise CatascopiaProcessGoneException('process ' + str(pid) + ' not found')
+
+    def sample(self):
+        proc = self.proc
+        try:
+            with proc.oneshot():
+                ct = proc.cpu_times()
+                rss = proc.memory_info().rss
+                created = proc.create_time()
+        except self._psutil.Error:
+            raise CatascopiaProcessGoneException('process ' + str(self.pid) + ' exited')
+        # iowait is only reported on Linux
+        return ProcessSample(ct[0], ct[1], ct[2], ct[3], ct[4] if len(ct) > 4 else 0.0, rss, created)
+
+    def close(self):
+        pass
+
+
+class PsutilBackend(object):
+    """portable backend on top of psutil, same interface as ProcFSBackend"""
+
+    name = 'psutil'
+
+    def __init__(self):
+        import psutil
+        self._psutil = psutil
+
+    def cpu_times(self):
+        ct = self._psutil.cpu_times()
+        return CpuTimes(ct.user, getattr(ct, 'nice', 0.0), ct.system, ct.idle, getattr(ct, 'iowait', 0.0),
+                        getattr(ct, 'irq', 0.0), getattr(ct, 'softirq', 0.0), getattr(ct, 'steal', 0.0))
+
+    def cpu_count(self):
+        return self._psutil.cpu_count()
+
+    def memory(self):
+        vm = self._psutil.virtual_memory()
+        sm = self._psutil.swap_memory()
+        return MemoryStats(vm.total, vm.available, vm.used, vm.free, getattr(vm, 'buffers', 0),
+                           getattr(vm, 'cached', 0), sm.total, sm.used)
+
+    def disk_io(self, disks = None):
+        counters = dict()
+        for name, c in (self._psutil.disk_io_counters(perdisk = True) or {}).items():
+            if disks is None or name in disks:
+                counters[name] = DiskCounters(c.read_count, c.write_count, c.read_bytes, c.write_bytes,
+                                              getattr(c, 'busy_time', 0) / 1000.0)
+        return counters
+
+    def net_io(self, nics = None):
+        counters = dict()
+        for name, c in self._psutil.net_io_counters(pernic = True).items():
+            if nics is None or name in nics:
+                counters[name] = NetCounters(c.bytes_recv, c.packets_recv, c.errin, c.dropin,
+                                             c.bytes_sent, c.packets_sent, c.errout, c.dropout)
+        return counters
+
+    def process(self, pid = None):
+        return PsutilProcessReader(os.getpid() if pid is None else pid, self._psutil)
+
+    def descendants(self, pid):
+        try:
+            return [c.pid for c in self._psutil.Process(pid).children(recursive = True)]
+        except self._psutil.Error:
+            return []
+
+    def close(self):
+        pass
+
+
+_BACKENDS = {'procfs': ProcFSBackend, 'psutil': PsutilBackend}
+
+
+def physical_disks(sysfs = '/sys/block'):
+    """helper that returns the whole block devices backed by hardware, leaving out partitions and the virtual
+       devices (loop, ram, zram, device-mapper, md) whose io is already counted on the disks beneath them,
+       None where sysfs is unavailable
+    """
+    if not os.path.isdir(sysfs):
+        return None
+    return sorted(d for d in os.listdir(sysfs)
+                  if os.sep + 'virtual' + os.sep not in os.path.realpath(os.path.join(sysfs, d)))
+
+
+def get_backend(name = None):
+    """helper that returns the named backend ('procfs' or 'psutil'), by default the /proc reader
+       wherever /proc is mounted (Linux) and psutil elsewhere
+    """
+    if name is None:
+        name = 'procfs' if os.path.exists('/proc/stat') and hasattr(os, 'preadv') else 'psutil'
+    if name not in _BACKENDS:
+        raise CatascopiaBackendException('unknown backend ' + str(name))
+    return _BACKENDS[name]()
+
+
+class CatascopiaBackendException(Exception):
+    pass
+
+
+class CatascopiaProcessGoneException(CatascopiaBackendException):
+    pass
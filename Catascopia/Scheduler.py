@@ -0,0 +1,154 @@
+import heapq
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread, Condition
+
+from Catascopia.Probe import ProbeStatus, CatascopiaProbeStatusException
+
+
+class ProbeScheduler(Thread):
+    """Runs the data collection of many Probes from a single dispatcher thread
+       that hands collect() rounds over to a bounded worker pool, instead of
+       one OS thread per Probe
+    """
+
+    __DEFAULT_WORKERS = 4
+
+    def __init__(self, name = 'ProbeScheduler', workers = None, debug = False):
+        super(ProbeScheduler, self).__init__(name = name)
+        self.workers = workers if workers else ProbeScheduler.__DEFAULT_WORKERS
+        self._debug = debug
+        self.probes = dict()
+        # heap of (deadline, seq, generation, probe) entries, seq breaks ties between equal deadlines
+        self._heap = []
+        self._seq = itertools.count()
+        # per probe generation, bumped on every notify so stale heap entries get discarded
+        self._generations = dict()
+        # probes whose collect() is currently running in the worker pool
+        self._inflight = set()
+        self._cond = Condition()
+        self._pool = None
+        self._running = False
+
+    def add_probe(self, probe):
+        """method that hands the data collection of a (not yet started) Probe over to the scheduler"""
+        if probe.get_scheduler() is not None and probe.get_scheduler() is not self:
+            raise CatascopiaProbeStatusException('Probe ' + probe.get_name() + ' is already owned by a scheduler')
+        if probe.is_alive():
+            raise CatascopiaProbeStatusException('Probe ' + probe.get_name() + ' already runs its own thread')
+        with self._cond:
+            probe._scheduler = self
+            self.probes[probe.get_probeid()] = probe
+            self._generations[probe.get_probeid()] = 0
+        # probe may have been activated before being handed over
+        if probe.get_probestatus() != ProbeStatus.INACTIVE:
+            self.notify(probe)
+
+    def remove_probe(self, probe):
+        """method that releases a Probe, its data collection stops until added to a scheduler again"""
+        with self._cond:
+            pid = probe.get_probeid()
+            if self.probes.pop(pid, None) is not None:
+                # invalidates any pending heap entry
+                del self._generations[pid]
+                probe._scheduler = None
+
+    def get_probes(self):
+        return list(self.probes.values())
+
+    def get_workers(self):
+        return self.workers
+
+    def notify(self, probe):
+        """method invoked by Probes on status transitions (ACTIVE, TERM), schedules the probe for its next deadline"""
+        with self._cond:
+            pid = probe.get_probeid()
+            if pid not in self._generations:
+                return
+            self._generations[pid] += 1
+            if probe.get_probestatus() == ProbeStatus.ACTIVE:
+                self._push(probe._next_deadline(), probe)
+            else:
+                self._push(time.monotonic(), probe)
+
+    def _push(self, deadline, probe):
+        # caller must hold self._cond
+        heapq.heappush(self._heap, (deadline, next(self._seq), self._generations[probe.get_probeid()], probe))
+        self._cond.notify()
+
+    def start(self):
+        self._pool = ThreadPoolExecutor(max_workers = self.workers, thread_name_prefix = self.name)
+        self._running = True
+        super(ProbeScheduler, self).start()
+
+    def shutdown(self, terminate_probes = True, wait = True):
+        """method that stops the dispatcher, optionally TERMinating every owned probe beforehand"""
+        if terminate_probes:
+            for p in self.get_probes():
+                p.terminate()
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if wait and self.is_alive():
+            self.join()
+        if self._pool is not None:
+            self._pool.shutdown(wait = wait)
+
+    def run(self):
+        """dispatcher loop, pops probes whose deadline expired and submits them to the worker pool"""
+        while True:
+            with self._cond:
+                while self._running:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.monotonic()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                if not self._running:
+                    break
+                deadline, _, generation, probe = heapq.heappop(self._heap)
+                pid = probe.get_probeid()
+                # discard entries of removed probes, outdated entries and probes with a round in flight,
+                # the in flight round reschedules the probe when done
+                if self._generations.get(pid) != generation or pid in self._inflight:
+                    continue
+                status = probe.get_probestatus()
+                if status == ProbeStatus.INACTIVE:
+                    continue
+                self._inflight.add(pid)
+            if status == ProbeStatus.TERM:
+                self._pool.submit(self._cleanup, probe)
+            else:
+                self._pool.submit(self._run_tick, probe)
+
+    def _run_tick(self, probe):
+        try:
+            deadline = probe._tick()
+        except Exception as e:
+            # anything escaping the probe's own error handling should not kill the worker
+            if self._debug:
+                print('ProbeScheduler, Probe ' + probe.get_name() + ' round FAILED with error: ' + str(e))
+            deadline = probe._advance_deadline(time.monotonic())
+        with self._cond:
+            pid = probe.get_probeid()
+            self._inflight.discard(pid)
+            if pid not in self._generations:
+                return
+            status = probe.get_probestatus()
+            if status == ProbeStatus.ACTIVE:
+                self._push(deadline, probe)
+            elif status == ProbeStatus.TERM:
+                self._push(time.monotonic(), probe)
+
+    def _cleanup(self, probe):
+        try:
+            probe.cleanUp()
+        finally:
+            with self._cond:
+                pid = probe.get_probeid()
+                self._inflight.discard(pid)
+                if self.probes.pop(pid, None) is not None:
+                    del self._generations[pid]
@@ -0,0 +1,405 @@
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+
+
+# exact types only, bool and non numeric values (e.g. histograms) are not stored
+_NUMBERS = (int, float)
+
+
+class Segment(object):
+    """Preallocated file of fixed size records, memory-mapped for appends and scans.
+       The header holds the sequence number of the first record, a record is valid when its crc32 matches,
+       so the zero-filled tail (or a torn write) marks the end of the data
+    """
+
+    HEADER = struct.Struct('<4sHHQdI')
+    HEADER_SIZE = 64
+    MAGIC = b'CSEG'
+    VERSION = 1
+    # wall-clock timestamp, value, mid, crc32 of the preceding 20 bytes
+    RECORD = struct.Struct('<ddII')
+    CHECKED = struct.Struct('<ddI')
+
+    __slots__ = ('path', 'base', 'capacity', 'created', 'count', '_file', '_mm', 'writable')
+
+    def __init__(self, path, base = None, capacity = None, writable = False):
+        self.path = path
+        self.writable = writable
+        if base is not None:
+            # new segment
+            self.base = base
+            self.capacity = capacity
+            self.created = time.time()
+            size = Segment.HEADER_SIZE + capacity * Segment.RECORD.size
+            self._file = open(path, 'w+b')
+            self._file.truncate(size)
+            self._mm = mmap.mmap(self._file.fileno(), size)
+            Segment.HEADER.pack_into(self._mm, 0, Segment.MAGIC, Segment.VERSION, Segment.RECORD.size, base,
+                                     self.created, capacity)
+            self.count = 0
+        else:
+            self._file = open(path, 'r+b' if writable else 'rb')
+            self._mm = mmap.mmap(self._file.fileno(), 0, access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+            magic, version, rsize, self.base, self.created, self.capacity = Segment.HEADER.unpack_from(self._mm, 0)
+            if magic != Segment.MAGIC or version != Segment.VERSION or rsize != Segment.RECORD.size:
+                self.close()
+                raise CatascopiaStoreException('invalid segment file ' + path)
+            self.count = self._recover()
+
+    def _recover(self):
+        """method that returns the number of records up to the first invalid one"""
+        n = 0
+        while n < self.capacity and self._valid(n):
+            n += 1
+        return n
+
+    def _valid(self, i):
+        offset = Segment.HEADER_SIZE + i * Segment.RECORD.size
+        ts, val, mid, crc = Segment.RECORD.unpack_from(self._mm, offset)
+        return crc == zlib.crc32(self._mm[offset:offset + 20])
+
+    def full(self):
+        return self.count >= self.capacity
+
+    def append(self, mid, ts, val):
+        Segment.RECORD.pack_into(self._mm, Segment.HEADER_SIZE + self.count * Segment.RECORD.size, ts, val, mid,
+                                 zlib.crc32(Segment.CHECKED.pack(ts, val, mid)))
+        self.count += 1
+
+    def append_entries(self, entries):
+        """method that appends numeric (mid, timestamp, val) entries until full, returns the number consumed"""
+        mm = self._mm
+        pack_into = Segment.RECORD.pack_into
+        pack = Segment.CHECKED.pack
+        crc32 = zlib.crc32
+        size = Segment.RECORD.size
+        count = self.count
+        offset = Segment.HEADER_SIZE + count * size
+        room = self.capacity - count
+        consumed = 0
+        for mid, ts, val in entries:
+            if room == 0:
+                break
+            consumed += 1
+            if ts is None or val is None or val.__class__ not in _NUMBERS:
+                continue
+            pack_into(mm, offset, ts, val, mid, crc32(pack(ts, val, mid)))
+            offset += size
+            room -= 1
+        self.count = self.capacity - room
+        return consumed
+
+    def records(self, start = 0, stop = None):
+        """method that returns the valid (mid, ts, val) records from index start up to stop"""
+        stop = self.count if stop is None else min(stop, self.count)
+        if start >= stop:
+            return []
+        view = memoryview(self._mm)[Segment.HEADER_SIZE + start * Segment.RECORD.size:
+                                    Segment.HEADER_SIZE + stop * Segment.RECORD.size]
+        try:
+            return [(mid, ts, val) for ts, val, mid, crc in Segment.RECORD.iter_unpack(view)]
+        finally:
+            view.release()
+
+    def refresh(self):
+        """method that picks up records appended by a writer in another process"""
+        while self.count < self.capacity and self._valid(self.count):
+            self.count += 1
+
+    def size(self):
+        return Segment.HEADER_SIZE + self.capacity * Segment.RECORD.size
+
+    def sync(self):
+        if self.writable:
+            self._mm.flush()
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SegmentStore(object):
+    """Append-only, disk-backed store-and-forward buffer of (mid, timestamp, value) records of one probe,
+       kept in memory-mapped segment files of segment_records records. Segments beyond max_bytes or older
+       than max_age seconds are deleted oldest first. Every record gets a sequence number, Cursors read
+       from a sequence number onwards and named cursors persist their position to resume after a restart.
+       Records live in the page cache as soon as appended and survive a crash of the process,
+       call sync() (or set sync_interval seconds) to also survive a crash of the host
+    """
+
+    __SEGMENT_SUFFIX = '.seg'
+    __CURSOR_SUFFIX = '.cursor'
+    __DESCRIPTORS = 'descriptors.json'
+
+    def __init__(self, path, segment_records = 65536, max_bytes = 256 * 1024 * 1024, max_age = None,
+                 sync_interval = None, readonly = False):
+        self.path = path
+        self.segment_records = segment_records
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.sync_interval = sync_interval
+        self.readonly = readonly
+        if not readonly and not os.path.isdir(path):
+            os.makedirs(path)
+        # base sequence number -> Segment, oldest first
+        self.segments = dict()
+        for name in sorted(os.listdir(path)):
+            if name.endswith(SegmentStore.__SEGMENT_SUFFIX):
+                try:
+                    seg = Segment(os.path.join(path, name))
+                except (CatascopiaStoreException, ValueError, struct.error):
+                    # empty or truncated file left by a crash while creating a segment
+                    continue
+                self.segments[seg.base] = seg
+        self._active = None
+        if not readonly and self.segments:
+            # the newest segment resumes appending after its last valid record
+            last = self.segments[max(self.segments)]
+            last.close()
+            self._active = Segment(last.path, writable = True)
+            self.segments[last.base] = self._active
+        self._last_sync = time.monotonic()
+        self.appended = 0
+        self.dropped = 0
+
+    def _segment_path(self, base):
+        return os.path.join(self.path, '%020d' % base + SegmentStore.__SEGMENT_SUFFIX)
+
+    def first_seq(self):
+        """method that returns the sequence number of the oldest record kept"""
+        return min(self.segments) if self.segments else 0
+
+    def next_seq(self):
+        """method that returns the sequence number the next appended record gets"""
+        if not self.segments:
+            return 0
+        last = self.segments[max(self.segments)]
+        return last.base + last.count
+
+    def _roll(self):
+        base = self.next_seq()
+        if self._active is not None:
+            self._active.sync()
+        self._active = Segment(self._segment_path(base), base, self.segment_records, writable = True)
+        self.segments[base] = self._active
+        self._retain()
+
+    def retain(self):
+        """method that applies the retention limits, done anyway whenever a new segment is created"""
+        if not self.readonly:
+            self._retain()
+
+    def _retain(self):
+        total = sum(s.size() for s in self.segments.values())
+        now = time.time()
+        for base in sorted(self.segments):
+            seg = self.segments[base]
+            if seg is self._active:
+                break
+            too_old = self.max_age is not None and self._newest_after(base) < now - self.max_age
+            if (self.max_bytes is None or total <= self.max_bytes) and not too_old:
+                break
+            total -= seg.size()
+            self.dropped += seg.count
+            seg.close()
+            del self.segments[base]
+            try:
+                os.remove(seg.path)
+            except OSError:
+                pass
+
+    def _newest_after(self, base):
+        # a segment stops receiving records once the next one gets created
+        later = [b for b in self.segments if b > base]
+        return self.segments[min(later)].created if later else time.time()
+
+    def append(self, mid, ts, val):
+        """method that appends a record, returns its sequence number"""
+        active = self._active
+        if active is None or active.full():
+            self._roll()
+            active = self._active
+        active.append(mid, ts, val)
+        self.appended += 1
+        if self.sync_interval is not None:
+            self._maybe_sync()
+        return active.base + active.count - 1
+
+    def append_entries(self, entries):
+        """method that appends (mid, timestamp, val) entries, skipping values that are not numbers,
+           returns the number of records appended
+        """
+        before = self.next_seq()
+        if not isinstance(entries, list):
+            entries = list(entries)
+        while entries:
+            active = self._active
+            if active is None or active.full():
+                self._roll()
+                active = self._active
+            consumed = active.append_entries(entries)
+            entries = entries[consumed:]
+        n = self.next_seq() - before
+        self.appended += n
+        if self.sync_interval is not None:
+            self._maybe_sync()
+        return n
+
+    def _maybe_sync(self):
+        now = time.monotonic()
+        if now - self._last_sync >= self.sync_interval:
+            self._last_sync = now
+            self.sync()
+
+    def sync(self):
+        """method that flushes the active segment to disk"""
+        if self._active is not None:
+            self._active.sync()
+
+    def set_descriptors(self, descriptors):
+        """method that persists the descriptor dicts resolving the mids of the records"""
+        tmp = os.path.join(self.path, SegmentStore.__DESCRIPTORS + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(descriptors, f)
+        os.replace(tmp, os.path.join(self.path, SegmentStore.__DESCRIPTORS))
+
+    def get_descriptors(self):
+        """method that returns {mid: descriptor dict}, empty if never set"""
+        try:
+            with open(os.path.join(self.path, SegmentStore.__DESCRIPTORS)) as f:
+                return {d['mid']: d for d in json.load(f)}
+        except FileNotFoundError:
+            return dict()
+
+    def read(self, seq, max_records = 10000):
+        """method that returns up to max_records (mid, ts, val) records from sequence number seq onwards and
+           the sequence number to continue from, records already removed by retention are skipped
+        """
+        records = []
+        if self.readonly:
+            self._reload()
+        seq = max(seq, self.first_seq())
+        for base in sorted(self.segments):
+            seg = self.segments[base]
+            if seg.base + seg.capacity <= seq:
+                continue
+            if self.readonly:
+                seg.refresh()
+            start = seq - seg.base
+            part = seg.records(start, start + max_records - len(records))
+            records.extend(part)
+            seq += len(part)
+            if len(records) >= max_records or seg.count < seg.capacity:
+                break
+        return records, seq
+
+    def _reload(self):
+        # a reader in another process picks up segments created or deleted by the writer
+        names = set(n for n in os.listdir(self.path) if n.endswith(SegmentStore.__SEGMENT_SUFFIX))
+        for base in list(self.segments):
+            if os.path.basename(self.segments[base].path) not in names:
+                self.segments.pop(base).close()
+        known = set(os.path.basename(s.path) for s in self.segments.values())
+        for name in sorted(names - known):
+            try:
+                seg = Segment(os.path.join(self.path, name))
+            except (CatascopiaStoreException, ValueError, struct.error):
+                continue
+            self.segments[seg.base] = seg
+
+    def cursor(self, name = None, start = 'earliest'):
+        """method that returns a Cursor, a named cursor resumes from its last committed position.
+           start applies to new cursors: 'earliest', 'latest' or a sequence number
+        """
+        seq = None
+        if name is not None:
+            try:
+                with open(os.path.join(self.path, name + SegmentStore.__CURSOR_SUFFIX)) as f:
+                    seq = int(f.read())
+            except (FileNotFoundError, ValueError):
+                pass
+        if seq is None:
+            if start == 'earliest':
+                seq = self.first_seq()
+            elif start == 'latest':
+                seq = self.next_seq()
+            else:
+                seq = int(start)
+        return Cursor(self, name, seq)
+
+    def _commit(self, name, seq):
+        tmp = os.path.join(self.path, name + SegmentStore.__CURSOR_SUFFIX + '.tmp')
+        with open(tmp, 'w') as f:
+            f.write(str(seq))
+        os.replace(tmp, os.path.join(self.path, name + SegmentStore.__CURSOR_SUFFIX))
+
+    def get_stats(self):
+        return {'segments': len(self.segments),
+                'bytes': sum(s.size() for s in self.segments.values()),
+                'first_seq': self.first_seq(),
+                'next_seq': self.next_seq(),
+                'appended': self.appended,
+                'dropped': self.dropped}
+
+    def close(self):
+        self.sync()
+        for seg in self.segments.values():
+            seg.close()
+        self.segments.clear()
+        self._active = None
+
+
+class Cursor(object):
+    """Position in a SegmentStore, read() returns the following records and commit() persists the position
+       of a named cursor so that a consumer catching up after an outage continues where it left off
+    """
+
+    def __init__(self, store, name, seq):
+        self.store = store
+        self.name = name
+        self.seq = seq
+        # records removed by retention before being read
+        self.lost = 0
+
+    def get_position(self):
+        return self.seq
+
+    def seek(self, seq):
+        self.seq = seq
+
+    def lag(self):
+        """method that returns the number of records still to read"""
+        return self.store.next_seq() - max(self.seq, self.store.first_seq())
+
+    def read(self, max_records = 10000):
+        first = self.store.first_seq()
+        if self.seq < first:
+            self.lost += first - self.seq
+            self.seq = first
+        records, self.seq = self.store.read(self.seq, max_records)
+        return records
+
+    def __iter__(self):
+        while True:
+            records = self.read()
+            if not records:
+                return
+            for r in records:
+                yield r
+
+    def commit(self):
+        if self.name is None:
+            raise CatascopiaStoreException('only named cursors can be committed')
+        self.store._commit(self.name, self.seq)
+
+
+class CatascopiaStoreException(Exception):
+    pass
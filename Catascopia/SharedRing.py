@@ -0,0 +1,157 @@
+import mmap
+import os
+import struct
+import tempfile
+import time
+import uuid
+
+
+class SharedRing(object):
+    """Single producer single consumer ring of variable size records in a memory-mapped file, shared by two
+       processes that map the same path (no shared_memory module needed, works with fork and spawn).
+       The producer only writes head and the consumer only writes tail, both are byte offsets that never
+       wrap, so neither side takes a lock. Records are a length prefix plus the payload, aligned to 8 bytes,
+       a record that does not fit before the end of the buffer is moved to the start behind a padding marker.
+       A put() never blocks, a record not fitting in the free space is dropped and counted
+    """
+
+    # head, tail and drops on separate cache lines, so producer and consumer do not share one
+    HEADER_SIZE = 192
+    MAGIC = b'CRNG'
+    _COUNTER = struct.Struct('<Q')
+    _INFO = struct.Struct('<4sQ')
+    _LENGTH = struct.Struct('<I')
+    _HEAD, _TAIL, _DROPS, _INFO_OFFSET = 0, 64, 128, 160
+    _PAD = 0xFFFFFFFF
+
+    def __init__(self, path, capacity = None):
+        """attaches to the ring at path, or creates it if capacity (a power of two) is given"""
+        self.path = path
+        self.created = capacity is not None
+        if capacity is not None:
+            if capacity < 64 or capacity & (capacity - 1):
+                raise CatascopiaRingException('SharedRing capacity must be a power of two >= 64')
+            with open(path, 'w+b') as f:
+                f.truncate(SharedRing.HEADER_SIZE + capacity)
+                mm = mmap.mmap(f.fileno(), SharedRing.HEADER_SIZE + capacity)
+            SharedRing._INFO.pack_into(mm, SharedRing._INFO_OFFSET, SharedRing.MAGIC, capacity)
+        else:
+            with open(path, 'r+b') as f:
+                mm = mmap.mmap(f.fileno(), 0)
+            magic, capacity = SharedRing._INFO.unpack_from(mm, SharedRing._INFO_OFFSET)
+            if magic != SharedRing.MAGIC:
+                mm.close()
+                raise CatascopiaRingException('invalid ring file ' + path)
+        self._mm = mm
+        self.capacity = capacity
+        self._mask = capacity - 1
+        # local copies of the offset each side owns
+        self._head = SharedRing._COUNTER.unpack_from(mm, SharedRing._HEAD)[0]
+        self._tail = SharedRing._COUNTER.unpack_from(mm, SharedRing._TAIL)[0]
+
+    @staticmethod
+    def create(capacity, folder = None):
+        """method that creates a ring in a new file under folder, by default /dev/shm where available"""
+        if folder is None:
+            folder = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+        return SharedRing(os.path.join(folder, 'catascopia-ring-' + uuid.uuid4().hex), capacity)
+
+    def put(self, data):
+        """method that appends a record (producer side), returns False if it got dropped"""
+        n = len(data)
+        size = (n + 11) & ~7
+        capacity = self.capacity
+        if size > capacity // 2:
+            self._drop()
+            return False
+        mm = self._mm
+        head = self._head
+        pos = head & self._mask
+        room = capacity - pos
+        skip = room if room < size else 0
+        tail = SharedRing._COUNTER.unpack_from(mm, SharedRing._TAIL)[0]
+        if head + skip + size - tail > capacity:
+            self._drop()
+            return False
+        if skip:
+            SharedRing._LENGTH.pack_into(mm, SharedRing.HEADER_SIZE + pos, SharedRing._PAD)
+            head += skip
+            pos = 0
+        start = SharedRing.HEADER_SIZE + pos
+        SharedRing._LENGTH.pack_into(mm, start, n)
+        mm[start + 4:start + 4 + n] = data
+        # publishing head last makes the record visible to the consumer only once written
+        self._head = head + size
+        SharedRing._COUNTER.pack_into(mm, SharedRing._HEAD, self._head)
+        return True
+
+    def _drop(self):
+        mm = self._mm
+        drops = SharedRing._COUNTER.unpack_from(mm, SharedRing._DROPS)[0]
+        SharedRing._COUNTER.pack_into(mm, SharedRing._DROPS, drops + 1)
+
+    def get(self):
+        """method that pops the oldest record (consumer side), None if the ring is empty"""
+        mm = self._mm
+        head = SharedRing._COUNTER.unpack_from(mm, SharedRing._HEAD)[0]
+        tail = self._tail
+        while tail != head:
+            pos = tail & self._mask
+            start = SharedRing.HEADER_SIZE + pos
+            n = SharedRing._LENGTH.unpack_from(mm, start)[0]
+            if n == SharedRing._PAD:
+                tail += self.capacity - pos
+                continue
+            data = mm[start + 4:start + 4 + n]
+            self._tail = tail + ((n + 11) & ~7)
+            SharedRing._COUNTER.pack_into(mm, SharedRing._TAIL, self._tail)
+            return data
+        if tail != self._tail:
+            self._tail = tail
+            SharedRing._COUNTER.pack_into(mm, SharedRing._TAIL, tail)
+        return None
+
+    def drain(self, max_items = None):
+        """method that pops up to max_items records, returns them as a list"""
+        items = []
+        while max_items is None or len(items) < max_items:
+            data = self.get()
+            if data is None:
+                break
+            items.append(data)
+        return items
+
+    def wait(self, timeout, poll = 0.001):
+        """method that waits up to timeout seconds for a record, returns False on timeout"""
+        end = time.monotonic() + timeout
+        while not self.qbytes():
+            if time.monotonic() >= end:
+                return False
+            time.sleep(poll)
+        return True
+
+    def qbytes(self):
+        """method that returns the bytes written and not yet consumed"""
+        mm = self._mm
+        return SharedRing._COUNTER.unpack_from(mm, SharedRing._HEAD)[0] - \
+            SharedRing._COUNTER.unpack_from(mm, SharedRing._TAIL)[0]
+
+    def get_drops(self):
+        return SharedRing._COUNTER.unpack_from(self._mm, SharedRing._DROPS)[0]
+
+    def get_stats(self):
+        return {'capacity': self.capacity,
+                'used': self.qbytes(),
+                'drops': self.get_drops()}
+
+    def close(self, unlink = False):
+        self._mm.close()
+        if unlink:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+class CatascopiaRingException(Exception):
+    pass
@@ -0,0 +1,117 @@
+import heapq
+import itertools
+import time
+from threading import Thread, Condition, Lock
+
+
+class TimerHandle(object):
+    """handle of a callback scheduled on a TimerService"""
+
+    __slots__ = ('deadline', 'callback', 'args', 'cancelled', 'fired', '_service')
+
+    def __init__(self, deadline, callback, args, service):
+        # perf_counter() deadline
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        # set by the service thread right before running the callback
+        self.fired = False
+        self._service = service
+
+    def cancel(self):
+        """method that cancels the callback, no effect once fired"""
+        if not self.cancelled and not self.fired:
+            self._service._cancel(self)
+
+
+class TimerService(object):
+    """Single thread firing many timeouts, scheduled in a heap keyed on time.perf_counter() deadlines.
+       schedule() is O(log n) and cancel() O(1), cancelled entries are dropped lazily and compacted
+       when they outnumber the live ones
+    """
+
+    __COMPACT_THRESHOLD = 1024
+
+    _default = None
+    _default_lock = Lock()
+
+    @classmethod
+    def get_default(cls):
+        """method that returns the process-wide TimerService, created on first use"""
+        if cls._default is None:
+            with cls._default_lock:
+                if cls._default is None:
+                    cls._default = TimerService()
+        return cls._default
+
+    def __init__(self, name = 'CatascopiaTimerService'):
+        self.name = name
+        self._heap = []
+        self._seq = itertools.count()
+        self._cancelled = 0
+        self._cond = Condition()
+        self._thread = None
+        self._running = True
+
+    def schedule(self, delay, callback, *args):
+        """method that runs callback(*args) on the service thread after delay seconds, returns a TimerHandle"""
+        handle = TimerHandle(time.perf_counter() + delay, callback, args, self)
+        with self._cond:
+            if self._thread is None:
+                # the service thread never keeps the process alive
+                self._thread = Thread(target = self._run, name = self.name, daemon = True)
+                self._thread.start()
+            heapq.heappush(self._heap, (handle.deadline, next(self._seq), handle))
+            # only wake the service thread if the new timer expires first
+            if self._heap[0][2] is handle:
+                self._cond.notify()
+        return handle
+
+    def _cancel(self, handle):
+        with self._cond:
+            if handle.cancelled or handle.fired:
+                return
+            handle.cancelled = True
+            self._cancelled += 1
+            if self._cancelled > TimerService.__COMPACT_THRESHOLD and self._cancelled * 2 > len(self._heap):
+                self._heap = [e for e in self._heap if not e[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled = 0
+
+    def pending(self):
+        """method that returns the number of timers still to fire"""
+        with self._cond:
+            return len(self._heap) - self._cancelled
+
+    def shutdown(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    deadline, _, handle = self._heap[0]
+                    if handle.cancelled:
+                        heapq.heappop(self._heap)
+                        self._cancelled -= 1
+                        continue
+                    delay = deadline - time.perf_counter()
+                    if delay <= 0:
+                        heapq.heappop(self._heap)
+                        # fired handles can no longer be cancelled
+                        handle.fired = True
+                        break
+                    self._cond.wait(delay)
+                if not self._running:
+                    return
+            try:
+                handle.callback(*handle.args)
+            except Exception:
+                # a failing callback must not stop the other timers
+                pass
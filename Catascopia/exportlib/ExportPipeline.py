@@ -0,0 +1,227 @@
+import random
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty
+from threading import Thread, Event, BoundedSemaphore, Lock
+
+from Catascopia.Batch import decode_batch, CatascopiaSerializationException
+from Catascopia.Channel import RingBufferChannel, OverflowPolicy
+from Catascopia.exportlib.Exporter import Series, CatascopiaExportException
+
+
+class ExportPipeline(object):
+    """Drains the batches of any number of probes from a shared RingBufferChannel and ships them in batches of
+       up to batch_size samples (or whatever is pending every flush_interval seconds) to every Exporter.
+       Each exporter gets at most max_in_flight batches in flight, a batch waiting longer than block_timeout
+       for a slot is dropped. Failed batches are retried up to retries times with exponential backoff and
+       jitter starting at backoff seconds, capped at max_backoff
+    """
+
+    __ROLLUP_STATS = ('count', 'min', 'max', 'mean', 'var')
+
+    def __init__(self, exporters, batch_size = 1000, flush_interval = 1.0, max_in_flight = 4, retries = 3,
+                 backoff = 0.1, max_backoff = 5.0, block_timeout = 5.0, capacity = 100000):
+        if not exporters:
+            raise CatascopiaExportException('ExportPipeline requires at least one exporter', retryable = False)
+        if batch_size <= 0 or max_in_flight <= 0:
+            raise CatascopiaExportException('ExportPipeline batch_size and max_in_flight must be positive',
+                                            retryable = False)
+        self.exporters = list(exporters)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_in_flight = max_in_flight
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.block_timeout = block_timeout
+        self.channel = RingBufferChannel(capacity, OverflowPolicy.DROP_OLDEST)
+        self.probes = []
+        # probeid -> {mid: Series}, rebuilt whenever a probe sends its descriptors
+        self._series = dict()
+        self._pending = []
+        self._slots = [BoundedSemaphore(max_in_flight) for _ in self.exporters]
+        self._executor = None
+        self._thread = None
+        self._stop = Event()
+        self._lock = Lock()
+        self._stats = [{'batches': 0, 'samples': 0, 'bytes': 0, 'retries': 0, 'failed': 0, 'dropped': 0}
+                       for _ in self.exporters]
+        self.undecodable = 0
+        self.unresolved = 0
+        self.logger = logging.getLogger('Catascopia.ExportPipeline')
+
+    def add_probe(self, probe):
+        """method that attaches the pipeline channel to a probe and switches the probe to batching"""
+        probe.attachQueue(self.channel)
+        if not probe.get_batching():
+            probe.set_batching(True)
+        probe.resend_descriptors()
+        self.probes.append(probe)
+
+    def remove_probe(self, probe):
+        if probe in self.probes:
+            self.probes.remove(probe)
+            probe.dettachQueue()
+
+    def get_exporters(self):
+        return self.exporters
+
+    def start(self):
+        """method that starts the drain thread, returns the pipeline"""
+        if self._thread is not None:
+            return self
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers = self.max_in_flight * len(self.exporters),
+                                            thread_name_prefix = 'CatascopiaExport')
+        self._thread = Thread(target = self._run, name = 'ExportPipeline', daemon = True)
+        self._thread.start()
+        return self
+
+    def shutdown(self, flush = True, timeout = 10.0):
+        """method that stops the drain thread, ships what is pending if flush, waits for in-flight batches
+           and closes the exporters
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        if flush:
+            self._collect(self.channel.drain())
+            self._flush()
+        self._executor.shutdown(wait = True)
+        self._executor = None
+        for exporter in self.exporters:
+            exporter.close()
+
+    def _run(self):
+        channel = self.channel
+        deadline = time.monotonic() + self.flush_interval
+        while not self._stop.is_set():
+            try:
+                item = channel.get(timeout = max(deadline - time.monotonic(), 0.001))
+            except Empty:
+                item = None
+            if item is not None:
+                self._collect([item])
+                self._collect(channel.drain())
+            if len(self._pending) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush()
+                deadline = time.monotonic() + self.flush_interval
+
+    def _collect(self, items):
+        """method that resolves queued batches to (Series, timestamp, val) samples"""
+        pending = self._pending
+        for item in items:
+            try:
+                batch = decode_batch(item)
+            except (CatascopiaSerializationException, ValueError, TypeError, KeyError):
+                self.undecodable += 1
+                continue
+            if batch.descriptors is not None:
+                group = batch.probe
+                self._series[batch.probeid] = {d['mid']: Series(batch.probe, d.get('group') or group, d['name'],
+                                                                d.get('units'), d.get('desc'))
+                                               for d in batch.descriptors}
+            series = self._series.get(batch.probeid)
+            if series is None:
+                self.unresolved += len(batch.entries)
+                continue
+            for mid, ts, val in batch.entries:
+                s = series.get(mid)
+                if s is None:
+                    self.unresolved += 1
+                    continue
+                pending.append((s, ts, val))
+            if batch.rollups:
+                self._collect_rollups(batch, series)
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+                pending = self._pending
+
+    def _collect_rollups(self, batch, series):
+        """method that flattens rollups to one <name>_<stat> series per numeric statistic"""
+        for mid, rollup in batch.rollups:
+            s = series.get(mid)
+            if s is None:
+                self.unresolved += 1
+                continue
+            ts = batch.timestamp
+            stats = [(key, rollup.get(key)) for key in ExportPipeline.__ROLLUP_STATS]
+            stats.extend(('p' + ('%g' % (q * 100)).replace('.', '_'), val)
+                         for q, val in rollup.get('quantiles') or ())
+            for key, val in stats:
+                if val is None:
+                    continue
+                stat = s.cache.get('stat:' + key)
+                if stat is None:
+                    stat = s.cache['stat:' + key] = Series(s.probe, s.group, s.name + '_' + key, s.units, s.desc)
+                self._pending.append((stat, ts, val))
+
+    def _flush(self):
+        pending = self._pending
+        if not pending:
+            return
+        self._pending = []
+        for start in range(0, len(pending), self.batch_size):
+            samples = pending[start:start + self.batch_size]
+            for i, exporter in enumerate(self.exporters):
+                self._submit(i, exporter, samples)
+
+    def _submit(self, i, exporter, samples):
+        if not self._slots[i].acquire(timeout = self.block_timeout):
+            with self._lock:
+                self._stats[i]['dropped'] += 1
+            self.logger.warning('%s: no in-flight slot, dropped %d samples' % (exporter.name, len(samples)))
+            return
+        try:
+            self._executor.submit(self._export, i, exporter, samples)
+        except RuntimeError:
+            self._slots[i].release()
+
+    def _export(self, i, exporter, samples):
+        stats = self._stats[i]
+        delay = self.backoff
+        attempt = 0
+        try:
+            while True:
+                try:
+                    sent = exporter.export(samples)
+                    with self._lock:
+                        stats['batches'] += 1
+                        stats['samples'] += len(samples)
+                        stats['bytes'] += sent or 0
+                    return
+                except (CatascopiaExportException, OSError) as e:
+                    retryable = getattr(e, 'retryable', True)
+                    if not retryable or attempt >= self.retries:
+                        with self._lock:
+                            stats['failed'] += 1
+                        self.logger.error('%s: batch of %d samples failed: %s' % (exporter.name, len(samples), e))
+                        return
+                    attempt += 1
+                    with self._lock:
+                        stats['retries'] += 1
+                    # full jitter keeps exporters retrying against a recovering server from synchronizing
+                    time.sleep(random.uniform(0, delay))
+                    delay = min(delay * 2, self.max_backoff)
+                except Exception as e:
+                    # a bug in an exporter fails the batch, not the pipeline
+                    with self._lock:
+                        stats['failed'] += 1
+                    self.logger.exception('%s: batch of %d samples failed: %s' % (exporter.name, len(samples), e))
+                    return
+        finally:
+            self._slots[i].release()
+
+    def get_stats(self):
+        """method that returns per exporter counters of batches, samples, bytes, retries, failed and dropped
+           batches, along with the channel stats
+        """
+        with self._lock:
+            stats = {e.name: dict(s) for e, s in zip(self.exporters, self._stats)}
+        stats['channel'] = self.channel.get_stats()
+        stats['undecodable'] = self.undecodable
+        stats['unresolved'] = self.unresolved
+        return stats
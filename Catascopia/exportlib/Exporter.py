@@ -0,0 +1,149 @@
+import abc
+import gzip
+import json
+import math
+import queue
+import socket
+
+
+class Series(object):
+    """identity of an exported time series, shared by all its samples. Exporters keep their
+       precomputed encodings of the series (escaped names, label sets) in cache
+    """
+
+    __slots__ = ('probe', 'group', 'name', 'units', 'desc', 'cache')
+
+    def __init__(self, probe, group, name, units, desc = None):
+        self.probe = probe
+        self.group = group
+        self.name = name
+        self.units = units
+        self.desc = desc
+        self.cache = dict()
+
+    def to_dict(self):
+        return {'probe': self.probe, 'group': self.group, 'name': self.name, 'units': self.units}
+
+
+class Exporter(metaclass = abc.ABCMeta):
+    """Backend receiving batches of (Series, timestamp, val) samples from an ExportPipeline.
+       export() is called from up to max_in_flight pipeline threads at once and raises
+       CatascopiaExportException (or OSError) on failure, retried by the pipeline if retryable
+    """
+
+    name = 'Exporter'
+
+    @abc.abstractmethod
+    def export(self, samples):
+        """method that ships a batch of samples, returns the number of bytes sent"""
+        pass
+
+    def close(self):
+        """method that releases connections and files, called once by ExportPipeline.shutdown()"""
+        pass
+
+
+class ConnectionPool(object):
+    """Pool of persistent connections created by factory(), at most size kept idle. A connection
+       released as broken is closed and the next acquire() creates a fresh one
+    """
+
+    def __init__(self, factory, size = 4):
+        self.factory = factory
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self.created = 0
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            self.created += 1
+            return self.factory()
+
+    def release(self, conn, broken = False):
+        if broken or self._idle.qsize() >= self.size:
+            try:
+                conn.close()
+            except OSError:
+                pass
+        else:
+            self._idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+            except OSError:
+                pass
+
+
+def _escape_tag(s):
+    return str(s).replace('\\', '\\\\').replace(',', '\\,').replace('=', '\\=').replace(' ', '\\ ')
+
+
+def encode_line_protocol(samples):
+    """helper that encodes samples as InfluxDB line protocol, measurement is the metric name tagged by
+       probe and group, timestamps in nanoseconds. Non numeric values are skipped
+    """
+    lines = []
+    append = lines.append
+    for series, ts, val in samples:
+        if val is None or isinstance(val, bool) or not isinstance(val, (int, float)) or val != val \
+                or math.isinf(val) or ts is None:
+            continue
+        prefix = series.cache.get('line')
+        if prefix is None:
+            prefix = _escape_tag(series.name)
+            if series.probe is not None:
+                prefix += ',probe=' + _escape_tag(series.probe)
+            if series.group is not None and series.group != series.probe:
+                prefix += ',group=' + _escape_tag(series.group)
+            prefix = series.cache['line'] = prefix + ' value='
+        append('%s%r %d\n' % (prefix, float(val), int(ts * 1e9)))
+    return ''.join(lines).encode('utf-8')
+
+
+def encode_json_lines(samples):
+    """helper that encodes samples as one Metric.to_dict() shaped JSON object per line"""
+    lines = []
+    append = lines.append
+    dumps = json.dumps
+    for series, ts, val in samples:
+        head = series.cache.get('json')
+        if head is None:
+            head = series.cache['json'] = dumps(series.to_dict())[:-1]
+        append('%s, "timestamp": %s, "val": %s}\n' % (head, dumps(ts), dumps(val)))
+    return ''.join(lines).encode('utf-8')
+
+
+_ENCODERS = {'line': encode_line_protocol, 'json': encode_json_lines}
+
+
+def get_encoder(format):
+    if format not in _ENCODERS:
+        raise CatascopiaExportException('unknown export format ' + str(format), retryable = False)
+    return _ENCODERS[format]
+
+
+def compress(data, level = 6):
+    return gzip.compress(data, compresslevel = level)
+
+
+def tcp_factory(host, port, timeout = 5.0):
+    """helper that returns a factory of connected TCP sockets with Nagle disabled"""
+    def connect():
+        sock = socket.create_connection((host, port), timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+    return connect
+
+
+class CatascopiaExportException(Exception):
+
+    def __init__(self, msg, retryable = True):
+        super(CatascopiaExportException, self).__init__(msg)
+        self.retryable = retryable
+
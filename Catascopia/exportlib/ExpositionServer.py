@@ -0,0 +1,167 @@
+import time
+from threading import Thread, Lock, Event
+
+from Catascopia.exportlib.PrometheusExporter import ExpositionHTTPServer, Snapshot, sanitize, escape_label, \
+    family_header, format_value
+
+
+class ExpositionServer(object):
+    """Pull endpoint serving the metrics of the attached probes in the Prometheus text exposition format.
+       Every probe re-renders its own samples from its collecting thread right after each round and wakes a
+       publisher thread, which assembles the samples of all probes into a Snapshot (plain and gzipped) at most
+       once every min_interval seconds, rounds landing meanwhile coalesce into the next rebuild. A probe round
+       never merges nor compresses and a scrape only reads the published snapshot, it never takes a lock.
+       Series are labelled with the probe name, probes exposing the same metrics need distinct names.
+       The default port differs from the 9100 of node_exporter and the 9180 of PrometheusExporter
+    """
+
+    DEFAULT_PORT = 9181
+
+    def __init__(self, host = '0.0.0.0', port = DEFAULT_PORT, prefix = 'catascopia_', path = '/metrics',
+                 compresslevel = 6, timestamps = False, min_interval = 0.1):
+        self.prefix = prefix
+        self.compresslevel = compresslevel
+        # flag to expose sample timestamps, by default the scrape time stands for the round time
+        self.timestamps = timestamps
+        self.probes = []
+        # probeid -> {family name: [sample lines]} of the last round of each probe
+        self._samples = dict()
+        # probeid -> (table version, [(family name, line prefix) per mid]), rebuilt on metric registration
+        self._layouts = dict()
+        # family name -> header lines, shared by the probes exposing the family
+        self._headers = dict()
+        self._lock = Lock()
+        # seconds between two rebuilds of the snapshot
+        self.min_interval = min_interval
+        # set when samples changed since the snapshot was built
+        self._dirty = Event()
+        self._exit = Event()
+        self.renders = 0
+        self.server = ExpositionHTTPServer((host, port), path)
+        self.server.start()
+        self.host, self.port = self.server.server_address[:2]
+        self._publisher = Thread(target = self._run, name = 'ExpositionPublisher', daemon = True)
+        self._publisher.start()
+
+    def add_probe(self, probe):
+        """method that exposes the metrics of probe, rendered after every data collection round"""
+        if probe in self.probes:
+            return
+        self.probes.append(probe)
+        self.refresh(probe)
+        probe.add_tick_listener(self.refresh)
+
+    def remove_probe(self, probe):
+        if probe not in self.probes:
+            return
+        probe.remove_tick_listener(self.refresh)
+        self.probes.remove(probe)
+        with self._lock:
+            self._samples.pop(str(probe.probeid), None)
+            self._layouts.pop(str(probe.probeid), None)
+        self._dirty.set()
+
+    def refresh(self, probe, tick_ts = None):
+        """method that renders the current values of probe for the next snapshot, called by the probe after
+           every round
+        """
+        probeid = str(probe.probeid)
+        table = probe.get_metric_table()
+        layout = self._layouts.get(probeid)
+        if layout is None or layout[0] != table.version:
+            layout = self._layouts[probeid] = (table.version, self._layout(probe, table))
+        prefixes = layout[1]
+        families = dict()
+        timestamps = self.timestamps
+        for mid, ts, val in table.fill_entries([]):
+            if val is None or isinstance(val, bool) or not isinstance(val, (int, float)):
+                continue
+            if mid >= len(prefixes) or prefixes[mid] is None:
+                # registered after the layout got built, rendered from the next round on
+                continue
+            family, prefix = prefixes[mid]
+            lines = families.get(family)
+            if lines is None:
+                lines = families[family] = []
+            if timestamps and ts is not None:
+                lines.append('%s %s %d\n' % (prefix, format_value(val), int(ts * 1000)))
+            else:
+                lines.append('%s %s\n' % (prefix, format_value(val)))
+        with self._lock:
+            if probe in self.probes:
+                self._samples[probeid] = families
+        self._dirty.set()
+
+    def _run(self):
+        while True:
+            self._dirty.wait()
+            if self._exit.is_set():
+                return
+            self._dirty.clear()
+            self._publish()
+            # rounds of the next min_interval seconds coalesce into a single rebuild
+            if self._exit.wait(self.min_interval):
+                return
+
+    def _layout(self, probe, table):
+        prefixes = []
+        for d in table.get_descriptors():
+            if d is None:
+                # released mid, never among the entries of the table
+                prefixes.append(None)
+                continue
+            family = sanitize(self.prefix + d.name)
+            labels = 'probe="%s"' % escape_label(probe.get_name())
+            if d.group is not None and d.group != probe.get_name():
+                labels += ',group="%s"' % escape_label(d.group)
+            prefixes.append((family, '%s{%s}' % (family, labels)))
+            if family not in self._headers:
+                self._headers[family] = family_header(family, d.desc or d.name)
+        return prefixes
+
+    def _publish(self):
+        """method that assembles the samples of every probe family by family, as the format requires"""
+        # rounds replace the families of a probe as a whole, a shallow copy is consistent
+        with self._lock:
+            samples = list(self._samples.values())
+        merged = dict()
+        for families in samples:
+            for family, lines in families.items():
+                out = merged.get(family)
+                if out is None:
+                    merged[family] = list(lines)
+                else:
+                    out.extend(lines)
+        parts = []
+        series = 0
+        for family in sorted(merged):
+            parts.append(self._headers[family])
+            parts.extend(merged[family])
+            series += len(merged[family])
+        self.server.publish(Snapshot(''.join(parts).encode('utf-8'), self.compresslevel, series))
+        self.renders += 1
+
+    def get_snapshot(self):
+        return self.server.snapshot
+
+    def get_address(self):
+        return self.host, self.port
+
+    def get_stats(self):
+        snapshot = self.server.snapshot
+        return {'probes': len(self.probes),
+                'series': snapshot.series,
+                'bytes': len(snapshot.body),
+                'gzip_bytes': len(snapshot.gzipped),
+                'renders': self.renders,
+                'scrapes': self.server.scrapes,
+                'age': max(time.time() - snapshot.timestamp, 0.0)}
+
+    def close(self):
+        for probe in list(self.probes):
+            probe.remove_tick_listener(self.refresh)
+        self.probes = []
+        self._exit.set()
+        self._dirty.set()
+        self._publisher.join()
+        self.server.close()
@@ -0,0 +1,40 @@
+import os
+from threading import Lock
+
+from Catascopia.exportlib.Exporter import Exporter, get_encoder, compress
+
+
+class FileExporter(Exporter):
+    """Appends every batch to a local file as JSON lines (format='json') or line protocol (format='line'),
+       as a gzip member per batch if compression is set (the file stays readable with gzip -d or zcat)
+    """
+
+    def __init__(self, path, format = 'json', compression = False, level = 6, fsync = False):
+        folder = os.path.dirname(path)
+        if folder:
+            os.makedirs(folder, exist_ok = True)
+        self.path = path
+        self.encode = get_encoder(format)
+        self.compression = compression
+        self.level = level
+        self.fsync = fsync
+        self.name = 'file://' + os.path.abspath(path)
+        self._file = open(path, 'ab')
+        self._lock = Lock()
+
+    def export(self, samples):
+        data = self.encode(samples)
+        if not data:
+            return 0
+        if self.compression:
+            data = compress(data, self.level)
+        with self._lock:
+            self._file.write(data)
+            self._file.flush()
+            if self.fsync:
+                os.fsync(self._file.fileno())
+        return len(data)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
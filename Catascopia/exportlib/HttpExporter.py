@@ -0,0 +1,60 @@
+import http.client
+from urllib.parse import urlsplit
+
+from Catascopia.exportlib.Exporter import Exporter, ConnectionPool, get_encoder, compress, \
+    CatascopiaExportException
+
+
+class HttpExporter(Exporter):
+    """POSTs every batch to url as JSON lines (format='json') or line protocol (format='line') over pooled
+       keep-alive connections, gzip compressed if compression is set. 5xx responses and 429 are retried,
+       other 4xx are not
+    """
+
+    __CONTENT_TYPES = {'json': 'application/x-ndjson', 'line': 'text/plain; charset=utf-8'}
+
+    def __init__(self, url, format = 'json', compression = False, level = 6, pool_size = 4, timeout = 5.0,
+                 headers = None):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https'):
+            raise CatascopiaExportException('HttpExporter url must be http(s)', retryable = False)
+        self.url = url
+        self.encode = get_encoder(format)
+        self.compression = compression
+        self.level = level
+        self.timeout = timeout
+        self.path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        self.name = url
+        self.headers = {'Content-Type': HttpExporter.__CONTENT_TYPES[format], 'Connection': 'keep-alive'}
+        if compression:
+            self.headers['Content-Encoding'] = 'gzip'
+        if headers:
+            self.headers.update(headers)
+        cls = http.client.HTTPSConnection if parts.scheme == 'https' else http.client.HTTPConnection
+        host = parts.hostname
+        port = parts.port
+        self.pool = ConnectionPool(lambda: cls(host, port, timeout = timeout), pool_size)
+
+    def export(self, samples):
+        data = self.encode(samples)
+        if not data:
+            return 0
+        if self.compression:
+            data = compress(data, self.level)
+        conn = self.pool.acquire()
+        try:
+            conn.request('POST', self.path, data, self.headers)
+            resp = conn.getresponse()
+            # the body must be consumed before the connection can be reused
+            resp.read()
+        except (OSError, http.client.HTTPException) as e:
+            self.pool.release(conn, broken = True)
+            raise CatascopiaExportException('%s: %s' % (self.url, e))
+        self.pool.release(conn, broken = resp.will_close)
+        if resp.status >= 300:
+            raise CatascopiaExportException('%s: HTTP %d %s' % (self.url, resp.status, resp.reason),
+                                            retryable = resp.status >= 500 or resp.status == 429)
+        return len(data)
+
+    def close(self):
+        self.pool.close()
@@ -0,0 +1,65 @@
+import socket
+
+from Catascopia.exportlib.Exporter import Exporter, ConnectionPool, encode_line_protocol, tcp_factory, \
+    CatascopiaExportException
+
+
+class LineProtocolExporter(Exporter):
+    """Ships samples as InfluxDB line protocol over TCP (persistent pooled connections, e.g. Telegraf
+       socket_listener or InfluxDB 1.x) or UDP, where each batch is split in datagrams of at most
+       max_datagram bytes on line boundaries
+    """
+
+    def __init__(self, host, port, protocol = 'tcp', pool_size = 4, timeout = 5.0, max_datagram = 1400):
+        if protocol not in ('tcp', 'udp'):
+            raise CatascopiaExportException('LineProtocolExporter protocol must be tcp or udp', retryable = False)
+        self.host = host
+        self.port = port
+        self.protocol = protocol
+        self.max_datagram = max_datagram
+        self.name = '%s://%s:%d' % (protocol, host, port)
+        if protocol == 'tcp':
+            self.pool = ConnectionPool(tcp_factory(host, port, timeout), pool_size)
+        else:
+            self.pool = ConnectionPool(self._udp_socket, pool_size)
+
+    def _udp_socket(self):
+        sock = socket.socket(socket.AF_INET6 if ':' in self.host else socket.AF_INET, socket.SOCK_DGRAM)
+        sock.connect((self.host, self.port))
+        return sock
+
+    def export(self, samples):
+        data = encode_line_protocol(samples)
+        if not data:
+            return 0
+        conn = self.pool.acquire()
+        try:
+            if self.protocol == 'tcp':
+                conn.sendall(data)
+            else:
+                for datagram in self._split(data):
+                    conn.send(datagram)
+        except OSError:
+            self.pool.release(conn, broken = True)
+            raise
+        self.pool.release(conn)
+        return len(data)
+
+    def _split(self, data):
+        limit = self.max_datagram
+        start = 0
+        end = len(data)
+        while start < end:
+            if end - start <= limit:
+                yield data[start:]
+                return
+            cut = data.rfind(b'\n', start, start + limit)
+            if cut < start:
+                # a single line longer than a datagram is sent on its own
+                cut = data.find(b'\n', start + limit)
+                cut = end - 1 if cut < 0 else cut
+            yield data[start:cut + 1]
+            start = cut + 1
+
+    def close(self):
+        self.pool.close()
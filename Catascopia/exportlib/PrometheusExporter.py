@@ -0,0 +1,177 @@
+import gzip
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+
+from Catascopia.exportlib.Exporter import Exporter
+
+
+class Snapshot(object):
+    """immutable exposition body rendered once, along with its gzip variant. Scrapes only read the snapshot
+       currently referenced by the server, writers replace the reference as a whole
+    """
+
+    __slots__ = ('body', 'gzipped', 'timestamp', 'series')
+
+    def __init__(self, body, compresslevel = 6, series = 0):
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel = compresslevel)
+        self.timestamp = time.time()
+        self.series = series
+
+
+class ExpositionHTTPServer(ThreadingHTTPServer):
+    """HTTP server answering GET path with the current Snapshot, gzipped if the scraper accepts it"""
+
+    daemon_threads = True
+    # room for bursts of concurrent scrapers connecting at once
+    request_queue_size = 128
+
+    def __init__(self, address, path = '/metrics'):
+        super(ExpositionHTTPServer, self).__init__(address, _MetricsHandler)
+        self.metrics_path = path
+        self.snapshot = Snapshot(b'')
+        self.scrapes = 0
+        self._thread = None
+
+    def start(self):
+        self._thread = Thread(target = self.serve_forever, name = 'ExpositionHTTPServer', daemon = True)
+        self._thread.start()
+        return self
+
+    def publish(self, snapshot):
+        self.snapshot = snapshot
+
+    def current(self):
+        return self.snapshot
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes, Nagle would hold the body back for the delayed ACK
+    disable_nagle_algorithm = True
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def do_GET(self):
+        self._respond(True)
+
+    def do_HEAD(self):
+        self._respond(False)
+
+    def _respond(self, send_body):
+        server = self.server
+        if self.path.split('?', 1)[0] != server.metrics_path:
+            self.send_error(404)
+            return
+        # a single reference read, the snapshot is never modified once published
+        snapshot = server.current()
+        server.scrapes += 1
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = snapshot.gzipped
+            self.send_header('Content-Encoding', 'gzip')
+        else:
+            body = snapshot.body
+        self.send_header('Content-Type', _MetricsHandler.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class PrometheusExporter(Exporter):
+    """Keeps the latest value of every series and serves it in the Prometheus text exposition format at
+       http://host:port/metrics, every metric as a gauge labelled with its probe and group.
+       Every exported batch is rendered once into a Snapshot, scrapes never touch the series.
+       The default port differs from the 9100 of node_exporter and the 9181 of ExpositionServer
+    """
+
+    DEFAULT_PORT = 9180
+
+    def __init__(self, host = '0.0.0.0', port = DEFAULT_PORT, prefix = 'catascopia_', compresslevel = 6):
+        self.prefix = prefix
+        self.compresslevel = compresslevel
+        # metric name -> {label string: (series, timestamp, val)}
+        self.families = dict()
+        self._lock = Lock()
+        self.server = ExpositionHTTPServer((host, port)).start()
+        self.host, self.port = self.server.server_address[:2]
+        self.name = 'prometheus://%s:%d' % (self.host, self.port)
+
+    def export(self, samples):
+        families = self.families
+        with self._lock:
+            for series, ts, val in samples:
+                if val is None or isinstance(val, bool) or not isinstance(val, (int, float)):
+                    continue
+                key = series.cache.get('prom')
+                if key is None:
+                    key = series.cache['prom'] = (sanitize(self.prefix + series.name), _labels(series))
+                family = families.get(key[0])
+                if family is None:
+                    family = families[key[0]] = dict()
+                family[key[1]] = (series, ts, val)
+            self.server.publish(Snapshot(self.render(), self.compresslevel, sum(len(f) for f in families.values())))
+        return 0
+
+    def render(self):
+        """method that returns the exposition text of the latest values as bytes"""
+        lines = []
+        for name in sorted(self.families):
+            family = self.families[name]
+            series = next(iter(family.values()))[0]
+            lines.append(family_header(name, series.desc or series.name))
+            for labels in sorted(family):
+                s, ts, val = family[labels]
+                lines.append('%s{%s} %s %d\n' % (name, labels, format_value(val), int(ts * 1000)))
+        return ''.join(lines).encode('utf-8')
+
+    def get_snapshot(self):
+        return self.server.snapshot
+
+    def get_address(self):
+        return self.host, self.port
+
+    def close(self):
+        self.server.close()
+
+
+_INVALID = re.compile(r'[^a-zA-Z0-9_:]')
+
+
+def sanitize(name):
+    """helper that maps a metric name to a valid Prometheus metric name"""
+    name = _INVALID.sub('_', name)
+    return '_' + name if name[:1].isdigit() else name
+
+
+def escape_label(s):
+    return str(s).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def family_header(name, help):
+    return '# HELP %s %s\n# TYPE %s gauge\n' % (name, str(help).replace('\\', '\\\\').replace('\n', '\\n'), name)
+
+
+def _labels(series):
+    labels = 'probe="%s"' % escape_label(series.probe)
+    if series.group is not None and series.group != series.probe:
+        labels += ',group="%s"' % escape_label(series.group)
+    return labels
+
+
+def format_value(val):
+    if val != val:
+        return 'NaN'
+    if val in (float('inf'), float('-inf')):
+        return '+Inf' if val > 0 else '-Inf'
+    return repr(float(val)) if isinstance(val, float) else str(val)
@@ -0,0 +1,61 @@
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric
+from Catascopia.ProcFS import get_backend
+
+
+class CPUProbe(Probe):
+    """Probe collecting host-level cpu utilization over the previous round, summed over every cpu and
+       expressed as a percentage of their total capacity
+    """
+
+    def __init__(self, name = "CPUProbe", periodicity = 5, backend = None):
+        super(CPUProbe, self).__init__(name, periodicity)
+
+        self.cpu_pct = SimpleMetric('cpu_pct', '%', 'host cpu utilization', 0, 100, higherIsBetter=False)
+        self.cpu_user_pct = SimpleMetric('cpu_user_pct', '%', 'host cpu time in user mode', 0, 100, higherIsBetter=False)
+        self.cpu_system_pct = SimpleMetric('cpu_system_pct', '%', 'host cpu time in kernel mode', 0, 100, higherIsBetter=False)
+        self.cpu_iowait_pct = SimpleMetric('cpu_iowait_pct', '%', 'host cpu time waiting for io', 0, 100, higherIsBetter=False)
+        self.cpu_steal_pct = SimpleMetric('cpu_steal_pct', '%', 'host cpu time stolen by the hypervisor', 0, 100, higherIsBetter=False)
+        self.cpu_count = SimpleMetric('cpu_count', '#', 'number of cpus', minVal=1)
+
+        self.add_metric(self.cpu_pct)
+        self.add_metric(self.cpu_user_pct)
+        self.add_metric(self.cpu_system_pct)
+        self.add_metric(self.cpu_iowait_pct)
+        self.add_metric(self.cpu_steal_pct)
+        self.add_metric(self.cpu_count)
+
+        self.backend = get_backend(backend)
+        # utilization is measured between samples, the first round reports the time since the probe started
+        self.prev = self.backend.cpu_times()
+
+    def get_desc(self):
+        return "CPUProbe collects host-level cpu utilization metrics..."
+
+    def collect(self):
+        cur = self.backend.cpu_times()
+        prev = self.prev
+        self.prev = cur
+        d = [c - p for c, p in zip(cur, prev)]
+        total = sum(d)
+        if total <= 0:
+            return
+        user, nice, system, idle, iowait, irq, softirq, steal = d
+        self.cpu_pct.set_val(100.0 * (total - idle - iowait) / total)
+        self.cpu_user_pct.set_val(100.0 * (user + nice) / total)
+        self.cpu_system_pct.set_val(100.0 * (system + irq + softirq) / total)
+        self.cpu_iowait_pct.set_val(100.0 * iowait / total)
+        self.cpu_steal_pct.set_val(100.0 * steal / total)
+        self.cpu_count.set_val(self.backend.cpu_count())
+
+    def cleanUp(self):
+        self.backend.close()
+
+def main():
+    p = CPUProbe()
+    p.set_debugmode(True)
+    p.set_logging()
+    p.activate()
+
+if __name__ == "__main__":
+    main()
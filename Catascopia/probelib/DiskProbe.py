@@ -0,0 +1,91 @@
+import os
+from time import monotonic
+
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric
+from Catascopia.ProcFS import get_backend, physical_disks
+
+
+class DiskProbe(Probe):
+    """Probe collecting host-level disk io rates over the previous round, summed over disks, plus the
+       space utilization of the filesystem holding path. By default disks are the whole physical block devices
+       (no partitions nor virtual loop, ram, zram, dm or md devices) where /sys/block is available and every
+       device elsewhere
+    """
+
+    def __init__(self, name = "DiskProbe", periodicity = 5, disks = None, path = '/', backend = None):
+        super(DiskProbe, self).__init__(name, periodicity)
+
+        self.disk_read_bytes = SimpleMetric('disk_read_bytes', 'B/s', 'bytes read from disks', minVal=0)
+        self.disk_write_bytes = SimpleMetric('disk_write_bytes', 'B/s', 'bytes written to disks', minVal=0)
+        self.disk_read_ops = SimpleMetric('disk_read_ops', 'ops/s', 'disk read operations', minVal=0)
+        self.disk_write_ops = SimpleMetric('disk_write_ops', 'ops/s', 'disk write operations', minVal=0)
+        self.disk_busy_pct = SimpleMetric('disk_busy_pct', '%', 'time the busiest disk spent doing io', 0, 100, higherIsBetter=False)
+        self.disk_used_pct = SimpleMetric('disk_used_pct', '%', 'space utilization of the filesystem holding ' + path, 0, 100, higherIsBetter=False)
+        self.disk_free = SimpleMetric('disk_free', 'B', 'free space of the filesystem holding ' + path, minVal=0)
+
+        self.add_metric(self.disk_read_bytes)
+        self.add_metric(self.disk_write_bytes)
+        self.add_metric(self.disk_read_ops)
+        self.add_metric(self.disk_write_ops)
+        self.add_metric(self.disk_busy_pct)
+        self.add_metric(self.disk_used_pct)
+        self.add_metric(self.disk_free)
+
+        self.path = path
+        self.backend = get_backend(backend)
+        if disks is None:
+            disks = physical_disks()
+        self.disks = None if disks is None else set(disks)
+        self.prev = self.backend.disk_io(self.disks)
+        self.prev_ts = monotonic()
+
+    def get_desc(self):
+        return "DiskProbe collects host-level disk io and space metrics..."
+
+    def collect(self):
+        cur = self.backend.disk_io(self.disks)
+        ts = monotonic()
+        elapsed = ts - self.prev_ts
+        prev = self.prev
+        self.prev = cur
+        self.prev_ts = ts
+
+        rb = wb = rc = wc = 0
+        busy = 0.0
+        for name, c in cur.items():
+            p = prev.get(name)
+            if p is None:
+                # device appeared this round
+                continue
+            rb += c.read_bytes - p.read_bytes
+            wb += c.write_bytes - p.write_bytes
+            rc += c.read_count - p.read_count
+            wc += c.write_count - p.write_count
+            busy = max(busy, c.busy_time - p.busy_time)
+        if elapsed > 0:
+            self.disk_read_bytes.set_val(rb / elapsed)
+            self.disk_write_bytes.set_val(wb / elapsed)
+            self.disk_read_ops.set_val(rc / elapsed)
+            self.disk_write_ops.set_val(wc / elapsed)
+            self.disk_busy_pct.set_val(min(100.0, 100.0 * busy / elapsed))
+
+        st = os.statvfs(self.path)
+        total = st.f_blocks * st.f_frsize
+        # like df, used space over the space available to unprivileged users
+        used = (st.f_blocks - st.f_bfree) * st.f_frsize
+        avail = st.f_bavail * st.f_frsize
+        self.disk_used_pct.set_val(100.0 * used / (used + avail) if used + avail else 0.0)
+        self.disk_free.set_val(avail)
+
+    def cleanUp(self):
+        self.backend.close()
+
+def main():
+    p = DiskProbe()
+    p.set_debugmode(True)
+    p.set_logging()
+    p.activate()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric
+from Catascopia.ProcFS import get_backend
+
+
+class MemoryProbe(Probe):
+
+    def __init__(self, name = "MemoryProbe", periodicity = 5, backend = None):
+        super(MemoryProbe, self).__init__(name, periodicity)
+
+        self.mem_total = SimpleMetric('mem_total', 'B', 'host physical memory', minVal=0)
+        self.mem_used = SimpleMetric('mem_used', 'B', 'host memory in use (total minus available)', minVal=0, higherIsBetter=False)
+        self.mem_available = SimpleMetric('mem_available', 'B', 'host memory available without swapping', minVal=0)
+        self.mem_cached = SimpleMetric('mem_cached', 'B', 'host memory used by buffers, page cache and reclaimable slab', minVal=0)
+        self.mem_pct = SimpleMetric('mem_pct', '%', 'host memory utilization', 0, 100, higherIsBetter=False)
+        self.swap_pct = SimpleMetric('swap_pct', '%', 'host swap utilization', 0, 100, higherIsBetter=False)
+
+        self.add_metric(self.mem_total)
+        self.add_metric(self.mem_used)
+        self.add_metric(self.mem_available)
+        self.add_metric(self.mem_cached)
+        self.add_metric(self.mem_pct)
+        self.add_metric(self.swap_pct)
+
+        self.backend = get_backend(backend)
+
+    def get_desc(self):
+        return "MemoryProbe collects host-level memory utilization metrics..."
+
+    def collect(self):
+        m = self.backend.memory()
+        self.mem_total.set_val(m.total)
+        self.mem_used.set_val(m.used)
+        self.mem_available.set_val(m.available)
+        self.mem_cached.set_val(m.buffers + m.cached)
+        self.mem_pct.set_val(100.0 * m.used / m.total if m.total else 0.0)
+        self.swap_pct.set_val(100.0 * m.swap_used / m.swap_total if m.swap_total else 0.0)
+
+    def cleanUp(self):
+        self.backend.close()
+
+def main():
+    p = MemoryProbe()
+    p.set_debugmode(True)
+    p.set_logging()
+    p.activate()
+
+if __name__ == "__main__":
+    main()
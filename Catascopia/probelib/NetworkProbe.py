@@ -0,0 +1,79 @@
+from time import monotonic
+
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric
+from Catascopia.ProcFS import get_backend
+
+
+class NetworkProbe(Probe):
+    """Probe collecting host-level network rates over the previous round, summed over nics,
+       by default every interface except loopback
+    """
+
+    def __init__(self, name = "NetworkProbe", periodicity = 5, nics = None, backend = None):
+        super(NetworkProbe, self).__init__(name, periodicity)
+
+        self.net_bytes_recv = SimpleMetric('net_bytes_recv', 'B/s', 'bytes received', minVal=0)
+        self.net_bytes_sent = SimpleMetric('net_bytes_sent', 'B/s', 'bytes sent', minVal=0)
+        self.net_packets_recv = SimpleMetric('net_packets_recv', 'pkts/s', 'packets received', minVal=0)
+        self.net_packets_sent = SimpleMetric('net_packets_sent', 'pkts/s', 'packets sent', minVal=0)
+        self.net_errors = SimpleMetric('net_errors', '#', 'receive and transmit errors in the round', minVal=0, higherIsBetter=False)
+        self.net_drops = SimpleMetric('net_drops', '#', 'dropped incoming and outgoing packets in the round', minVal=0, higherIsBetter=False)
+
+        self.add_metric(self.net_bytes_recv)
+        self.add_metric(self.net_bytes_sent)
+        self.add_metric(self.net_packets_recv)
+        self.add_metric(self.net_packets_sent)
+        self.add_metric(self.net_errors)
+        self.add_metric(self.net_drops)
+
+        self.backend = get_backend(backend)
+        self.nics = None if nics is None else set(nics)
+        self.prev = self._counters()
+        self.prev_ts = monotonic()
+
+    def get_desc(self):
+        return "NetworkProbe collects host-level network traffic metrics..."
+
+    def _counters(self):
+        counters = self.backend.net_io(self.nics)
+        if self.nics is None:
+            counters.pop('lo', None)
+        return counters
+
+    def collect(self):
+        cur = self._counters()
+        ts = monotonic()
+        elapsed = ts - self.prev_ts
+        prev = self.prev
+        self.prev = cur
+        self.prev_ts = ts
+
+        d = [0] * 8
+        for name, c in cur.items():
+            p = prev.get(name)
+            if p is None:
+                # interface appeared this round
+                continue
+            for i in range(8):
+                d[i] += c[i] - p[i]
+        bytes_recv, packets_recv, errin, dropin, bytes_sent, packets_sent, errout, dropout = d
+        if elapsed > 0:
+            self.net_bytes_recv.set_val(bytes_recv / elapsed)
+            self.net_bytes_sent.set_val(bytes_sent / elapsed)
+            self.net_packets_recv.set_val(packets_recv / elapsed)
+            self.net_packets_sent.set_val(packets_sent / elapsed)
+        self.net_errors.set_val(errin + errout)
+        self.net_drops.set_val(dropin + dropout)
+
+    def cleanUp(self):
+        self.backend.close()
+
+def main():
+    p = NetworkProbe()
+    p.set_debugmode(True)
+    p.set_logging()
+    p.activate()
+
+if __name__ == "__main__":
+    main()
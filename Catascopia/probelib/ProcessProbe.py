@@ -1,16 +1,23 @@
-import psutil
-from time import time
+import os
+from time import time, monotonic
 
 from Catascopia.Probe import Probe
 from Catascopia.Metrics import SimpleMetric
+from Catascopia.ProcFS import get_backend, CatascopiaProcessGoneException
 
 # use pid param if the monitored process different from the current process
+# use pids param (and/or children=True) to monitor a set of processes or a process tree with one probe
 
 class ProcessProbe(Probe):
+    """Probe collecting process-level utilization metrics. cpu_pct is the utilization since the previous
+       round, computed from cpu time deltas without blocking. Watching a PID set or a process tree, the
+       probe samples every process in one pass, follows processes appearing and disappearing, and emits
+       the aggregated metrics plus <metric>__<pid> metrics per process.
+       backend is 'procfs' (Linux /proc reader), 'psutil' or None for the fastest available
+    """
 
-    __PROC_TIMESTEP__ = 0.2
-
-    def __init__(self, name = "ProcessProbe", periodicity = 5, pid = None):
+    def __init__(self, name = "ProcessProbe", periodicity = 5, pid = None, pids = None, children = False,
+                 per_process = None, backend = None):
         super(ProcessProbe, self).__init__(name, periodicity)
 
         self.cpu_pct = SimpleMetric('cpu_pct', '%', 'process-level cpu utilization', minVal=0, higherIsBetter=False)
@@ -27,25 +34,144 @@ class ProcessProbe(Probe):
         self.add_metric(self.probe_alive_time)
         self.add_metric(self.mem_pct)
 
-        self.proc = psutil.Process(pid)
+        # root pids, processes of the tree below them are added when children is set
+        self.pids = [pid] if pids is None else list(pids)
+        self.children = children
+        self.multi = pids is not None or children
+        self.per_process = self.multi if per_process is None else per_process
+        if self.multi:
+            self.num_procs = SimpleMetric('num_procs', '#', 'number of monitored processes', minVal=0)
+            self.add_metric(self.num_procs)
+
+        self.backend = get_backend(backend)
+        self.mem_total = self.backend.memory().total
+        # pid -> [reader, cpu time, monotonic time] of the previous sample, cpu_pct is measured between samples
+        self.procs = dict()
+        if self.multi:
+            self._refresh_procs()
+        else:
+            # the single process of the legacy mode must exist
+            self.proc = self.backend.process(pid)
+            self.procs[self.proc.pid] = self._first_sample(self.proc)
         self.col_start = time()
 
     def get_desc(self):
         return "ProcessProbe collects process-level utilization metrics..."
 
+    def get_pids(self):
+        return list(self.procs.keys())
+
+    def add_pid(self, pid):
+        """method that adds a root pid, picked up on the next round"""
+        if pid not in self.pids:
+            self.pids.append(pid)
+
+    def remove_pid(self, pid):
+        if pid in self.pids:
+            self.pids.remove(pid)
+
+    def get_backend(self):
+        return self.backend
+
+    def _wanted_pids(self):
+        roots = [os.getpid() if p is None else p for p in self.pids]
+        if not self.children:
+            return roots
+        wanted = list(roots)
+        for root in roots:
+            wanted.extend(self.backend.descendants(root))
+        return wanted
+
+    @staticmethod
+    def _first_sample(reader):
+        # primes the cpu time delta, the first utilization gets reported next round
+        s = reader.sample()
+        return [reader, s.user + s.system, monotonic()]
+
+    def _refresh_procs(self):
+        procs = self.procs
+        wanted = set(self._wanted_pids())
+        for pid in list(procs):
+            # exited processes are dropped by collect() on NoSuchProcess
+            if pid not in wanted:
+                self._drop_proc(pid)
+        for pid in wanted:
+            if pid not in procs:
+                try:
+                    procs[pid] = self._first_sample(self.backend.process(pid))
+                except (CatascopiaProcessGoneException, PermissionError):
+                    continue
+                if self.per_process:
+                    self._add_proc_metrics(pid)
+
+    def _add_proc_metrics(self, pid):
+        suffix = '__' + str(pid)
+        self.add_metric(SimpleMetric('cpu_pct' + suffix, '%', 'cpu utilization of process ' + str(pid), minVal=0,
+                                     higherIsBetter=False))
+        self.add_metric(SimpleMetric('cpu_time' + suffix, 's', 'cpu time of process ' + str(pid), minVal=0,
+                                     higherIsBetter=False))
+        self.add_metric(SimpleMetric('mem_pct' + suffix, '%', 'memory utilization of process ' + str(pid), minVal=0,
+                                     higherIsBetter=False))
+
+    def _drop_proc(self, pid):
+        state = self.procs.pop(pid, None)
+        if state is None:
+            return
+        state[0].close()
+        if self.per_process:
+            suffix = '__' + str(pid)
+            for name in ('cpu_pct', 'cpu_time', 'mem_pct'):
+                self.remove_metric(name + suffix)
+
     def collect(self):
-        self.cpu_pct.set_val(self.proc.cpu_percent(interval=ProcessProbe.__PROC_TIMESTEP__))
-        # user+sys including child threads
-        ct = self.proc.cpu_times()
-        self.cpu_time.set_val(sum(ct[:4]))
-        try:
-           self.io_time.set_val(ct[4])
-        except IndexError:
-            pass # not a Linux OS, so no io_time counter
-
-        self.alive_time.set_val(time() - self.proc.create_time())
-        self.probe_alive_time.set_val(time() - self.col_start)
-        self.mem_pct.set_val(self.proc.memory_percent())
+        if self.multi:
+            self._refresh_procs()
+        now = time()
+        cpu_pct = cpu_time = io_time = mem_pct = 0.0
+        alive_time = 0.0
+        gone = []
+        for pid, state in self.procs.items():
+            try:
+                sample = state[0].sample()
+            except (CatascopiaProcessGoneException, PermissionError):
+                if not self.multi:
+                    raise
+                gone.append(pid)
+                continue
+            ts = monotonic()
+            busy = sample.user + sample.system
+            pct = 100.0 * (busy - state[1]) / (ts - state[2]) if ts > state[2] else 0.0
+            state[1] = busy
+            state[2] = ts
+            # user+sys including child threads
+            t = busy + sample.children_user + sample.children_system
+            mem = 100.0 * sample.rss / self.mem_total
+            cpu_pct += pct
+            cpu_time += t
+            mem_pct += mem
+            io_time += sample.iowait
+            alive_time = max(alive_time, now - sample.create_time)
+            if self.per_process:
+                suffix = '__' + str(pid)
+                self.metrics['cpu_pct' + suffix].set_val(pct)
+                self.metrics['cpu_time' + suffix].set_val(t)
+                self.metrics['mem_pct' + suffix].set_val(mem)
+        for pid in gone:
+            self._drop_proc(pid)
+
+        self.cpu_pct.set_val(cpu_pct)
+        self.cpu_time.set_val(cpu_time)
+        self.io_time.set_val(io_time)
+        self.alive_time.set_val(alive_time)
+        self.probe_alive_time.set_val(now - self.col_start)
+        self.mem_pct.set_val(mem_pct)
+        if self.multi:
+            self.num_procs.set_val(len(self.procs))
+
+    def cleanUp(self):
+        for pid in list(self.procs):
+            self._drop_proc(pid)
+        self.backend.close()
 
 def main():
     p = ProcessProbe()
@@ -54,4 +180,4 @@ def main():
     p.activate()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
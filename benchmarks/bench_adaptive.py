@@ -0,0 +1,69 @@
+"""Rounds collected by a fixed versus an adaptive periodicity over a simulated hour with a five minute incident
+
+The simulated metric is flat with 1% noise, except during the incident when it swings by up to 10x.
+Rounds are driven on a simulated clock, no time is actually spent waiting.
+
+usage: python -m benchmarks.bench_adaptive [--duration 3600] [--incident 1800 300] [--min 1] [--max 60]
+"""
+import argparse
+import random
+
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric
+
+
+class SyntheticProbe(Probe):
+
+    def __init__(self, incident, periodicity):
+        super(SyntheticProbe, self).__init__('SyntheticProbe', periodicity)
+        self.load = SimpleMetric('load', '#', 'simulated load', minVal = 0)
+        self.add_metric(self.load)
+        self.incident = incident
+        self.now = 0.0
+
+    def get_desc(self):
+        return "SyntheticProbe collects a simulated metric..."
+
+    def collect(self):
+        start, length = self.incident
+        base = 10.0
+        if start <= self.now < start + length:
+            base *= random.uniform(1, 10)
+        self.load.set_val(base * random.uniform(0.99, 1.01))
+
+
+def simulate(probe, duration, incident):
+    rounds = in_incident = 0
+    start, length = incident
+    while probe.now < duration:
+        probe.collect()
+        probe._adapt()
+        rounds += 1
+        if start <= probe.now < start + length:
+            in_incident += 1
+        probe.now += probe.get_periodicity()
+    return rounds, in_incident
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--duration', type = float, default = 3600)
+    parser.add_argument('--incident', type = float, nargs = 2, default = [1800, 300])
+    parser.add_argument('--min', type = float, default = 1)
+    parser.add_argument('--max', type = float, default = 60)
+    args = parser.parse_args()
+    random.seed(1)
+
+    print('%-28s %10s %18s' % ('periodicity', 'rounds', 'incident rounds'))
+    for period in (args.min, 10, args.max):
+        rounds, hits = simulate(SyntheticProbe(args.incident, period), args.duration, args.incident)
+        print('%-28s %10d %18d' % ('fixed %gs' % period, rounds, hits))
+    probe = SyntheticProbe(args.incident, args.min)
+    probe.set_adaptive(args.min, args.max)
+    rounds, hits = simulate(probe, args.duration, args.incident)
+    print('%-28s %10d %18d' % ('adaptive %g-%gs' % (args.min, args.max), rounds, hits))
+    print(probe.get_adaptive().get_stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Cold start time and import footprint of the ProbeAgent with 1 vs 50 configured probes
+
+Every run is a fresh interpreter importing the agent, starting the probes of a generated JSON config
+and shutting down. Reports the process wall time (median of --repeat runs), the time to import
+Catascopia.Agent and to start the probes, the modules imported and the RSS once started, next to a bare
+interpreter. The '50 configured, 1 enabled' config shows that disabled probes cost nothing at startup.
+
+usage: python -m benchmarks.bench_agent [--repeat 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+PROBES = ('CPUProbe', 'MemoryProbe', 'NetworkProbe', 'DiskProbe', 'ProcessProbe')
+
+
+def make_config(nprobes, enabled):
+    return {'workers': 4,
+            'probes': [{'name': 'probe%d' % i, 'class': PROBES[i % len(PROBES)], 'periodicity': 60,
+                        'enabled': i < enabled} for i in range(nprobes)]}
+
+
+def child(path):
+    """runs in the measured interpreter, prints its figures as JSON"""
+    modules = len(sys.modules)
+    start = time.perf_counter()
+    from Catascopia.Agent import ProbeAgent
+    imported = time.perf_counter()
+    agent = ProbeAgent(path).start()
+    started = time.perf_counter()
+    stats = agent.get_stats()
+    rss = 0
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss = int(line.split()[1]) / 1024.0
+    agent.shutdown()
+    print(json.dumps({'import': imported - start, 'start': started - imported, 'modules': len(sys.modules) - modules,
+                      'running': stats['running'], 'probe_imports': stats['imported'], 'rss': rss}))
+
+
+def measure(args, repeat):
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable] + args, stdout = subprocess.PIPE, check = True).stdout
+        wall = time.perf_counter() - start
+        figures = json.loads(out.decode()) if out.strip() else {}
+        figures['wall'] = wall
+        runs.append(figures)
+    runs.sort(key = lambda r: r['wall'])
+    return runs[len(runs) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--child')
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    folder = tempfile.mkdtemp()
+    print('%-26s %9s %9s %9s %8s %14s %8s' % ('config', 'wall ms', 'import ms', 'start ms', 'modules',
+                                              'probes/classes', 'RSS MB'))
+    bare = measure(['-c', 'pass'], args.repeat)
+    print('%-26s %9.1f' % ('bare interpreter', bare['wall'] * 1e3))
+    for label, nprobes, enabled in (('1 probe', 1, 1), ('50 probes', 50, 50), ('50 configured, 1 enabled', 50, 1)):
+        path = os.path.join(folder, 'agent-%d-%d.json' % (nprobes, enabled))
+        with open(path, 'w') as f:
+            json.dump(make_config(nprobes, enabled), f)
+        r = measure(['-m', 'benchmarks.bench_agent', '--child', path], args.repeat)
+        print('%-26s %9.1f %9.1f %9.1f %8d %14s %8.1f' % (label, r['wall'] * 1e3, r['import'] * 1e3,
+                                                          r['start'] * 1e3, r['modules'],
+                                                          '%d/%d' % (r['running'], r['probe_imports']), r['rss']))
+        os.remove(path)
+    os.rmdir(folder)
+
+if __name__ == "__main__":
+    main()
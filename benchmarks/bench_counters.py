@@ -0,0 +1,56 @@
+"""Update throughput of counters and histograms incremented from 1, 4 and 16 threads
+
+usage: python -m benchmarks.bench_counters [--threads 1 4 16] [--updates 200000]
+"""
+import argparse
+import threading
+import time
+
+from Catascopia.Metrics import CounterMetric, ConcurrentCounterMetric, ConcurrentHistogramMetric
+
+
+def run_threads(nthreads, updates, update):
+    start = threading.Barrier(nthreads + 1)
+
+    def worker():
+        start.wait()
+        for _ in range(updates):
+            update()
+
+    threads = [threading.Thread(target = worker) for _ in range(nthreads)]
+    for t in threads:
+        t.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--threads', type = int, nargs = '+', default = [1, 4, 16])
+    parser.add_argument('--updates', type = int, default = 200000, help = 'updates per thread')
+    args = parser.parse_args()
+
+    print('%-28s %8s %14s %10s' % ('metric', 'threads', 'updates/s', 'correct'))
+    for n in args.threads:
+        expected = n * args.updates
+
+        c = CounterMetric('c', '#', 'locked counter', reset = False)
+        elapsed = run_threads(n, args.updates, c.inc)
+        print('%-28s %8d %14.0f %10s' % ('CounterMetric (locked)', n, expected / elapsed, c.get_val() == expected))
+
+        cc = ConcurrentCounterMetric('cc')
+        elapsed = run_threads(n, args.updates, cc.inc)
+        print('%-28s %8d %14.0f %10s' % ('ConcurrentCounterMetric', n, expected / elapsed,
+                                         cc.get_count() == expected))
+
+        h = ConcurrentHistogramMetric('h')
+        elapsed = run_threads(n, args.updates, lambda: h.observe(0.003))
+        print('%-28s %8d %14.0f %10s' % ('ConcurrentHistogramMetric', n, expected / elapsed,
+                                         h.get_histogram()['count'] == expected))
+
+
+if __name__ == "__main__":
+    main()
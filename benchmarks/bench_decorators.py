@@ -0,0 +1,84 @@
+"""Per-call overhead of the CatascopiaDecorators versus an undecorated function
+
+usage: python -m benchmarks.bench_decorators [--calls 200000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from Catascopia.Decorators import CatascopiaDecorators
+from Catascopia.Metrics import SimpleMetric
+
+
+def workload():
+    return 1
+
+
+async def async_workload():
+    return 1
+
+
+def legacy_timeit(f, path):
+    # the former implementation: a SimpleMetric and a synchronous open/write/close per call
+    def wrap(*args, **kw):
+        ts = time.time()
+        result = f(*args, **kw)
+        te = time.time()
+        m = SimpleMetric("time__%s" % f.__name__, 's', 'Execution duration from %s' % f.__name__, minVal = 0.0,
+                         higherIsBetter = False)
+        m.set_val(te - ts)
+        with open(path, mode = 'a', encoding = 'utf-8') as file:
+            file.write(json.dumps(m.to_dict()) + os.linesep)
+        return result
+    return wrap
+
+
+def per_call(f, calls):
+    t = time.perf_counter()
+    for _ in range(calls):
+        f()
+    return (time.perf_counter() - t) / calls * 1e9
+
+
+def per_await(f, calls):
+    async def loop():
+        t = time.perf_counter()
+        for _ in range(calls):
+            await f()
+        return (time.perf_counter() - t) / calls * 1e9
+    return asyncio.run(loop())
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--calls', type = int, default = 200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'metrics.jsonl')
+        bare = per_call(workload, args.calls)
+        print('%-34s %12s' % ('decorator', 'overhead ns'))
+        # the legacy path hits the file system on every call, keep it short
+        legacy = per_call(legacy_timeit(workload, path), max(1, args.calls // 20))
+        print('%-34s %12.0f' % ('legacy synchronous file write', legacy - bare))
+        print('%-34s %12.0f' % ('countit', per_call(CatascopiaDecorators.countit(workload), args.calls) - bare))
+        print('%-34s %12.0f' % ('errorrate', per_call(CatascopiaDecorators.errorrate(workload), args.calls) - bare))
+        print('%-34s %12.0f' % ('timeit, probe only', per_call(CatascopiaDecorators.timeit(workload), args.calls)
+                                - bare))
+        bare_async = per_await(async_workload, args.calls)
+        print('%-34s %12.0f' % ('timeit coroutine, probe only',
+                                per_await(CatascopiaDecorators.timeit(async_workload), args.calls) - bare_async))
+        for label, kw in (('timeit + file sink, line per call', {}),
+                          ('timeit + file sink, 10% sampled', {'sample_rate': 0.1}),
+                          ('timeit + file sink, histograms', {'aggregate': True})):
+            CatascopiaDecorators.configure(path = path, **kw)
+            decorated = CatascopiaDecorators.timeit(workload)
+            print('%-34s %12.0f' % (label, per_call(decorated, args.calls) - bare))
+            CatascopiaDecorators.get_sink().close()
+
+
+if __name__ == "__main__":
+    main()
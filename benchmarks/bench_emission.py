@@ -0,0 +1,68 @@
+"""Per-round emission cost of a probe with 50 metrics: str(metric) per metric versus one batch per round
+
+usage: python -m benchmarks.bench_emission [--metrics 50] [--rounds 20000]
+"""
+import argparse
+import ast
+import time
+from queue import Queue
+
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric
+from Catascopia.Batch import JSONLinesSerializer, MsgpackSerializer, StructSerializer, decode_batch
+
+
+class ManyMetricsProbe(Probe):
+
+    def __init__(self, nmetrics):
+        super(ManyMetricsProbe, self).__init__('ManyMetricsProbe', 1)
+        for i in range(nmetrics):
+            # finite bounds so the legacy str(dict) stays ast.literal_eval friendly
+            m = SimpleMetric('metric%d' % i, '#', 'dummy metric', 0, 1e9)
+            m.set_val(i * 1.5)
+            self.add_metric(m)
+
+    def get_desc(self):
+        return "ManyMetricsProbe holds many static metrics"
+
+    def collect(self):
+        pass
+
+
+def bench(probe, rounds, consume):
+    q = probe.attachQueue(Queue())
+    t = time.perf_counter()
+    for _ in range(rounds):
+        probe._emit(time.time())
+    emit = time.perf_counter() - t
+    items = []
+    while not q.empty():
+        items.append(q.get_nowait())
+    t = time.perf_counter()
+    for item in items:
+        consume(item)
+    decode = time.perf_counter() - t
+    size = sum(len(i) if isinstance(i, (bytes, str)) else 0 for i in items) / rounds
+    return emit / rounds * 1e6, decode / rounds * 1e6, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--metrics', type = int, default = 50)
+    parser.add_argument('--rounds', type = int, default = 20000)
+    args = parser.parse_args()
+
+    probe = ManyMetricsProbe(args.metrics)
+    print('%-16s %14s %14s %12s' % ('emission', 'emit us/round', 'decode us/round', 'bytes/round'))
+    probe.set_batching(False)
+    print('%-16s %14.2f %14.2f %12.0f' % (('str(metric)',) + bench(probe, args.rounds, ast.literal_eval)))
+    probe.set_batching(True)
+    print('%-16s %14.2f %14.2f %12s' % (('MetricBatch',) + bench(probe, args.rounds, decode_batch)[:2] + ('-',)))
+    for serializer in (JSONLinesSerializer(), MsgpackSerializer(), StructSerializer()):
+        probe.set_batching(True, serializer)
+        print('%-16s %14.2f %14.2f %12.0f' % ((type(serializer).__name__,) +
+                                               bench(probe, args.rounds, serializer.decode)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Export throughput in samples/second against local stand-in servers
+
+A probe with --metrics metrics emits --rounds batches into an ExportPipeline, timed until the stand-in
+server has received every sample. The servers count the lines they receive (decompressing gzip bodies),
+the flaky HTTP server answers 503 to one in five requests to exercise the retries.
+
+usage: python -m benchmarks.bench_exporters [--metrics 500] [--rounds 400] [--batch 5000] [--scrapes 200]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import urllib.request
+
+from Catascopia.exportlib.ExportPipeline import ExportPipeline
+from Catascopia.exportlib.LineProtocolExporter import LineProtocolExporter
+from Catascopia.exportlib.HttpExporter import HttpExporter
+from Catascopia.exportlib.PrometheusExporter import PrometheusExporter
+from Catascopia.exportlib.FileExporter import FileExporter
+from tests.servers import SyntheticProbe, tcp_server, udp_server, http_server
+
+
+def run(exporter, received, nmetrics, rounds, batch_size):
+    probe = SyntheticProbe(nmetrics)
+    pipeline = ExportPipeline([exporter], batch_size = batch_size, flush_interval = 0.05, backoff = 0.01)
+    pipeline.add_probe(probe)
+    pipeline.start()
+    expected = nmetrics * rounds
+    if received is None:
+        # a pull or file exporter has a sample once the pipeline shipped it
+        received = lambda: pipeline.get_stats()[exporter.name]['samples']
+    t = time.perf_counter()
+    for _ in range(rounds):
+        probe.collect()
+        probe._emit(time.time())
+    end = time.time() + 30
+    while received() < expected and time.time() < end:
+        time.sleep(0.001)
+    elapsed = time.perf_counter() - t
+    got = received()
+    pipeline.shutdown()
+    stats = pipeline.get_stats()[exporter.name]
+    return got / elapsed, got, expected, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--metrics', type = int, default = 500)
+    parser.add_argument('--rounds', type = int, default = 400)
+    parser.add_argument('--batch', type = int, default = 5000)
+    parser.add_argument('--scrapes', type = int, default = 200)
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix = 'bench_exporters')
+    tcp = tcp_server()
+    udp = udp_server()
+    http = http_server()
+    flaky = http_server(fail_every = 5)
+    try:
+        cases = [('line protocol tcp', lambda: LineProtocolExporter('127.0.0.1', tcp.server_address[1]),
+                  lambda: tcp.counter.lines),
+                 ('line protocol udp', lambda: LineProtocolExporter('127.0.0.1', udp.server_address[1], 'udp'),
+                  lambda: udp.counter.lines),
+                 ('http json', lambda: HttpExporter('http://127.0.0.1:%d/write' % http.server_address[1]),
+                  lambda: http.counter.lines),
+                 ('http line gzip', lambda: HttpExporter('http://127.0.0.1:%d/write' % http.server_address[1],
+                                                         'line', compression = True),
+                  lambda: http.counter.lines),
+                 ('http json, 20% 503', lambda: HttpExporter('http://127.0.0.1:%d/write' % flaky.server_address[1]),
+                  lambda: flaky.counter.lines),
+                 ('file json', lambda: FileExporter(os.path.join(folder, 'metrics.json')), None),
+                 ('file line gzip', lambda: FileExporter(os.path.join(folder, 'metrics.gz'), 'line', True), None)]
+
+        print('%-22s %14s %12s %9s %8s %9s' % ('exporter', 'samples/s', 'received', 'batches', 'retries', 'MB sent'))
+        for label, make, count in cases:
+            http.counter.lines = flaky.counter.lines = 0
+            rate, got, expected, stats = run(make(), count, args.metrics, args.rounds, args.batch)
+            print('%-22s %14.0f %5d/%-6d %9d %8d %9.2f' % (label, rate, got // args.metrics, expected // args.metrics,
+                                                            stats['batches'], stats['retries'],
+                                                            stats['bytes'] / 1e6))
+
+        prom = PrometheusExporter('127.0.0.1', 0)
+        rate, got, expected, stats = run(prom, None, args.metrics, args.rounds, args.batch)
+        print('%-22s %14.0f %5d/%-6d %9d %8d' % ('prometheus ingest', rate, got // args.metrics,
+                                                 expected // args.metrics, stats['batches'], stats['retries']))
+        # shutting the pipeline down closed the server, scrapes run against a fresh exporter
+        prom = PrometheusExporter('127.0.0.1', 0)
+        pipeline = ExportPipeline([prom], flush_interval = 0.01)
+        probe = SyntheticProbe(args.metrics)
+        pipeline.add_probe(probe)
+        pipeline.start()
+        probe.collect()
+        probe._emit(time.time())
+        while pipeline.get_stats()[prom.name]['samples'] < args.metrics:
+            time.sleep(0.001)
+        url = 'http://127.0.0.1:%d/metrics' % prom.get_address()[1]
+        t = time.perf_counter()
+        for _ in range(args.scrapes):
+            urllib.request.urlopen(url).read()
+        elapsed = time.perf_counter() - t
+        print('%-22s %14.0f   (%d scrapes/s of %d series)' % ('prometheus scrape', args.scrapes * args.metrics / elapsed,
+                                                             args.scrapes / elapsed, args.metrics))
+        pipeline.shutdown()
+    finally:
+        shutil.rmtree(folder)
+        for server in (tcp, udp, http, flaky):
+            server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
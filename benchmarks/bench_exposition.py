@@ -0,0 +1,100 @@
+"""Scrape latency of the exposition endpoint under concurrent scrapers
+
+--probes probes of --metrics metrics each collect every --period seconds on a ProbeScheduler while
+--concurrency client processes scrape over keep-alive connections for --duration seconds.
+The snapshot endpoint is compared with rendering the probes on every scrape.
+
+usage: python -m benchmarks.bench_exposition [--probes 10] [--metrics 200] [--period 0.1] [--duration 3]
+                                             [--concurrency 1,4,16] [--gzip]
+"""
+import argparse
+import http.client
+import multiprocessing
+import time
+
+from Catascopia.Scheduler import ProbeScheduler
+from Catascopia.exportlib.ExpositionServer import ExpositionServer
+from Catascopia.exportlib.PrometheusExporter import _MetricsHandler
+from tests.servers import SyntheticProbe
+
+
+class _RenderOnScrapeHandler(_MetricsHandler):
+    """baseline re-rendering every attached probe before answering, as a consumer draining the queue would"""
+
+    def _respond(self, send_body):
+        exposition = self.server.exposition
+        for probe in exposition.probes:
+            exposition.refresh(probe)
+        exposition._publish()
+        super(_RenderOnScrapeHandler, self)._respond(send_body)
+
+
+def scraper(args):
+    port, duration, gzip = args
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    headers = {'Accept-Encoding': 'gzip'} if gzip else {}
+    latencies = []
+    size = 0
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        t = time.perf_counter()
+        conn.request('GET', '/metrics', headers = headers)
+        size = len(conn.getresponse().read())
+        latencies.append(time.perf_counter() - t)
+    conn.close()
+    return latencies, size
+
+
+def percentile(sorted_vals, q):
+    return sorted_vals[min(int(q * len(sorted_vals)), len(sorted_vals) - 1)]
+
+
+def bench(nprobes, nmetrics, period, duration, concurrency, gzip, on_scrape):
+    exposition = ExpositionServer('127.0.0.1', 0)
+    if on_scrape:
+        exposition.server.RequestHandlerClass = _RenderOnScrapeHandler
+        exposition.server.exposition = exposition
+    scheduler = ProbeScheduler()
+    for i in range(nprobes):
+        probe = SyntheticProbe(nmetrics)
+        probe.name = 'SyntheticProbe%d' % i
+        probe.set_periodicity(period)
+        probe.collect()
+        if not on_scrape:
+            exposition.add_probe(probe)
+        else:
+            exposition.probes.append(probe)
+        scheduler.add_probe(probe)
+    scheduler.start()
+    for probe in scheduler.get_probes():
+        probe.activate()
+    with multiprocessing.Pool(concurrency) as pool:
+        results = pool.map(scraper, [(exposition.port, duration, gzip)] * concurrency)
+    scheduler.shutdown()
+    exposition.close()
+    latencies = sorted(l for r in results for l in r[0])
+    return (len(latencies) / duration, percentile(latencies, 0.5) * 1e3, percentile(latencies, 0.99) * 1e3,
+            latencies[-1] * 1e3, results[0][1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--probes', type = int, default = 10)
+    parser.add_argument('--metrics', type = int, default = 200)
+    parser.add_argument('--period', type = float, default = 0.1)
+    parser.add_argument('--duration', type = float, default = 3)
+    parser.add_argument('--concurrency', default = '1,4,16')
+    parser.add_argument('--gzip', action = 'store_true')
+    args = parser.parse_args()
+
+    print('%d series, %d cpus' % (args.probes * args.metrics, multiprocessing.cpu_count()))
+    print('%-18s %11s %10s %10s %10s %10s %10s' % ('endpoint', 'scrapers', 'scrapes/s', 'p50 ms', 'p99 ms',
+                                                  'max ms', 'bytes'))
+    for label, on_scrape in (('snapshot', False), ('render on scrape', True)):
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            rate, p50, p99, worst, size = bench(args.probes, args.metrics, args.period, args.duration, concurrency,
+                                                args.gzip, on_scrape)
+            print('%-18s %11d %10.0f %10.2f %10.2f %10.2f %10d' % (label, concurrency, rate, p50, p99, worst, size))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Bandwidth saved by emission filters on a mostly idle probe
+
+The probe holds --metrics metrics: 80% constant, 15% drifting by 0.1% per round and 5% noisy by +-10%.
+Every configuration emits --rounds batches encoded with the JSONLinesSerializer.
+
+usage: python -m benchmarks.bench_filters [--metrics 200] [--rounds 2000]
+"""
+import argparse
+import random
+import time
+from queue import Queue
+
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric
+from Catascopia.Batch import JSONLinesSerializer
+
+
+class IdleHostProbe(Probe):
+
+    def __init__(self, nmetrics):
+        super(IdleHostProbe, self).__init__('IdleHostProbe', 1)
+        self.kinds = []
+        for i in range(nmetrics):
+            m = SimpleMetric('metric%d' % i, '#', 'dummy metric', 0)
+            m.set_val(100.0)
+            self.add_metric(m)
+            r = i % 20
+            self.kinds.append((m, 'const' if r < 16 else 'drift' if r < 19 else 'noise'))
+
+    def get_desc(self):
+        return "IdleHostProbe holds mostly constant metrics"
+
+    def collect(self):
+        for m, kind in self.kinds:
+            if kind == 'drift':
+                m.set_val(m.get_val() * 1.001)
+            elif kind == 'noise':
+                m.set_val(100.0 * random.uniform(0.9, 1.1))
+
+
+def bench(nmetrics, rounds, **filter):
+    random.seed(1)
+    probe = IdleHostProbe(nmetrics)
+    if filter:
+        probe.set_emission_filter(**filter)
+    probe.set_batching(True, JSONLinesSerializer())
+    q = probe.attachQueue(Queue())
+    size = 0
+    emit = 0.0
+    for _ in range(rounds):
+        probe.collect()
+        t = time.perf_counter()
+        probe._emit(time.time())
+        emit += time.perf_counter() - t
+        size += len(q.get_nowait())
+    stats = probe.get_emission_stats()
+    return emit / rounds * 1e6, size / rounds, stats['suppression_ratio']
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--metrics', type = int, default = 200)
+    parser.add_argument('--rounds', type = int, default = 2000)
+    args = parser.parse_args()
+
+    print('%-34s %14s %12s %12s' % ('filter', 'emit us/round', 'bytes/round', 'suppressed'))
+    # rounds run back to back, a few hundred microseconds each, so the heartbeat is set in milliseconds
+    for label, filter in (('none', {}),
+                          ('on change', {'on_change': True}),
+                          ('on change, heartbeat 10ms', {'on_change': True, 'heartbeat': 0.01}),
+                          ('deadband 1%', {'relative': 0.01}),
+                          ('deadband 1%, heartbeat 10ms', {'relative': 0.01, 'heartbeat': 0.01}),
+                          ('deadband 5 absolute', {'deadband': 5})):
+        emit, size, ratio = bench(args.metrics, args.rounds, **filter)
+        print('%-34s %14.2f %12.0f %11.1f%%' % (label, emit, size, 100 * ratio))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Load shedding and restore by the OverheadGovernor under a CPU budget
+
+--probes probes (half of them LOW priority, one HIGH) burn --work ms of CPU per round every --period
+seconds on a ProbeScheduler, well above the --budget % of one core. After --duration seconds their
+rounds become cheap, the load drops and the governor restores the steps it shed. Prints the measured
+overhead, the steps applied and the periodicity of every probe at each evaluation.
+
+usage: python -m benchmarks.bench_governor [--probes 4] [--work 2] [--period 0.05] [--budget 5] [--duration 6]
+"""
+import argparse
+import time
+
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric, Priority
+from Catascopia.Scheduler import ProbeScheduler
+from Catascopia.Governor import OverheadGovernor, ShedAction
+
+
+class BusyProbe(Probe):
+    """collector spending work seconds of CPU per round, with a LOW priority detail metric"""
+
+    def __init__(self, name = 'BusyProbe', periodicity = 0.05, work = 0.002):
+        super(BusyProbe, self).__init__(name, periodicity)
+        self.work = work
+        self.spins = SimpleMetric('spins', '#', 'loop iterations of the round', 0)
+        self.detail = SimpleMetric('spin_rate', '#/s', 'loop iterations per second of the round', 0)
+        self.detail.set_priority(Priority.LOW)
+        self.add_metric(self.spins)
+        self.add_metric(self.detail)
+
+    def get_desc(self):
+        return "BusyProbe burns CPU every round"
+
+    def collect(self):
+        start = time.perf_counter()
+        end = start + self.work
+        n = 0
+        while time.perf_counter() < end:
+            n += 1
+        self.spins.set_val(n)
+        self.detail.set_val(n / (time.perf_counter() - start))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--probes', type = int, default = 4)
+    parser.add_argument('--work', type = float, default = 2, help = 'ms of CPU per round')
+    parser.add_argument('--period', type = float, default = 0.05)
+    parser.add_argument('--budget', type = float, default = 5.0, help = '% of one core')
+    parser.add_argument('--interval', type = float, default = 0.5)
+    parser.add_argument('--duration', type = float, default = 6)
+    args = parser.parse_args()
+
+    probes = [BusyProbe('BusyProbe%d' % i, args.period, args.work / 1e3) for i in range(args.probes)]
+    for i, probe in enumerate(probes):
+        probe.set_priority(Priority.HIGH if i == 0 else Priority.LOW if i % 2 else Priority.NORMAL)
+        probe.attachQueue(capacity = 1000)
+    scheduler = ProbeScheduler()
+    governor = OverheadGovernor(cpu_budget = args.budget, interval = args.interval, calm = 2)
+    for probe in probes:
+        scheduler.add_probe(probe)
+        governor.add_probe(probe)
+    scheduler.start()
+    for probe in probes:
+        probe.activate()
+
+    print('%d probes, %.1f ms of CPU every %.3fs each, budget %.1f%% of one core' % (args.probes, args.work,
+                                                                                   args.period, args.budget))
+    print('%-7s %-6s %8s %6s  %s' % ('time', 'load', 'cpu %', 'steps', 'periodicities (H=HIGH, L=LOW, N=NORMAL)'))
+    governor.evaluate()
+    start = time.monotonic()
+    light = False
+    while True:
+        time.sleep(args.interval)
+        elapsed = time.monotonic() - start
+        if elapsed > 2 * args.duration:
+            break
+        if not light and elapsed > args.duration:
+            light = True
+            for probe in probes:
+                probe.work = args.work / 1e5
+        restored = governor.restored
+        step = governor.evaluate()
+        stats = governor.get_stats()
+        what = ''
+        if step is not None:
+            what = '%s %s of %s' % ('restored' if stats['restored'] > restored else 'shed',
+                                    ShedAction.type_as_string(step[0]), step[1].get_name())
+        periods = ' '.join('%s:%.2f' % (Priority.type_as_string(p.get_priority())[0], p.get_effective_periodicity())
+                           for p in probes)
+        print('%-7.1f %-6s %8.2f %6d  %s  %s' % (elapsed, 'light' if light else 'heavy', stats['cpu_usage'],
+                                               len(stats['actions']), periods, what))
+    scheduler.shutdown(terminate_probes = True)
+    governor.shutdown()
+    stats = governor.get_stats()
+    print('shed %d steps, restored %d, %d evaluations over budget with nothing left to shed' %
+          (stats['shed'], stats['restored'], stats['exhausted']))
+
+if __name__ == "__main__":
+    main()
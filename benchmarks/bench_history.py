@@ -0,0 +1,87 @@
+"""Query cost of the NumPy backed MetricHistory against the same queries as Python loops over a list
+
+Fills a history of --points samples (one per second) and times a range query, the p99 of the last hour,
+1 minute downsampling and the average counter rate, each vectorized and as a Python loop.
+
+usage: python -m benchmarks.bench_history [--points 86400] [--repeat 20]
+"""
+import argparse
+import math
+import random
+import time
+
+from Catascopia.History import MetricHistory
+
+
+def timed(f, repeat):
+    f()
+    t = time.perf_counter()
+    for _ in range(repeat):
+        f()
+    return (time.perf_counter() - t) / repeat * 1e3
+
+
+def py_range(samples, start, end):
+    return [(t, v) for t, v in samples if start <= t <= end]
+
+
+def py_p99(samples, start, end):
+    vals = sorted(v for t, v in samples if start <= t <= end)
+    return vals[int(math.ceil(0.99 * len(vals))) - 1]
+
+
+def py_downsample(samples, bucket):
+    out = dict()
+    for t, v in samples:
+        b = int(t // bucket)
+        acc = out.get(b)
+        if acc is None:
+            out[b] = [v, 1]
+        else:
+            acc[0] += v
+            acc[1] += 1
+    return [(b * bucket, s / n) for b, (s, n) in out.items()]
+
+
+def py_rate(samples):
+    total = 0.0
+    for (t0, v0), (t1, v1) in zip(samples, samples[1:]):
+        d = v1 - v0
+        total += v1 if d < 0 else d
+    return total / (samples[-1][0] - samples[0][0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--points', type = int, default = 86400)
+    parser.add_argument('--repeat', type = int, default = 20)
+    args = parser.parse_args()
+
+    random.seed(1)
+    h = MetricHistory(args.points)
+    samples = []
+    counter = 0.0
+    for i in range(args.points):
+        counter += random.uniform(0, 100)
+        samples.append((float(i), counter))
+    t = time.perf_counter()
+    for ts, val in samples:
+        h.append(ts, val)
+    append = (time.perf_counter() - t) / args.points * 1e9
+
+    end = float(args.points - 1)
+    start = end - 3600
+    print('MetricHistory.append: %.0f ns/sample' % append)
+    print('%-26s %14s %14s %8s' % ('query', 'numpy ms', 'python ms', 'speedup'))
+    for label, fast, slow in (('range, last hour', lambda: h.range(start, end), lambda: py_range(samples, start, end)),
+                              ('p99, last hour', lambda: h.percentile(99, start, end),
+                               lambda: py_p99(samples, start, end)),
+                              ('downsample 60s mean', lambda: h.downsample(60), lambda: py_downsample(samples, 60)),
+                              ('counter rate', lambda: h.rate(counter = True), lambda: py_rate(samples))):
+        a = timed(fast, args.repeat)
+        b = timed(slow, args.repeat)
+        print('%-26s %14.3f %14.3f %7.1fx' % (label, a, b, b / a))
+
+
+if __name__ == "__main__":
+    main()
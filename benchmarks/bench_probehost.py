@@ -0,0 +1,122 @@
+"""Latency of the monitored application with CPU heavy probes in-process versus in a ProbeHost worker
+
+The application serves requests back to back from the main thread, each a few hundred microseconds of
+pure python work arriving every 2 ms. --probes ParsingProbes parse a --size KB JSON document
+and summarise it every --period seconds, either on an in-process ProbeScheduler or in a ProbeHost
+worker process. Reports request latency percentiles and the probe rounds delivered.
+
+usage: python -m benchmarks.bench_probehost [--probes 2] [--size 512] [--period 0.1] [--duration 5]
+"""
+import argparse
+import json
+import random
+import time
+
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric
+from Catascopia.Scheduler import ProbeScheduler
+from Catascopia.ProbeHost import ProbeHost
+
+
+class ParsingProbe(Probe):
+    """collector parsing a large JSON document every round, e.g. a status page or a log index"""
+
+    def __init__(self, name = 'ParsingProbe', periodicity = 0.1, size = 512):
+        super(ParsingProbe, self).__init__(name, periodicity)
+        random.seed(size)
+        records = [{'id': i, 'latency': random.random(), 'status': random.choice(('ok', 'err')), 'tags': ['a', 'b']}
+                   for i in range(size * 1024 // 70)]
+        self.document = json.dumps(records)
+        self.mean = SimpleMetric('mean_latency', 's', 'mean latency of the parsed records', 0)
+        self.failures = SimpleMetric('errors', '#', 'records in error', 0)
+        self.add_metric(self.mean)
+        self.add_metric(self.failures)
+
+    def get_desc(self):
+        return "ParsingProbe parses and summarises a JSON document"
+
+    def collect(self):
+        records = json.loads(self.document)
+        self.mean.set_val(sum(r['latency'] for r in records) / len(records))
+        self.failures.set_val(sum(1 for r in records if r['status'] == 'err'))
+
+
+def request():
+    return sum(i * i for i in range(3000))
+
+
+def serve(duration, interval = 0.002):
+    """requests arrive every interval seconds, latency counts from the arrival so that the time spent
+       waiting for the GIL (or the CPU) after the idle wait is included
+    """
+    latencies = []
+    start = time.perf_counter()
+    arrival = start
+    while arrival < start + duration:
+        delay = arrival - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        request()
+        latencies.append(time.perf_counter() - arrival)
+        arrival += interval
+    latencies.sort()
+    return latencies
+
+
+def percentile(latencies, q):
+    return latencies[min(int(q * len(latencies)), len(latencies) - 1)] * 1e3
+
+
+def run(mode, nprobes, size, period, duration):
+    rounds = 0
+    if mode == 'in-process':
+        scheduler = ProbeScheduler()
+        probes = [ParsingProbe('ParsingProbe%d' % i, period, size) for i in range(nprobes)]
+        for probe in probes:
+            q = probe.attachQueue()
+            scheduler.add_probe(probe)
+        scheduler.start()
+        for probe in probes:
+            probe.activate()
+        latencies = serve(duration)
+        scheduler.shutdown()
+        rounds = sum(p.get_timing_stats()['ticks'] for p in probes)
+    elif mode == 'probehost':
+        host = ProbeHost()
+        remotes = [host.add_probe('benchmarks.bench_probehost:ParsingProbe', 'ParsingProbe%d' % i, period, size)
+                   for i in range(nprobes)]
+        q = host.attachQueue()
+        host.start()
+        for remote in remotes:
+            remote.activate()
+        latencies = serve(duration)
+        host.terminate()
+        rounds = host.get_stats()['batches']
+    else:
+        latencies = serve(duration)
+    return latencies, rounds
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--probes', type = int, default = 2)
+    parser.add_argument('--size', type = int, default = 512)
+    parser.add_argument('--period', type = float, default = 0.1)
+    parser.add_argument('--duration', type = float, default = 5)
+    args = parser.parse_args()
+
+    probe = ParsingProbe(size = args.size)
+    t = time.perf_counter()
+    probe.collect()
+    print('collect() takes %.1f ms, %d probes every %.2fs' % ((time.perf_counter() - t) * 1e3, args.probes,
+                                                               args.period))
+    print('%-12s %10s %10s %10s %10s %10s %8s' % ('probes', 'requests', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+                                                  'rounds'))
+    for mode in ('none', 'in-process', 'probehost'):
+        latencies, rounds = run(mode, args.probes, args.size, args.period, args.duration)
+        print('%-12s %10d %10.3f %10.3f %10.3f %10.3f %8d' % (mode, len(latencies), percentile(latencies, 0.5),
+                                                             percentile(latencies, 0.9), percentile(latencies, 0.99),
+                                                             latencies[-1] * 1e3, rounds))
+
+if __name__ == "__main__":
+    main()
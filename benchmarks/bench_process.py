@@ -0,0 +1,61 @@
+"""Collect latency of ProcessProbe watching 1, 100 and 1000 processes
+
+Spawns idle child processes and times collect() of one probe watching them as a PID set and as the process
+tree of this benchmark, against one single-process probe per PID. Before the non-blocking cpu_percent()
+every single-process round additionally blocked for 0.2s.
+
+usage: python -m benchmarks.bench_process [--pids 1 100 1000] [--rounds 10]
+"""
+import argparse
+import statistics
+import subprocess
+import time
+
+from Catascopia.probelib.ProcessProbe import ProcessProbe
+
+
+def latency(collect, rounds):
+    samples = []
+    for _ in range(rounds):
+        t = time.perf_counter()
+        collect()
+        samples.append(time.perf_counter() - t)
+    return statistics.median(samples) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--pids', type = int, nargs = '+', default = [1, 100, 1000])
+    parser.add_argument('--rounds', type = int, default = 10)
+    args = parser.parse_args()
+
+    print('%-26s %8s %14s %12s' % ('mode', 'pids', 'collect ms', 'ms per pid'))
+    for n in args.pids:
+        children = [subprocess.Popen(['sleep', '3600']) for _ in range(n)]
+        try:
+            pids = [c.pid for c in children]
+
+            probe = ProcessProbe(pids = pids)
+            ms = latency(probe.collect, args.rounds)
+            print('%-26s %8d %14.2f %12.4f' % ('pid set', n, ms, ms / n))
+
+            probe = ProcessProbe(pids = pids, per_process = False)
+            ms = latency(probe.collect, args.rounds)
+            print('%-26s %8d %14.2f %12.4f' % ('pid set, aggregated only', n, ms, ms / n))
+
+            probe = ProcessProbe(children = True)
+            ms = latency(probe.collect, args.rounds)
+            print('%-26s %8d %14.2f %12.4f' % ('process tree', n, ms, ms / n))
+
+            probes = [ProcessProbe(pid = pid) for pid in pids]
+            ms = latency(lambda: [p.collect() for p in probes], args.rounds)
+            print('%-26s %8d %14.2f %12.4f' % ('probe per pid', n, ms, ms / n))
+        finally:
+            for c in children:
+                c.kill()
+            for c in children:
+                c.wait()
+
+
+if __name__ == "__main__":
+    main()
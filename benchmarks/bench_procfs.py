@@ -0,0 +1,68 @@
+"""Per-call cost of the /proc reader backend against the psutil backend
+
+Times every host-level read and the sample of one process on both backends, then the collect() of the
+host probes and of a ProcessProbe watching --pids idle child processes.
+
+usage: python -m benchmarks.bench_procfs [--calls 2000] [--pids 100]
+"""
+import argparse
+import subprocess
+import time
+
+from Catascopia.ProcFS import get_backend
+from Catascopia.probelib.CPUProbe import CPUProbe
+from Catascopia.probelib.MemoryProbe import MemoryProbe
+from Catascopia.probelib.DiskProbe import DiskProbe
+from Catascopia.probelib.NetworkProbe import NetworkProbe
+from Catascopia.probelib.ProcessProbe import ProcessProbe
+
+
+def per_call(f, calls):
+    f()
+    t = time.perf_counter()
+    for _ in range(calls):
+        f()
+    return (time.perf_counter() - t) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--calls', type = int, default = 2000)
+    parser.add_argument('--pids', type = int, default = 100)
+    args = parser.parse_args()
+
+    procfs = get_backend('procfs')
+    psutil = get_backend('psutil')
+    reads = (('cpu_times', lambda b: b.cpu_times),
+             ('memory', lambda b: b.memory),
+             ('disk_io', lambda b: b.disk_io),
+             ('net_io', lambda b: b.net_io),
+             ('process sample', lambda b: b.process().sample))
+    print('%-34s %12s %12s %8s' % ('read', 'procfs us', 'psutil us', 'speedup'))
+    for label, get in reads:
+        a = per_call(get(procfs), args.calls)
+        b = per_call(get(psutil), args.calls)
+        print('%-34s %12.1f %12.1f %7.1fx' % (label, a, b, b / a))
+
+    children = [subprocess.Popen(['sleep', '3600']) for _ in range(args.pids)]
+    try:
+        pids = [c.pid for c in children]
+        probes = (('CPUProbe.collect', lambda b: CPUProbe(backend = b)),
+                  ('MemoryProbe.collect', lambda b: MemoryProbe(backend = b)),
+                  ('DiskProbe.collect', lambda b: DiskProbe(backend = b)),
+                  ('NetworkProbe.collect', lambda b: NetworkProbe(backend = b)),
+                  ('ProcessProbe.collect, %d pids' % args.pids, lambda b: ProcessProbe(pids = pids, backend = b)))
+        for label, make in probes:
+            calls = max(1, args.calls // args.pids) if label.startswith('ProcessProbe') else args.calls
+            a = per_call(make('procfs').collect, calls)
+            b = per_call(make('psutil').collect, calls)
+            print('%-34s %12.1f %12.1f %7.1fx' % (label, a, b, b / a))
+    finally:
+        for c in children:
+            c.kill()
+        for c in children:
+            c.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Thread count, RSS and scheduling jitter of thread-per-probe versus ProbeScheduler
+
+usage: python -m benchmarks.bench_scheduler [--probes 10 100 1000] [--duration 5] [--periodicity 0.5]
+every configuration runs in a fresh interpreter so RSS figures are not polluted by previous runs
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric
+from Catascopia.Scheduler import ProbeScheduler
+
+
+class JitterProbe(Probe):
+
+    def __init__(self, name, periodicity):
+        super(JitterProbe, self).__init__(name, periodicity)
+        self.m = SimpleMetric('m', '#', 'dummy metric')
+        self.add_metric(self.m)
+        self.last = None
+        self.intervals = []
+
+    def get_desc(self):
+        return "JitterProbe records the interval between consecutive collect() rounds"
+
+    def collect(self):
+        now = time.monotonic()
+        if self.last is not None:
+            self.intervals.append(now - self.last)
+        self.last = now
+        self.m.set_val(now)
+
+
+def rss_kb():
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def run_one(mode, nprobes, duration, periodicity):
+    probes = [JitterProbe('p%d' % i, periodicity) for i in range(nprobes)]
+    scheduler = None
+    if mode == 'scheduler':
+        scheduler = ProbeScheduler()
+        scheduler.start()
+        for p in probes:
+            scheduler.add_probe(p)
+    for p in probes:
+        p.activate()
+    time.sleep(duration)
+    threads = threading.active_count()
+    rss = rss_kb()
+    for p in probes:
+        p.terminate()
+    if scheduler is not None:
+        scheduler.shutdown()
+    jitter = [abs(i - periodicity) * 1000 for p in probes for i in p.intervals]
+    return {'mode': mode, 'probes': nprobes, 'threads': threads, 'rss_kb': rss,
+            'rounds': len(jitter),
+            'jitter_ms_p50': round(percentile(jitter, 0.5), 3),
+            'jitter_ms_p99': round(percentile(jitter, 0.99), 3),
+            'jitter_ms_max': round(max(jitter) if jitter else 0.0, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--probes', type = int, nargs = '+', default = [10, 100, 1000])
+    parser.add_argument('--duration', type = float, default = 5.0)
+    parser.add_argument('--periodicity', type = float, default = 0.5)
+    parser.add_argument('--mode', choices = ['threads', 'scheduler'], help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run_one(args.mode, args.probes[0], args.duration, args.periodicity)))
+        return
+
+    print('%-10s %6s %8s %10s %8s %12s %12s' % ('mode', 'probes', 'threads', 'rss_kb', 'rounds', 'jitter_p50', 'jitter_p99'))
+    for n in args.probes:
+        for mode in ('threads', 'scheduler'):
+            out = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_scheduler', '--mode', mode,
+                                           '--probes', str(n), '--duration', str(args.duration),
+                                           '--periodicity', str(args.periodicity)],
+                                          cwd = os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            r = json.loads(out)
+            print('%-10s %6d %8d %10d %8d %10.3fms %10.3fms' % (r['mode'], r['probes'], r['threads'], r['rss_kb'],
+                                                              r['rounds'], r['jitter_ms_p50'], r['jitter_ms_p99']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Append and sequential scan throughput of the SegmentStore
+
+Appends --records records one by one and in rounds of 50 entries (a probe round), then scans them back
+with a cursor. The store lives in a temporary directory unless --path is given.
+
+usage: python -m benchmarks.bench_store [--records 1000000] [--segment-records 65536] [--path DIR]
+"""
+import argparse
+import shutil
+import tempfile
+import time
+
+from Catascopia.SegmentStore import SegmentStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--records', type = int, default = 1000000)
+    parser.add_argument('--segment-records', type = int, default = 65536)
+    parser.add_argument('--path', default = None)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp() if args.path is None else args.path
+    n = args.records
+    print('%-34s %14s %12s' % ('operation', 'records/s', 'ns/record'))
+    try:
+        for label, kw in (('append', {}),
+                          ('append, sync every 1s', {'sync_interval': 1.0})):
+            path = root + '/single%d' % len(kw)
+            store = SegmentStore(path, args.segment_records, max_bytes = None, **kw)
+            ts = time.time()
+            t = time.perf_counter()
+            for i in range(n):
+                store.append(i % 50, ts, 1.5)
+            elapsed = time.perf_counter() - t
+            print('%-34s %14.0f %12.0f' % (label, n / elapsed, elapsed / n * 1e9))
+            store.close()
+            shutil.rmtree(path)
+
+        store = SegmentStore(root + '/rounds', args.segment_records, max_bytes = None)
+        ts = time.time()
+        entries = [(mid, ts, mid * 1.5) for mid in range(50)]
+        t = time.perf_counter()
+        for _ in range(n // 50):
+            store.append_entries(entries)
+        elapsed = time.perf_counter() - t
+        print('%-34s %14.0f %12.0f' % ('append_entries, 50 per round', n / elapsed, elapsed / n * 1e9))
+
+        cursor = store.cursor()
+        t = time.perf_counter()
+        count = 0
+        while True:
+            records = cursor.read(65536)
+            if not records:
+                break
+            count += len(records)
+        elapsed = time.perf_counter() - t
+        print('%-34s %14.0f %12.0f' % ('cursor scan', count / elapsed, elapsed / count * 1e9))
+        store.close()
+
+        reader = SegmentStore(root + '/rounds', readonly = True)
+        t = time.perf_counter()
+        count = sum(1 for _ in reader.cursor())
+        elapsed = time.perf_counter() - t
+        print('%-34s %14.0f %12.0f' % ('reopen and iterate (readonly)', count / elapsed, elapsed / count * 1e9))
+        reader.close()
+    finally:
+        if args.path is None:
+            shutil.rmtree(root)
+
+
+if __name__ == "__main__":
+    main()
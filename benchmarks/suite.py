@@ -0,0 +1,446 @@
+"""Reproducible benchmark suite of the probing pipeline, with JSON results and baseline comparison
+
+Cases (select with --cases):
+  tick        cost of one collect and emit round against the number of metrics, legacy and batched,
+              plus Metric.to_dict() and str(Metric)
+  probes      rounds delivered, lateness and CPU of 10, 100 and 1000 probes on one ProbeScheduler, and of
+              as many probes running their own thread
+  queue       rounds produced and delivered with a slow consumer, per attachQueue() overflow policy
+  decorators  per call overhead of CatascopiaDecorators timeit, countit and errorrate
+  memory      bytes per Metric object and per MetricTable value
+The probes are SyntheticExampleProbes: ExampleProbe without its random sleep, padded with extra metrics,
+seeded so that every run does the same work. Timings are the median of --repeat runs after a warm up.
+
+The suite also runs against the tree before the scheduler series (set PYTHONPATH to that tree and run this
+file as a script): results needing an API the tree lacks (ProbeScheduler, RingBufferChannel, MetricTable,
+batching, the countit and errorrate decorators) are skipped and listed, the rounds of a probe without
+_tick() run collect() and push_to_queue() as its Probe.run() does, so the shared results stay comparable.
+
+--output writes the results as JSON. --baseline compares them against a previous output and exits with
+status 1 if a result got worse by more than --threshold (a fraction, 0.1 by default), so that the suite
+can gate a CI job or a before/after comparison of a change.
+
+usage: python -m benchmarks.suite [--cases tick,probes,queue,decorators,memory] [--quick] [--repeat 5]
+                                  [--output results.json] [--baseline baseline.json] [--threshold 0.1]
+       PYTHONPATH=old/tree python benchmarks/suite.py --output baseline.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from queue import Queue, Empty
+
+from Catascopia.Metrics import SimpleMetric
+from Catascopia.Decorators import CatascopiaDecorators
+from Catascopia.probelib.ExampleProbe import ExampleProbe
+
+# missing from the tree before the scheduler series, the results needing them are skipped
+try:
+    from Catascopia.Metrics import MetricTable
+except ImportError:
+    MetricTable = None
+try:
+    from Catascopia.Channel import RingBufferChannel, OverflowPolicy
+except ImportError:
+    RingBufferChannel = OverflowPolicy = None
+try:
+    from Catascopia.Scheduler import ProbeScheduler
+except ImportError:
+    ProbeScheduler = None
+
+# results skipped for a missing API
+SKIPPED = []
+
+
+class SyntheticExampleProbe(ExampleProbe):
+    """ExampleProbe minus its random sleep, padded up to nmetrics metrics, with a seeded generator"""
+
+    def __init__(self, name = 'SyntheticExampleProbe', periodicity = 1, nmetrics = 5):
+        super(SyntheticExampleProbe, self).__init__(name, periodicity)
+        self.extra = []
+        for i in range(max(nmetrics - 5, 0)):
+            m = SimpleMetric('extra%d' % i, '#', 'synthetic metric', 0, 1e9)
+            self.add_metric(m)
+            self.extra.append(m)
+        self.rng = random.Random(nmetrics)
+        self.rounds = 0
+
+    def get_desc(self):
+        return "SyntheticExampleProbe collects dummy metrics without sleeping"
+
+    def collect(self):
+        self.rounds += 1
+        self.myMetric5.timer_reset_and_start()
+
+        d = self.rng.uniform(0, 10)
+        i = self.rng.randint(0, 1000)
+
+        self.myMetric1.set_val(d)
+        self.myMetric2.set_val(i)
+        self.myMetric3.inc()
+        self.myMetric4.update(i)
+        for n, m in enumerate(self.extra):
+            m.set_val(d + n)
+
+        self.myMetric5.timer_end()
+
+
+def run_round(probe):
+    """helper that runs one collect and emit round, as Probe.run() does in trees without Probe._tick()"""
+    tick = getattr(probe, '_tick', None)
+    if tick is not None:
+        tick()
+    else:
+        probe.collect()
+        probe.push_to_queue(probe.get_metrics_as_list())
+
+
+def drain(q):
+    if hasattr(q, 'drain'):
+        q.drain()
+        return
+    try:
+        while True:
+            q.get_nowait()
+    except Empty:
+        pass
+
+
+def skip(key, api):
+    SKIPPED.append('%s (%s)' % (key, api))
+
+
+def timed(f, calls, repeat):
+    """helper that returns the median seconds per call of f over repeat runs of calls calls, after a warm up"""
+    samples = []
+    for run in range(repeat + 1):
+        start = time.perf_counter()
+        for _ in range(calls):
+            f()
+        if run:
+            samples.append((time.perf_counter() - start) / calls)
+    return statistics.median(samples)
+
+
+def result(value, unit, better):
+    """a result entry, better is 'lower', 'higher' or None for the figures not checked against a baseline"""
+    return {'value': value, 'unit': unit, 'better': better}
+
+
+def case_tick(args):
+    results = dict()
+    rounds = 200 if args.quick else 2000
+    for nmetrics in (5, 50, 500):
+        for mode in ('legacy', 'batch'):
+            key = 'tick.%s.metrics%d' % (mode, nmetrics)
+            probe = SyntheticExampleProbe(nmetrics = nmetrics)
+            if hasattr(probe, 'set_batching'):
+                probe.set_batching(mode == 'batch')
+            elif mode == 'batch':
+                skip(key, 'Probe.set_batching')
+                continue
+            q = probe.attachQueue(RingBufferChannel(100000) if RingBufferChannel is not None else Queue())
+
+            def tick():
+                run_round(probe)
+                if q.qsize() > 50000:
+                    drain(q)
+            n = max(rounds * 5 // nmetrics, 20)
+            results[key] = result(timed(tick, n, args.repeat) * 1e6, 'us', 'lower')
+    m = SimpleMetric('metric', '#', 'a metric', 0, 100)
+    m.set_val(42.0)
+    calls = 10000 if args.quick else 100000
+    results['metric.to_dict'] = result(timed(m.to_dict, calls, args.repeat) * 1e9, 'ns', 'lower')
+    results['metric.str'] = result(timed(m.__str__, calls, args.repeat) * 1e9, 'ns', 'lower')
+    return results
+
+
+def case_probes(args):
+    results = dict()
+    duration = 1.0 if args.quick else 3.0
+    period = 0.1
+    for nprobes in (10, 100) if args.quick else (10, 100, 1000):
+        if ProbeScheduler is None:
+            skip('probes.%d' % nprobes, 'ProbeScheduler')
+            continue
+        probes = [SyntheticExampleProbe('probe%d' % i, period, 10) for i in range(nprobes)]
+        channel = RingBufferChannel(100000)
+        scheduler = ProbeScheduler()
+        for probe in probes:
+            probe.set_batching(True)
+            probe.attachQueue(channel)
+            scheduler.add_probe(probe)
+        scheduler.start()
+        cpu = time.process_time()
+        start = time.perf_counter()
+        for probe in probes:
+            probe.activate()
+        time.sleep(duration)
+        threads = threading.active_count()
+        for probe in probes:
+            probe.deactivate()
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        scheduler.shutdown()
+        stats = [p.get_timing_stats() for p in probes]
+        # every probe collects right away on activate(), then once per period
+        expected = nprobes * (int(wall / period) + 1)
+        key = 'probes.%d.' % nprobes
+        results[key + 'delivered'] = result(sum(s['ticks'] for s in stats) / float(expected), 'ratio', 'higher')
+        results[key + 'lateness_avg'] = result(sum(s['lateness_avg'] for s in stats) / nprobes * 1e3, 'ms',
+                                               'lower')
+        results[key + 'lateness_max'] = result(max(s['lateness_max'] for s in stats) * 1e3, 'ms', None)
+        results[key + 'cpu'] = result(100.0 * cpu / wall, '% of one core', 'lower')
+        results[key + 'threads'] = result(threads, '#', None)
+    # a thread per probe, as Probe.activate() runs a probe without a scheduler in every tree
+    for nprobes in (10, 100) if args.quick else (10, 100, 1000):
+        probes = [SyntheticExampleProbe('probe%d' % i, period, 10) for i in range(nprobes)]
+        q = Queue()
+        for probe in probes:
+            probe.attachQueue(q)
+        cpu = time.process_time()
+        start = time.perf_counter()
+        for probe in probes:
+            probe.activate()
+        time.sleep(duration)
+        threads = threading.active_count()
+        for probe in probes:
+            probe.deactivate()
+        wall = time.perf_counter() - start
+        cpu = time.process_time() - cpu
+        for probe in probes:
+            probe.terminate()
+        for probe in probes:
+            probe.join(period * 2 + 1)
+        expected = nprobes * (int(wall / period) + 1)
+        key = 'probes.thread.%d.' % nprobes
+        results[key + 'delivered'] = result(sum(p.rounds for p in probes) / float(expected), 'ratio', 'higher')
+        if hasattr(probes[0], 'get_timing_stats'):
+            stats = [p.get_timing_stats() for p in probes]
+            results[key + 'lateness_avg'] = result(sum(s['lateness_avg'] for s in stats) / nprobes * 1e3, 'ms',
+                                                   'lower')
+        else:
+            skip(key + 'lateness_avg', 'Probe.get_timing_stats')
+        results[key + 'cpu'] = result(100.0 * cpu / wall, '% of one core', 'lower')
+        results[key + 'threads'] = result(threads, '#', None)
+    return results
+
+
+def case_queue(args):
+    results = dict()
+    duration = 0.5 if args.quick else 2.0
+    # the consumer takes 200us per item, a fraction of the rate the probe produces at
+    service = 0.0002
+    channels = [('Queue', lambda: Queue(1000))]
+    if RingBufferChannel is not None:
+        channels[:0] = [('DROP_OLDEST', lambda: RingBufferChannel(1000, OverflowPolicy.DROP_OLDEST)),
+                        ('DROP_NEWEST', lambda: RingBufferChannel(1000, OverflowPolicy.DROP_NEWEST)),
+                        ('SAMPLE', lambda: RingBufferChannel(1000, OverflowPolicy.SAMPLE)),
+                        ('BLOCK', lambda: RingBufferChannel(1000, OverflowPolicy.BLOCK, deadline = 0.01))]
+    else:
+        skip('queue.DROP_OLDEST,DROP_NEWEST,SAMPLE,BLOCK', 'RingBufferChannel')
+    for label, factory in channels:
+        probe = SyntheticExampleProbe(nmetrics = 20)
+        if hasattr(probe, 'set_batching'):
+            probe.set_batching(True)
+            items = 1
+        else:
+            # one item per metric every round
+            items = len(probe.get_metrics())
+        q = probe.attachQueue(factory())
+        done = threading.Event()
+        delivered = [0]
+
+        def consume():
+            while not done.is_set() or not q.empty():
+                try:
+                    q.get(timeout = 0.05)
+                except Empty:
+                    continue
+                delivered[0] += 1
+                end = time.perf_counter() + service
+                while time.perf_counter() < end:
+                    pass
+        consumer = threading.Thread(target = consume, daemon = True)
+        consumer.start()
+        produced = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < duration:
+            run_round(probe)
+            produced += 1
+        wall = time.perf_counter() - start
+        # what the consumer drains after the run does not count
+        received = delivered[0] / float(items)
+        done.set()
+        consumer.join()
+        key = 'queue.%s.' % label
+        results[key + 'produced'] = result(produced / wall, 'rounds/s', 'higher')
+        results[key + 'delivered'] = result(received / wall, 'rounds/s', 'higher')
+        if not hasattr(probe, 'get_instrumentation'):
+            skip(key + 'dropped,put_mean', 'Probe.get_instrumentation')
+            continue
+        put = probe.get_instrumentation().put
+        # evictions of DROP_OLDEST and SAMPLE are only counted by the channel
+        drops = q.get_stats()['drops'] if hasattr(q, 'get_stats') else probe.get_instrumentation().drops
+        results[key + 'dropped'] = result(drops / float(produced) if produced else 0.0, 'ratio', None)
+        results[key + 'put_mean'] = result(put.mean() * 1e6, 'us', 'lower')
+    return results
+
+
+def _workload():
+    return 1
+
+
+def case_decorators(args):
+    results = dict()
+    calls = 20000 if args.quick else 200000
+    bare = timed(_workload, calls, args.repeat)
+    cwd = os.getcwd()
+    # decorators writing their records to the working directory write them to a scratch one
+    with tempfile.TemporaryDirectory() as scratch:
+        os.chdir(scratch)
+        try:
+            for name in ('timeit', 'countit', 'errorrate'):
+                key = 'decorators.%s' % name
+                decorator = getattr(CatascopiaDecorators, name, None)
+                if decorator is None:
+                    skip(key, 'CatascopiaDecorators.' + name)
+                    continue
+                decorated = decorator(_workload)
+                results[key] = result((timed(decorated, calls, args.repeat) - bare) * 1e9, 'ns', 'lower')
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def case_memory(args):
+    results = dict()
+    n = 1000 if args.quick else 10000
+    tracemalloc.start()
+    try:
+        probe = SyntheticExampleProbe(nmetrics = 5)
+        before = tracemalloc.take_snapshot()
+        for i in range(n):
+            m = SimpleMetric('metric%d' % i, '#', 'synthetic metric', 0, 1e9)
+            m.set_val(float(i))
+            probe.add_metric(m)
+        grown = tracemalloc.take_snapshot().compare_to(before, 'filename')
+        results['memory.metric'] = result(sum(s.size_diff for s in grown) / float(n), 'bytes', 'lower')
+        if MetricTable is None:
+            skip('memory.table_value', 'MetricTable')
+            return results
+        table = MetricTable()
+        before = tracemalloc.take_snapshot()
+        for i in range(n):
+            table.set_val(table.register('metric%d' % i, '#', 'synthetic metric'), float(i), 0.0)
+        grown = tracemalloc.take_snapshot().compare_to(before, 'filename')
+        results['memory.table_value'] = result(sum(s.size_diff for s in grown) / float(n), 'bytes', 'lower')
+    finally:
+        tracemalloc.stop()
+    return results
+
+
+CASES = (('tick', case_tick),
+         ('probes', case_probes),
+         ('queue', case_queue),
+         ('decorators', case_decorators),
+         ('memory', case_memory))
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], stdout = subprocess.PIPE,
+                                stderr = subprocess.DEVNULL, cwd = os.path.dirname(os.path.abspath(__file__)),
+                                check = True).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'commit': commit,
+            'timestamp': time.time()}
+
+
+def compare(results, baseline, threshold):
+    """helper that prints every result next to its baseline, returns the keys that got worse than threshold"""
+    regressions = []
+    print('%-36s %14s %14s %9s  %s' % ('result', 'baseline', 'current', 'change', ''))
+    for key in sorted(results):
+        r = results[key]
+        b = baseline.get(key)
+        if b is None:
+            print('%-36s %14s %14.3f %9s  %s' % (key, '-', r['value'], '-', 'new'))
+            continue
+        if not b['value']:
+            print('%-36s %14.3f %14.3f %9s' % (key, b['value'], r['value'], '-'))
+            continue
+        change = (r['value'] - b['value']) / abs(b['value'])
+        verdict = ''
+        if r['better'] is not None and abs(change) > threshold:
+            worse = change > 0 if r['better'] == 'lower' else change < 0
+            verdict = 'REGRESSION' if worse else 'improved'
+            if worse:
+                regressions.append(key)
+        print('%-36s %14.3f %14.3f %+8.1f%%  %s' % (key, b['value'], r['value'], change * 100, verdict))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__.splitlines()[0])
+    parser.add_argument('--cases', default = ','.join(name for name, case in CASES))
+    parser.add_argument('--quick', action = 'store_true', help = 'fewer rounds and shorter runs, for smoke tests')
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--output')
+    parser.add_argument('--baseline')
+    parser.add_argument('--threshold', type = float, default = 0.1)
+    args = parser.parse_args()
+
+    selected = args.cases.split(',')
+    unknown = set(selected) - set(name for name, case in CASES)
+    if unknown:
+        parser.error('unknown cases ' + ', '.join(sorted(unknown)))
+    random.seed(args.seed)
+    results = dict()
+    for name, case in CASES:
+        if name not in selected:
+            continue
+        start = time.perf_counter()
+        results.update(case(args))
+        print('%s done in %.1fs' % (name, time.perf_counter() - start), file = sys.stderr)
+
+    if SKIPPED:
+        print('skipped, missing from this tree: ' + ', '.join(SKIPPED), file = sys.stderr)
+    report = {'environment': environment(),
+              'settings': {'cases': selected, 'quick': args.quick, 'repeat': args.repeat, 'seed': args.seed,
+                           'skipped': SKIPPED},
+              'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent = 2, sort_keys = True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('settings', {}).get('quick') != args.quick:
+            print('warning: baseline and current run differ in --quick, figures are not comparable', file = sys.stderr)
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print('%d regressions above %.0f%%: %s' % (len(regressions), args.threshold * 100,
+                                                       ', '.join(regressions)))
+            sys.exit(1)
+    else:
+        print('%-36s %14s  %s' % ('result', 'value', 'unit'))
+        for key in sorted(results):
+            print('%-36s %14.3f  %s' % (key, results[key]['value'], results[key]['unit']))
+
+if __name__ == "__main__":
+    main()
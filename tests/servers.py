@@ -0,0 +1,116 @@
+"""local stand-in servers counting the lines exporters send them, shared by the tests and benchmarks"""
+import gzip
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric
+
+
+class SyntheticProbe(Probe):
+
+    def __init__(self, nmetrics):
+        super(SyntheticProbe, self).__init__('SyntheticProbe', 1)
+        self.counter = 0
+        for i in range(nmetrics):
+            self.add_metric(SimpleMetric('metric%d' % i, '#', 'dummy metric', 0))
+
+    def get_desc(self):
+        return "SyntheticProbe holds counters updated every round"
+
+    def collect(self):
+        self.counter += 1
+        for m in self.get_metrics_as_list():
+            m.set_val(self.counter)
+
+
+class Counter(object):
+
+    def __init__(self):
+        self.lines = 0
+        self.requests = 0
+        self.compressed = 0
+        self.bodies = []
+        self.lock = Lock()
+
+    def add(self, data, keep = False):
+        with self.lock:
+            self.lines += data.count(b'\n')
+            self.requests += 1
+            if keep:
+                self.bodies.append(data)
+
+
+class _TCPHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            data = self.request.recv(1 << 16)
+            if not data:
+                return
+            self.server.counter.add(data)
+
+
+class _UDPHandler(socketserver.BaseRequestHandler):
+
+    def handle(self):
+        self.server.counter.add(self.request[0])
+
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        server = self.server
+        with server.counter.lock:
+            server.posts += 1
+            fail = server.fail_every and server.posts % server.fail_every == 0
+        if fail:
+            self.send_response(server.fail_status)
+        else:
+            if self.headers.get('Content-Encoding') == 'gzip':
+                body = gzip.decompress(body)
+                with server.counter.lock:
+                    server.counter.compressed += 1
+            server.counter.add(body, server.keep)
+            self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(server):
+    server.counter = Counter()
+    Thread(target = server.serve_forever, daemon = True).start()
+    return server
+
+
+def tcp_server():
+    return serve(_ThreadingTCPServer(('127.0.0.1', 0), _TCPHandler))
+
+
+def udp_server():
+    server = socketserver.UDPServer(('127.0.0.1', 0), _UDPHandler)
+    server.socket.setsockopt(socketserver.socket.SOL_SOCKET, socketserver.socket.SO_RCVBUF, 1 << 24)
+    return serve(server)
+
+
+def http_server(fail_every = 0, fail_status = 503, keep = False):
+    """every fail_every-th POST is answered with fail_status, keep holds on to the (decompressed) bodies"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _HTTPHandler)
+    server.daemon_threads = True
+    server.posts = 0
+    server.fail_every = fail_every
+    server.fail_status = fail_status
+    server.keep = keep
+    return serve(server)
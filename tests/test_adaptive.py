@@ -0,0 +1,68 @@
+import random
+
+import pytest
+
+from Catascopia.Adaptive import AdaptivePeriodicity, CatascopiaAdaptiveException
+from Catascopia.Metrics import MetricTable
+
+
+def drive(controller, table, mid, values, period):
+    periods = []
+    for val in values:
+        table.set_val(mid, val)
+        period = controller.update(table, period)
+        periods.append(period)
+    return periods
+
+
+@pytest.fixture
+def table():
+    t = MetricTable()
+    t.register('load', '%', 'load')
+    return t
+
+
+def test_stable_values_grow_the_period_to_max(table):
+    controller = AdaptivePeriodicity(1, 30)
+    periods = drive(controller, table, 0, [50.0] * 20, 1)
+    assert periods[-1] == 30
+    assert controller.volatile_rounds == 0
+
+
+def test_a_change_leaves_max_period(table):
+    controller = AdaptivePeriodicity(1, 30)
+    rng = random.Random(1)
+    periods = drive(controller, table, 0, [50.0 + rng.uniform(-0.5, 0.5) for _ in range(20)], 1)
+    assert periods[-1] == 30
+    periods = drive(controller, table, 0, [90.0], periods[-1])
+    assert periods[-1] < 30
+    assert controller.get_stats()['last_volatile'] == 'load'
+
+
+def test_lasting_noise_widens_the_bound(table):
+    controller = AdaptivePeriodicity(1, 30)
+    period = drive(controller, table, 0, [50.0] * 10, 1)[-1]
+    # the metric starts swinging for good, after a few volatile rounds its noise level catches up
+    periods = drive(controller, table, 0, [30.0, 70.0] * 20, period)
+    assert periods[0] < 30
+    assert controller.volatile_rounds < 10
+    assert periods[-1] == 30
+
+
+def test_clamp_and_validation():
+    controller = AdaptivePeriodicity(2, 10)
+    assert controller.clamp(1) == 2
+    assert controller.clamp(20) == 10
+    with pytest.raises(CatascopiaAdaptiveException):
+        AdaptivePeriodicity(10, 2)
+    with pytest.raises(CatascopiaAdaptiveException):
+        AdaptivePeriodicity(1, 2, alpha = 0)
+
+
+def test_forget_restarts_the_warmup(table):
+    controller = AdaptivePeriodicity(1, 30, warmup = 3)
+    drive(controller, table, 0, [50.0] * 10, 1)
+    controller.forget(0)
+    # right after forget() a jump is part of the warm up, not volatile
+    drive(controller, table, 0, [10.0, 90.0], 30)
+    assert controller.volatile_rounds == 0
@@ -0,0 +1,145 @@
+import json
+import time
+
+import pytest
+
+from Catascopia.Agent import ProbeAgent, ProbeRegistry, parse_config, CatascopiaConfigException
+from Catascopia.Metrics import SimpleMetric, Priority
+from Catascopia.Probe import Probe
+
+
+class CountingProbe(Probe):
+
+    def __init__(self, name = 'CountingProbe', periodicity = 0.05, start = 0):
+        super(CountingProbe, self).__init__(name, periodicity)
+        self.start = start
+        self.count = SimpleMetric('count', '#', 'rounds collected', 0)
+        self.count.set_val(start)
+        self.add_metric(self.count)
+
+    def get_desc(self):
+        return "CountingProbe counts its rounds"
+
+    def collect(self):
+        self.count.set_val(self.count.get_val() + 1)
+
+
+REF = 'tests.test_agent:CountingProbe'
+
+
+def config(*probes, **kwargs):
+    kwargs['probes'] = list(probes)
+    return kwargs
+
+
+@pytest.fixture
+def agent():
+    started = []
+
+    def start(conf):
+        a = ProbeAgent(conf).start()
+        started.append(a)
+        return a
+    yield start
+    for a in started:
+        a.shutdown()
+
+
+def test_invalid_configs_are_rejected():
+    with pytest.raises(CatascopiaConfigException):
+        parse_config({'probes': [{'name': 'a'}]})
+    with pytest.raises(CatascopiaConfigException):
+        parse_config(config({'class': REF, 'name': 'a'}, {'class': REF, 'name': 'a'}))
+    with pytest.raises(CatascopiaConfigException):
+        parse_config(config({'class': REF, 'periodicity': 0}))
+    with pytest.raises(CatascopiaConfigException):
+        parse_config(config({'class': REF, 'priority': 'URGENT'}))
+
+
+def test_disabled_probes_are_not_imported(agent):
+    registry = ProbeRegistry()
+    a = ProbeAgent(config({'class': 'CPUProbe', 'enabled': False}, {'class': REF, 'name': 'counter'}),
+                   registry = registry).start()
+    try:
+        assert list(registry.classes) == [REF]
+        assert a.get_stats()['running'] == 1
+    finally:
+        a.shutdown()
+
+
+def test_reload_adds_removes_updates_and_restarts(agent):
+    a = agent(config({'class': REF, 'name': 'kept', 'periodicity': 0.05},
+                     {'class': REF, 'name': 'gone'},
+                     {'class': REF, 'name': 'rebuilt', 'args': {'start': 0}}))
+    kept = a.get_probe('kept')
+    rebuilt = a.get_probe('rebuilt')
+    changes = a.reload(config({'class': REF, 'name': 'kept', 'periodicity': 0.1, 'priority': 'HIGH'},
+                              {'class': REF, 'name': 'rebuilt', 'args': {'start': 100}},
+                              {'class': REF, 'name': 'new'}))
+    assert changes == {'added': ['new'], 'removed': ['gone'], 'updated': ['kept'], 'restarted': ['rebuilt']}
+    # updated in place
+    assert a.get_probe('kept') is kept
+    assert kept.get_periodicity() == 0.1
+    assert kept.get_priority() == Priority.HIGH
+    assert a.get_probe('rebuilt') is not rebuilt
+    assert a.get_probe('rebuilt').start == 100
+    assert a.get_probe('gone') is None
+    assert a.get_stats()['reloads'] == 1
+
+
+def test_reload_skips_entries_failing_to_build(agent):
+    a = agent(config({'class': REF, 'name': 'ok'}))
+    changes = a.reload(config({'class': REF, 'name': 'ok'}, {'class': 'NoSuchProbe', 'name': 'broken'}))
+    assert changes['added'] == []
+    assert a.get_probe('ok') is not None
+
+
+def test_watch_reloads_the_config_file(agent, tmp_path):
+    path = tmp_path / 'agent.json'
+    path.write_text(json.dumps(config({'class': REF, 'name': 'a'}, reload = 0.02)))
+    a = agent(str(path))
+    time.sleep(0.05)
+    path.write_text(json.dumps(config({'class': REF, 'name': 'b'}, reload = 0.02)))
+    end = time.time() + 5
+    while a.get_probe('b') is None and time.time() < end:
+        time.sleep(0.01)
+    assert a.get_probe('b') is not None
+    assert a.get_probe('a') is None
+
+
+class LowProbe(CountingProbe):
+
+    def __init__(self, name = 'LowProbe', periodicity = 0.5):
+        super(LowProbe, self).__init__(name, periodicity)
+        self.set_priority(Priority.LOW)
+
+
+def test_removed_keys_revert_to_the_class_defaults(agent):
+    ref = 'tests.test_agent:LowProbe'
+    a = agent(config({'class': ref, 'name': 'low', 'periodicity': 0.1, 'priority': 'HIGH'}))
+    probe = a.get_probe('low')
+    assert probe.get_periodicity() == 0.1
+    assert probe.get_priority() == Priority.HIGH
+    changes = a.reload(config({'class': ref, 'name': 'low'}))
+    assert changes['updated'] == ['low']
+    assert a.get_probe('low') is probe
+    assert probe.get_periodicity() == 0.5
+    assert probe.get_priority() == Priority.LOW
+    assert a.reload(config({'class': ref, 'name': 'low'}))['updated'] == []
+
+
+def test_request_reload_runs_on_the_watcher_thread(agent, tmp_path):
+    path = tmp_path / 'agent.json'
+    path.write_text(json.dumps(config({'class': REF, 'name': 'a'})))
+    a = agent(str(path))
+    # no reload interval, the watcher only acts on requests
+    a.watch(None)
+    path.write_text(json.dumps(config({'class': REF, 'name': 'b'})))
+    with a._lock:
+        # as a signal handler interrupting a thread that holds the lock would
+        a.request_reload()
+    end = time.time() + 5
+    while a.get_probe('b') is None and time.time() < end:
+        time.sleep(0.01)
+    assert a.get_probe('b') is not None
+    assert a.get_stats()['reloads'] == 1
@@ -0,0 +1,106 @@
+import random
+import statistics
+
+import pytest
+
+from Catascopia.Aggregation import QuantileSketch, WindowSummary, Aggregator, merge_rollups, \
+    CatascopiaAggregationException
+
+
+def exact(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+
+
+@pytest.mark.parametrize('q', [0.01, 0.25, 0.5, 0.9, 0.99])
+def test_sketch_quantiles_within_relative_accuracy(q):
+    rnd = random.Random(1)
+    values = [rnd.lognormvariate(0, 2) for _ in range(20000)]
+    # enough bins for the whole range, collapsing is covered below
+    sketch = QuantileSketch(alpha = 0.01, max_bins = 2048)
+    for val in values:
+        sketch.add(val)
+    assert sketch.quantile(q) == pytest.approx(exact(values, q), rel = 0.01)
+
+
+def test_sketch_handles_negative_and_zero_values():
+    sketch = QuantileSketch(alpha = 0.01)
+    for val in (-10.0, -1.0, 0.0, 0.0, 1.0, 10.0):
+        sketch.add(val)
+    assert sketch.quantile(0) == pytest.approx(-10.0, rel = 0.01)
+    assert sketch.quantile(0.5) == 0.0
+    assert sketch.quantile(1) == pytest.approx(10.0, rel = 0.01)
+    assert QuantileSketch().quantile(0.5) is None
+
+
+def test_sketch_memory_is_bounded():
+    sketch = QuantileSketch(alpha = 0.01, max_bins = 64)
+    for i in range(1, 100000, 7):
+        sketch.add(float(i))
+    assert len(sketch.pos) + len(sketch.neg) <= 64
+    # collapsing only degrades the lowest quantiles
+    assert sketch.quantile(0.99) == pytest.approx(99000, rel = 0.02)
+
+
+def test_merged_sketches_match_a_single_sketch():
+    rnd = random.Random(2)
+    values = [rnd.uniform(1, 1000) for _ in range(5000)]
+    whole = QuantileSketch()
+    parts = [QuantileSketch() for _ in range(4)]
+    for i, val in enumerate(values):
+        whole.add(val)
+        parts[i % 4].add(val)
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+    assert merged.count == whole.count
+    for q in (0.1, 0.5, 0.9):
+        assert merged.quantile(q) == whole.quantile(q)
+    with pytest.raises(CatascopiaAggregationException):
+        merged.merge(QuantileSketch(alpha = 0.05))
+
+
+def test_summary_merge_matches_the_whole_window():
+    rnd = random.Random(3)
+    values = [rnd.gauss(50, 10) for _ in range(1000)]
+    left, right = WindowSummary(), WindowSummary()
+    for val in values[:300]:
+        left.add(val)
+    for val in values[300:]:
+        right.add(val)
+    # serialised as in a rollup and merged back on the consumer side
+    merged = merge_rollups([left.to_dict(), right.to_dict()])
+    assert merged.count == 1000
+    assert merged.mean == pytest.approx(statistics.mean(values))
+    assert merged.variance() == pytest.approx(statistics.variance(values))
+    assert merged.min == min(values)
+    assert merged.max == max(values)
+
+
+def test_tumbling_rollups():
+    agg = Aggregator(10)
+    assert not agg.due(0.0)
+    agg.add_entries([(0, None, 1.0), (1, None, 'text'), (2, None, True)], now = 1.0)
+    agg.add(0, 3.0, now = 2.0)
+    assert not agg.due(9.0)
+    assert agg.due(10.0)
+    rollups = agg.rollup(10.0)
+    assert [mid for mid, _ in rollups] == [0]
+    assert rollups[0][1]['count'] == 2
+    assert rollups[0][1]['mean'] == 2.0
+    # the next interval starts empty
+    assert agg.rollup(20.0) == []
+
+
+def test_sliding_window_forgets_old_slices():
+    agg = Aggregator(1, window = 4, slices = 4)
+    agg.due(0.0)
+    agg.add(0, 100.0, now = 0.5)
+    agg.add(0, 1.0, now = 3.5)
+    assert agg.rollup(3.6)[0][1]['count'] == 2
+    # the slice holding 100 fell out of the window
+    rollup = agg.rollup(4.5)[0][1]
+    assert rollup['count'] == 1
+    assert rollup['max'] == 1.0
+    with pytest.raises(CatascopiaAggregationException):
+        Aggregator(10, window = 5)
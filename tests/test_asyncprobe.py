@@ -0,0 +1,110 @@
+import asyncio
+import time
+from threading import Thread
+
+from Catascopia.AsyncProbe import AsyncProbe, AsyncProbeRunner
+from Catascopia.Channel import AsyncQueueChannel
+from Catascopia.Metrics import SimpleMetric
+from Catascopia.Probe import ProbeStatus
+
+from tests.test_probe import StaticProbe
+
+
+class SleepyProbe(AsyncProbe):
+
+    def __init__(self, name = 'SleepyProbe', periodicity = 0.02, delay = 0.0, fail = None, **kwargs):
+        super(SleepyProbe, self).__init__(name, periodicity, **kwargs)
+        self.delay = delay
+        self.fail = fail
+        self.rounds = 0
+        self.m = SimpleMetric('rounds', '#', 'collect() rounds', 0)
+        self.add_metric(self.m)
+
+    def get_desc(self):
+        return "SleepyProbe awaits delay seconds every round"
+
+    async def collect(self):
+        await asyncio.sleep(self.delay)
+        if self.fail is not None:
+            raise self.fail
+        self.rounds += 1
+        self.m.set_val(self.rounds)
+
+
+def test_atick_routes_connection_errors_through_tick_failed():
+    probe = SleepyProbe(fail = ConnectionRefusedError('refused'))
+    asyncio.run(probe._atick())
+    asyncio.run(probe._atick())
+    assert probe.errors == 2
+    assert probe.get_probestatus() != ProbeStatus.TERM
+    probe.fail = None
+    asyncio.run(probe._atick())
+    assert probe.errors == 0
+    assert probe.rounds == 1
+
+
+def test_atick_times_out():
+    probe = SleepyProbe(delay = 1.0, timeout = 0.01)
+    asyncio.run(probe._atick())
+    assert probe.errors == 1
+    assert probe.rounds == 0
+
+
+def test_channel_binds_to_the_loop_of_the_first_get():
+    channel = AsyncQueueChannel(capacity = 3)
+    assert channel.get_loop() is None
+    # pushed from a thread before any loop exists, the oldest overflows
+    t = Thread(target = lambda: [channel.put(i) for i in range(5)])
+    t.start()
+    t.join()
+    assert channel.qsize() == 3
+    assert channel.drops == 2
+
+    async def consume():
+        items = [await channel.get() for _ in range(3)]
+        assert channel.get_loop() is asyncio.get_running_loop()
+        # later pushes from another thread reach the bound loop
+        Thread(target = channel.put, args = (5, )).start()
+        items.append(await asyncio.wait_for(channel.get(), 1))
+        return items
+
+    assert asyncio.run(consume()) == [2, 3, 4, 5]
+
+
+def test_channel_created_in_a_loop_binds_to_it():
+    async def main():
+        channel = AsyncQueueChannel()
+        assert channel.get_loop() is asyncio.get_running_loop()
+        channel.put('x')
+        return channel.get_nowait()
+
+    assert asyncio.run(main()) == 'x'
+
+
+def test_runner_runs_async_and_sync_probes():
+    runner = AsyncProbeRunner()
+    async_probe = SleepyProbe(delay = 0.001)
+    sync_probe = StaticProbe(periodicity = 0.02)
+    failing = SleepyProbe('FailingProbe', fail = ConnectionResetError('reset'))
+    for p in (async_probe, sync_probe, failing):
+        runner.add_probe(p)
+    channel = runner.attachAsyncQueue()
+    runner.start()
+    try:
+        for p in (async_probe, sync_probe, failing):
+            p.activate()
+        end = time.monotonic() + 5
+        while (async_probe.rounds < 3 or sync_probe.get_timing_stats()['ticks'] < 3) and time.monotonic() < end:
+            time.sleep(0.01)
+        assert async_probe.rounds >= 3
+        assert sync_probe.get_timing_stats()['ticks'] >= 3
+        assert failing.errors >= 1
+        # attached before start(), the channel binds to the consumer loop
+        assert channel.get_loop() is None
+        assert channel.qsize() > 0
+        assert asyncio.run(channel.get()) is not None
+        assert runner.attachAsyncQueue() is channel
+    finally:
+        runner.shutdown()
+    assert async_probe.get_probestatus() == ProbeStatus.TERM
+    assert runner.get_loop() is None
@@ -0,0 +1,107 @@
+import json
+import time
+import uuid
+
+import pytest
+
+from Catascopia.Batch import MetricBatch, JSONLinesSerializer, MsgpackSerializer, StructSerializer, BatchDecoder, \
+    decode_batch, CatascopiaSerializationException
+from Catascopia.Metrics import ConcurrentHistogramMetric
+
+from tests.test_probe import StaticProbe
+
+
+def make_batch(entries):
+    return MetricBatch(uuid.uuid4(), 'probe', 1700000000.5, entries,
+                       [{'mid': 0, 'name': 'a', 'units': '#', 'desc': 'a', 'minVal': 0, 'maxVal': 10,
+                         'higherIsBetter': True, 'group': 'probe'}])
+
+
+@pytest.mark.parametrize('serializer', [JSONLinesSerializer(), MsgpackSerializer(), StructSerializer()])
+def test_round_trip(serializer):
+    batch = make_batch([(0, 1700000000.0, 1.5), (1, 1700000000.0, 42), (2, None, None)])
+    decoded = decode_batch(serializer.encode(batch))
+    assert decoded.probeid == batch.probeid
+    assert decoded.probe == 'probe'
+    assert decoded.timestamp == batch.timestamp
+    assert decoded.descriptors == batch.descriptors
+    assert [(m, ts, None if v is None else float(v)) for m, ts, v in decoded.entries] == \
+        [(0, 1700000000.0, 1.5), (1, 1700000000.0, 42.0), (2, None, None)]
+
+
+def test_round_trip_rollups():
+    batch = MetricBatch(uuid.uuid4(), 'probe', 1.0, rollups = [[0, {'count': 3, 'mean': 2.0}]])
+    for serializer in (JSONLinesSerializer(), MsgpackSerializer(), StructSerializer()):
+        assert decode_batch(serializer.encode(batch)).rollups == [[0, {'count': 3, 'mean': 2.0}]]
+
+
+def test_struct_keeps_non_numeric_values_in_place():
+    entries = [(0, 1.0, 1.0), (1, 1.0, {'count': 2, 'sum': 3.0}), (2, 1.0, 2.0), (3, 1.0, 'up')]
+    decoded = decode_batch(StructSerializer().encode(make_batch(entries)))
+    assert decoded.entries == entries
+
+
+def test_struct_rejects_unencodable_values():
+    with pytest.raises(CatascopiaSerializationException):
+        StructSerializer().encode(make_batch([(0, 1.0, object())]))
+
+
+def test_decoder_resolves_mids():
+    decoder = BatchDecoder()
+    batch = decoder.decode(JSONLinesSerializer().encode(make_batch([(0, 5.0, 3.0)])))
+    assert decoder.resolve(batch)[0]['name'] == 'a'
+    assert decoder.resolve(batch)[0]['val'] == 3.0
+
+
+class UnencodableProbe(StaticProbe):
+
+    def collect(self):
+        self.m.set_val(object())
+
+
+def test_unencodable_round_fails_without_killing_the_probe():
+    probe = UnencodableProbe()
+    probe.set_batching(True, StructSerializer())
+    q = probe.attachQueue()
+    probe._tick()
+    assert probe.errors == 1
+    assert probe.get_instrumentation().errors == 1
+    assert q.qsize() == 0
+
+
+def test_histogram_metric_emits_through_struct_serializer():
+    probe = StaticProbe()
+    h = ConcurrentHistogramMetric('latency', 's', 'latency histogram', bounds = (0.1, 1.0))
+    probe.add_metric(h)
+    h.observe(0.05)
+    probe.set_batching(True, StructSerializer())
+    q = probe.attachQueue()
+    probe._tick()
+    assert probe.errors == 0
+    batch = decode_batch(q.get_nowait())
+    assert len(batch.entries) == 2
+
+
+def strict_loads(data):
+    def reject(constant):
+        raise ValueError('non-standard JSON constant ' + constant)
+    return json.loads(data, parse_constant = reject)
+
+
+def test_json_lines_encodes_non_finite_floats_as_null():
+    batch = MetricBatch(uuid.uuid4(), 'probe', 1.0, [(0, 1.0, float('nan')), (1, 1.0, float('inf')), (2, 1.0, 2.5)],
+                        [{'mid': 0, 'name': 'a', 'units': '#', 'desc': 'a', 'minVal': float('-inf'),
+                          'maxVal': float('inf'), 'higherIsBetter': True, 'group': 'probe'}])
+    d = strict_loads(JSONLinesSerializer().encode(batch))
+    assert d['descriptors'][0]['minVal'] is None
+    assert d['descriptors'][0]['maxVal'] is None
+    assert d['metrics'] == [[0, 1.0, None], [1, 1.0, None], [2, 1.0, 2.5]]
+
+
+def test_json_lines_encodes_probe_descriptors_strictly():
+    probe = StaticProbe()
+    probe.set_batching(True, JSONLinesSerializer())
+    q = probe.attachQueue()
+    probe._tick()
+    d = strict_loads(q.get())
+    assert d['descriptors'][0]['maxVal'] is None
@@ -0,0 +1,65 @@
+import queue
+import time
+from threading import Thread
+
+import pytest
+
+from Catascopia.Channel import RingBufferChannel, OverflowPolicy
+from Catascopia.Metrics import SimpleMetric
+
+from tests.test_probe import StaticProbe
+
+
+@pytest.mark.parametrize('policy', [OverflowPolicy.DROP_OLDEST, OverflowPolicy.DROP_NEWEST, OverflowPolicy.SAMPLE])
+def test_counters_hold_with_many_producers(policy):
+    channel = RingBufferChannel(100, policy)
+    n = 5000
+
+    def produce():
+        for i in range(n):
+            channel.put(i)
+    producers = [Thread(target = produce) for _ in range(4)]
+    for t in producers:
+        t.start()
+    for t in producers:
+        t.join()
+    stats = channel.get_stats()
+    assert stats['puts'] == 4 * n
+    assert stats['size'] == 100
+    assert stats['puts'] - stats['drops'] == stats['size']
+
+
+def test_block_policy_waits_for_the_consumer():
+    channel = RingBufferChannel(1, OverflowPolicy.BLOCK, deadline = 1.0)
+    channel.put(1)
+    Thread(target = lambda: (time.sleep(0.05), channel.get())).start()
+    assert channel.put(2)
+    assert channel.get(timeout = 1) == 2
+    assert channel.put(3)
+    assert not channel.put(4, timeout = 0.01)
+    assert channel.get_stats()['drops'] == 1
+
+
+def test_full_queue_drops_without_stalling_the_round():
+    probe = StaticProbe()
+    probe.add_metric(SimpleMetric('n', '#', 'second metric', 0))
+    q = probe.attachQueue(queue.Queue(maxsize = 1))
+    start = time.perf_counter()
+    probe._tick()
+    assert time.perf_counter() - start < 0.05
+    assert q.qsize() == 1
+    assert probe.get_queue_stats()['drops'] == 1
+
+
+class NoSizeQueue(queue.Queue):
+
+    def qsize(self):
+        raise NotImplementedError
+
+
+def test_queue_without_qsize():
+    probe = StaticProbe()
+    q = probe.attachQueue(NoSizeQueue())
+    probe._tick()
+    assert q.get_nowait() == str(probe.m)
+    assert probe.get_queue_stats()['size'] == 0
@@ -0,0 +1,116 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from Catascopia.Decorators import CatascopiaDecorators, MetricSink
+
+
+class Orders(object):
+
+    def save(self):
+        return 'orders'
+
+
+class Users(object):
+
+    def save(self):
+        return 'users'
+
+
+def test_same_named_functions_get_their_own_metrics():
+    Orders.save = CatascopiaDecorators.countit(Orders.save)
+    Users.save = CatascopiaDecorators.countit(Users.save)
+    Orders().save()
+    Orders().save()
+    Users().save()
+    metrics = CatascopiaDecorators.get_probe().get_metrics()
+    orders = metrics['calls__tests.test_decorators.Orders.save']
+    users = metrics['calls__tests.test_decorators.Users.save']
+    orders.refresh()
+    users.refresh()
+    assert orders.get_val() == 2
+    assert users.get_val() == 1
+
+
+def test_timeit_and_errorrate_use_qualified_names():
+    def parse():
+        raise ValueError('bad input')
+    wrapped = CatascopiaDecorators.errorrate(CatascopiaDecorators.timeit(parse))
+    try:
+        wrapped()
+    except ValueError:
+        pass
+    metrics = CatascopiaDecorators.get_probe().get_metrics()
+    qualname = 'tests.test_decorators.test_timeit_and_errorrate_use_qualified_names.<locals>.parse'
+    assert 'time__' + qualname in metrics
+    assert 'errors__' + qualname in metrics
+    assert 'error_rate__' + qualname in metrics
+
+
+def test_sink_writes_strict_json(tmp_path):
+    path = str(tmp_path / 'records.jsonl')
+    sink = MetricSink(path, flush_interval = 60)
+    sink.record('time__f', 'f', 1.0, float('nan'))
+    sink.close()
+    with open(path) as f:
+        d = json.loads(f.read(), parse_constant = lambda c: pytest.fail('non-standard constant ' + c))
+    assert d['maxVal'] is None
+    assert d['val'] is None
+
+
+def read_lines(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def test_sink_flushes_batches_of_flush_size(tmp_path):
+    path = str(tmp_path / 'records.jsonl')
+    sink = MetricSink(path, flush_size = 3, flush_interval = 60)
+    try:
+        for i in range(3):
+            sink.record('time__f', 'f', float(i), 0.1)
+        end = time.monotonic() + 5
+        while not os.path.exists(path) and time.monotonic() < end:
+            time.sleep(0.01)
+        assert [d['timestamp'] for d in read_lines(path)] == [0.0, 1.0, 2.0]
+    finally:
+        sink.close()
+
+
+def test_sink_drops_the_oldest_records_beyond_capacity(tmp_path):
+    path = str(tmp_path / 'records.jsonl')
+    sink = MetricSink(path, flush_size = 100, flush_interval = 60, capacity = 2)
+    for i in range(5):
+        sink.record('time__f', 'f', float(i), 0.1)
+    assert sink.drops == 3
+    # close() writes what is still pending
+    sink.close()
+    assert [d['timestamp'] for d in read_lines(path)] == [3.0, 4.0]
+
+
+def test_sink_retries_a_failed_write(tmp_path):
+    path = str(tmp_path / 'missing' / 'records.jsonl')
+    sink = MetricSink(path, flush_interval = 60)
+    try:
+        sink.record('time__f', 'f', 1.0, 0.1)
+        with pytest.raises(OSError):
+            sink.flush()
+        os.mkdir(str(tmp_path / 'missing'))
+        sink.record('time__f', 'f', 2.0, 0.1)
+        sink.flush()
+        assert [d['timestamp'] for d in read_lines(path)] == [1.0, 2.0]
+    finally:
+        sink.close()
+
+
+def test_sink_flushes_at_exit(tmp_path):
+    path = str(tmp_path / 'records.jsonl')
+    script = ('from Catascopia.Decorators import MetricSink\n'
+              'MetricSink(%r, flush_interval = 60).record("time__f", "f", 1.0, 0.1)\n' % path)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    subprocess.run([sys.executable, '-c', script], cwd = root, check = True)
+    assert [d['timestamp'] for d in read_lines(path)] == [1.0]
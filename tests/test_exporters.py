@@ -0,0 +1,189 @@
+import json
+import random
+import time
+from threading import Lock
+
+import pytest
+
+from Catascopia.exportlib.Exporter import Exporter, CatascopiaExportException
+from Catascopia.exportlib.ExportPipeline import ExportPipeline
+from Catascopia.exportlib.HttpExporter import HttpExporter
+from Catascopia.exportlib.LineProtocolExporter import LineProtocolExporter
+
+from tests.servers import SyntheticProbe, tcp_server, http_server
+
+
+def wait_for(cond, timeout = 10.0):
+    end = time.time() + timeout
+    while not cond() and time.time() < end:
+        time.sleep(0.005)
+    return cond()
+
+
+def ship(probe, rounds):
+    for _ in range(rounds):
+        probe.collect()
+        probe._emit(time.time())
+
+
+@pytest.fixture
+def servers():
+    started = []
+
+    def start(make, *args, **kwargs):
+        server = make(*args, **kwargs)
+        started.append(server)
+        return server
+    yield start
+    for server in started:
+        server.shutdown()
+        server.server_close()
+
+
+def test_line_protocol_tcp_delivers_every_sample(servers):
+    tcp = servers(tcp_server)
+    probe = SyntheticProbe(20)
+    exporter = LineProtocolExporter('127.0.0.1', tcp.server_address[1])
+    pipeline = ExportPipeline([exporter], batch_size = 50, flush_interval = 0.01)
+    pipeline.add_probe(probe)
+    pipeline.start()
+    ship(probe, 10)
+    assert wait_for(lambda: tcp.counter.lines == 200)
+    pipeline.shutdown()
+    stats = pipeline.get_stats()[exporter.name]
+    assert stats['samples'] == 200
+    assert stats['failed'] == stats['dropped'] == 0
+
+
+def test_http_retries_server_errors_with_backoff(servers):
+    flaky = servers(http_server, fail_every = 2, keep = True)
+    probe = SyntheticProbe(5)
+    exporter = HttpExporter('http://127.0.0.1:%d/write' % flaky.server_address[1])
+    pipeline = ExportPipeline([exporter], batch_size = 5, flush_interval = 0.01, backoff = 0.01, retries = 3)
+    pipeline.add_probe(probe)
+    pipeline.start()
+    ship(probe, 4)
+    assert wait_for(lambda: flaky.counter.lines == 20)
+    pipeline.shutdown()
+    stats = pipeline.get_stats()[exporter.name]
+    assert stats['retries'] > 0
+    assert stats['failed'] == 0
+    assert stats['samples'] == 20
+    assert json.loads(flaky.counter.bodies[0].splitlines()[0].decode())['name'] == 'metric0'
+
+
+def test_http_client_errors_are_not_retried(servers):
+    rejecting = servers(http_server, fail_every = 1, fail_status = 400)
+    probe = SyntheticProbe(5)
+    exporter = HttpExporter('http://127.0.0.1:%d/write' % rejecting.server_address[1])
+    pipeline = ExportPipeline([exporter], batch_size = 5, flush_interval = 0.01, backoff = 0.01)
+    pipeline.add_probe(probe)
+    pipeline.start()
+    ship(probe, 1)
+    assert wait_for(lambda: pipeline.get_stats()[exporter.name]['failed'] == 1)
+    pipeline.shutdown()
+    stats = pipeline.get_stats()[exporter.name]
+    assert stats['retries'] == 0
+    assert rejecting.posts == 1
+
+
+def test_http_compression(servers):
+    http = servers(http_server)
+    probe = SyntheticProbe(50)
+    exporter = HttpExporter('http://127.0.0.1:%d/write' % http.server_address[1], 'line', compression = True)
+    pipeline = ExportPipeline([exporter], batch_size = 500, flush_interval = 0.01)
+    pipeline.add_probe(probe)
+    pipeline.start()
+    ship(probe, 10)
+    assert wait_for(lambda: http.counter.lines == 500)
+    pipeline.shutdown()
+    assert http.counter.compressed == http.counter.requests
+    stats = pipeline.get_stats()[exporter.name]
+    # gzip bytes on the wire are well below the size of the decoded line protocol
+    assert 0 < stats['bytes'] < 500 * 20
+
+
+class SlowExporter(Exporter):
+    """exporter holding every batch delay seconds, recording how many batches it had in flight"""
+
+    name = 'slow'
+
+    def __init__(self, delay, fail = 0):
+        self.delay = delay
+        self.fail = fail
+        self.calls = 0
+        self.in_flight = 0
+        self.peak = 0
+        self.lock = Lock()
+
+    def export(self, samples):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            fail = self.calls <= self.fail
+        try:
+            time.sleep(self.delay)
+            if fail:
+                raise CatascopiaExportException('failing on purpose')
+            return len(samples)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
+def test_in_flight_batches_are_bounded():
+    exporter = SlowExporter(0.05)
+    probe = SyntheticProbe(1)
+    pipeline = ExportPipeline([exporter], batch_size = 1, flush_interval = 0.01, max_in_flight = 2,
+                              block_timeout = 0.01)
+    pipeline.add_probe(probe)
+    pipeline.start()
+    ship(probe, 20)
+    pipeline.shutdown()
+    stats = pipeline.get_stats()['slow']
+    assert exporter.peak <= 2
+    assert stats['dropped'] > 0
+    assert stats['samples'] + stats['dropped'] == 20
+
+
+def test_backoff_grows_exponentially(monkeypatch):
+    exporter = SlowExporter(0, fail = 3)
+    probe = SyntheticProbe(1)
+    pipeline = ExportPipeline([exporter], flush_interval = 0.01, retries = 3, backoff = 0.05, max_backoff = 0.1)
+    pipeline.add_probe(probe)
+    # records the upper bound of every jittered delay instead of sleeping
+    delays = []
+    monkeypatch.setattr(random, 'uniform', lambda a, b: delays.append(b) or 0)
+    pipeline.start()
+    ship(probe, 1)
+    assert wait_for(lambda: pipeline.get_stats()['slow']['samples'] == 1)
+    pipeline.shutdown()
+    assert delays == [0.05, 0.1, 0.1]
+    assert pipeline.get_stats()['slow']['retries'] == 3
+
+
+class BrokenExporter(SlowExporter):
+
+    name = 'broken'
+
+    def export(self, samples):
+        with self.lock:
+            self.calls += 1
+        raise ValueError('exporter bug')
+
+
+def test_unexpected_exporter_errors_fail_the_batch():
+    exporter = BrokenExporter(0)
+    probe = SyntheticProbe(1)
+    pipeline = ExportPipeline([exporter], batch_size = 1, flush_interval = 0.01, max_in_flight = 1)
+    pipeline.add_probe(probe)
+    pipeline.start()
+    ship(probe, 3)
+    assert wait_for(lambda: pipeline.get_stats()['broken']['failed'] == 3)
+    pipeline.shutdown()
+    stats = pipeline.get_stats()['broken']
+    # never retried, and the in flight slot got released every time
+    assert exporter.calls == 3
+    assert stats['retries'] == 0
+    assert stats['dropped'] == 0
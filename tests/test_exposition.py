@@ -0,0 +1,56 @@
+import gzip
+import time
+import urllib.request
+
+from Catascopia.exportlib.ExpositionServer import ExpositionServer
+from Catascopia.exportlib.PrometheusExporter import PrometheusExporter
+
+from tests.test_probe import StaticProbe
+
+
+def scrape(exposition, encoding = None):
+    request = urllib.request.Request('http://127.0.0.1:%d/metrics' % exposition.get_address()[1])
+    if encoding:
+        request.add_header('Accept-Encoding', encoding)
+    return urllib.request.urlopen(request).read()
+
+
+def wait_for(cond, timeout = 5.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.005)
+    return True
+
+
+def test_scrapes_serve_the_published_snapshot():
+    exposition = ExpositionServer('127.0.0.1', 0, min_interval = 0.2)
+    try:
+        probe = StaticProbe()
+        exposition.add_probe(probe)
+        assert wait_for(lambda: exposition.renders == 1)
+        # rounds within min_interval coalesce into a single rebuild
+        for _ in range(5):
+            probe._tick()
+        assert wait_for(lambda: exposition.renders == 2)
+        time.sleep(0.3)
+        assert exposition.renders == 2
+        body = scrape(exposition)
+        assert b'catascopia_m{probe="StaticProbe"} 1\n' in body
+        # scrapes never rebuild, they share the published snapshot
+        assert gzip.decompress(scrape(exposition, 'gzip')) == body
+        assert exposition.renders == 2
+        assert exposition.get_stats()['scrapes'] == 2
+        exposition.remove_probe(probe)
+        assert wait_for(lambda: b'catascopia_m' not in scrape(exposition))
+    finally:
+        exposition.close()
+    assert not exposition._publisher.is_alive()
+
+
+def test_default_port_differs_from_the_exporter():
+    ports = {9100, ExpositionServer.DEFAULT_PORT, PrometheusExporter.DEFAULT_PORT}
+    assert len(ports) == 3
+    assert ExpositionServer.__init__.__defaults__[1] == ExpositionServer.DEFAULT_PORT
+    assert PrometheusExporter.__init__.__defaults__[1] == PrometheusExporter.DEFAULT_PORT
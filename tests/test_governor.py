@@ -0,0 +1,46 @@
+from Catascopia.Governor import OverheadGovernor, ShedAction
+
+from tests.test_probe import StaticProbe
+
+
+def test_stretch_survives_periodicity_changes():
+    probe = StaticProbe()
+    governor = OverheadGovernor(cpu_budget = None, memory_budget = 1, stretch = 2.0, max_stretch = 4.0)
+    governor.add_probe(probe)
+    assert governor._shed({}) == (ShedAction.STRETCH, probe, 1.0)
+    assert governor._shed({}) == (ShedAction.STRETCH, probe, 2.0)
+    assert governor._apply(ShedAction.STRETCH, probe) is None
+    # a config reload or adaptive periodicity change the periodicity, not the stretch
+    probe.set_periodicity(10)
+    assert probe.get_effective_periodicity() == 40
+    probe.set_adaptive(5, 20)
+    probe.clear_adaptive()
+    assert probe.get_effective_periodicity() == 40
+    probe._deadline = 100.0
+    assert probe._advance_deadline(100.0) == 140.0
+    governor.shutdown()
+    assert probe.get_stretch() == 1.0
+    assert probe.get_effective_periodicity() == 10
+
+
+def test_memory_budget_follows_the_probe_footprint():
+    probe = StaticProbe()
+    probe.set_batching(True)
+    queue = probe.attachQueue(capacity = 100000)
+    governor = OverheadGovernor(cpu_budget = None, memory_budget = 0.1, calm = 2)
+    governor.add_probe(probe)
+    governor.evaluate()
+    for _ in range(2000):
+        probe._tick()
+    assert probe.get_footprint()['queue'] > 0.1 * (1 << 20)
+    governor._last -= 1
+    assert governor.evaluate() == (ShedAction.STRETCH, probe)
+    # once the consumer caught up the footprint shrinks and the step is restored
+    queue.drain()
+    probe._tick()
+    governor._last -= 1
+    assert governor.evaluate() is None
+    governor._last -= 1
+    assert governor.evaluate() == (ShedAction.STRETCH, probe)
+    assert probe.get_stretch() == 1.0
+    assert governor.get_stats()['restored'] == 1
@@ -0,0 +1,70 @@
+import pytest
+
+from Catascopia.History import MetricHistory, HistoryStore, CatascopiaHistoryException
+from Catascopia.Metrics import MetricTable
+
+from tests.test_probe import StaticProbe
+
+
+def filled(capacity, samples):
+    h = MetricHistory(capacity)
+    for ts, val in samples:
+        h.append(ts, val)
+    return h
+
+
+def test_history_keeps_the_newest_samples_in_order():
+    h = filled(4, [(i, i * 10.0) for i in range(6)])
+    ts, vals = h.samples()
+    assert list(ts) == [2, 3, 4, 5]
+    assert list(vals) == [20.0, 30.0, 40.0, 50.0]
+    h.extend([6, 7, 8], [60.0, 70.0, 80.0])
+    assert list(h.samples()[0]) == [5, 6, 7, 8]
+    assert len(h) == 4
+
+
+def test_history_queries():
+    h = filled(10, [(0, 1.0), (1, 3.0), (2, 5.0), (3, 1.0)])
+    assert list(h.range(1, 2)[1]) == [3.0, 5.0]
+    assert list(h.window(1)[1]) == [5.0, 1.0]
+    assert h.stats()['max'] == 5.0
+    assert h.stats(10, 20)['count'] == 0
+    assert list(h.derivative()[1]) == [2.0, 2.0, -4.0]
+    # a decrease of a counter is a reset, counted from zero
+    assert list(h.derivative(counter = True)[1]) == [2.0, 2.0, 1.0]
+    assert h.rate() == pytest.approx(0.0)
+    assert h.rate(counter = True) == pytest.approx(5.0 / 3)
+    ts, out = h.downsample(2, how = 'sum')
+    assert list(ts) == [0.0, 2.0]
+    assert list(out) == [4.0, 6.0]
+    with pytest.raises(CatascopiaHistoryException):
+        h.downsample(2, how = 'median')
+
+
+def test_store_skips_values_not_updated_and_filters_names():
+    table = MetricTable()
+    a = table.register('a', '#', 'a')
+    b = table.register('b', '#', 'b')
+    store = HistoryStore(table, capacity = 8, metrics = ['a'])
+    store.record([(a, 1.0, 5.0), (b, 1.0, 7.0)], 10.0)
+    store.record([(a, 1.0, 5.0), (b, 1.0, 7.0)], 10.5)
+    store.record([(a, 2.0, 6.0)], 11.0)
+    assert store.names() == ['a']
+    assert list(store.get('a').samples()[0]) == [10.0, 11.0]
+    assert store.get('b') is None
+    store.forget(a)
+    assert store.get(a) is None
+
+
+def test_probe_history_uses_the_round_timestamp():
+    probe = StaticProbe()
+    probe.set_history(capacity = 16)
+    values = iter(range(1, 4))
+    probe.collect = lambda: probe.m.set_val(next(values))
+    for _ in range(3):
+        probe._tick()
+    ts, vals = probe.get_history().get('m').samples()
+    assert list(vals) == [1.0, 2.0, 3.0]
+    # rounds within the same second still get increasing timestamps
+    assert all(ts[1:] > ts[:-1])
+    assert probe.get_history().get('m').rate() is not None
@@ -0,0 +1,91 @@
+import sys
+import time
+from threading import Thread
+
+import pytest
+
+from Catascopia.Instrumentation import CollectProfiler, CatascopiaInstrumentationException
+from Catascopia.Scheduler import ProbeScheduler
+
+from tests.test_probe import StaticProbe
+
+
+def busy_work():
+    return sum(i * i for i in range(2000))
+
+
+def test_profiler_samples_one_round_in_every():
+    profiler = CollectProfiler(every = 3)
+    picked = []
+    for _ in range(7):
+        picked.append(profiler.sample())
+        if picked[-1]:
+            profiler.start(None)
+            profiler.stop(None)
+    assert picked == [True, False, False, True, False, False, True]
+    assert profiler.sampled == 3
+    with pytest.raises(CatascopiaInstrumentationException):
+        CollectProfiler(every = 0)
+
+
+def test_profiler_shared_by_threads():
+    profiler = CollectProfiler(every = 1)
+    errors = []
+
+    def rounds():
+        try:
+            for _ in range(50):
+                if profiler.sample():
+                    profiler.start(None)
+                    try:
+                        busy_work()
+                    finally:
+                        profiler.stop(None)
+        except Exception as e:
+            errors.append(e)
+
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    try:
+        threads = [Thread(target = rounds) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+    assert profiler.sampled > 0
+    # every round got either profiled or skipped while another thread held the profiler
+    assert profiler.sampled + profiler.skipped == 200
+    assert 'busy_work' in profiler.report()
+    profiler.reset()
+    assert profiler.report() == ''
+
+
+class ProfiledProbe(StaticProbe):
+
+    def collect(self):
+        busy_work()
+        self.m.set_val(1)
+
+
+def test_profiler_across_scheduler_workers():
+    profiler = CollectProfiler(every = 1)
+    scheduler = ProbeScheduler(workers = 4)
+    probes = [ProfiledProbe('ProfiledProbe%d' % i, 0.01) for i in range(4)]
+    for p in probes:
+        p.set_profiler(profiler)
+        scheduler.add_probe(p)
+    scheduler.start()
+    try:
+        for p in probes:
+            p.activate()
+        end = time.monotonic() + 5
+        while profiler.sampled < 10 and time.monotonic() < end:
+            time.sleep(0.01)
+    finally:
+        scheduler.shutdown()
+    assert profiler.sampled >= 10
+    assert all(p.errors == 0 for p in probes)
+    assert 'busy_work' in profiler.report()
@@ -0,0 +1,192 @@
+import sys
+from threading import Thread
+
+from Catascopia.Metrics import MetricTable, SimpleMetric, ConcurrentCounterMetric, ConcurrentGaugeMetric, \
+    ConcurrentHistogramMetric, EmissionFilter, MutedFilter, _Shards
+
+from tests.test_probe import StaticProbe
+
+
+def test_table_registration_from_threads_while_emitting():
+    probe = StaticProbe()
+    probe.set_batching(True)
+    table = probe.get_metric_table()
+    nthreads, per_thread = 4, 5000
+    errors = []
+
+    def register(i):
+        try:
+            for j in range(per_thread):
+                if j % 2:
+                    mid = table.register('v%d_%d' % (i, j), '#', 'array value')
+                    table.set_val(mid, j)
+                else:
+                    m = SimpleMetric('m%d_%d' % (i, j), '#', 'metric object', 0)
+                    probe.add_metric(m)
+                    m.set_val(j)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [Thread(target = register, args = (i, )) for i in range(nthreads)]
+    # switch threads as often as possible to interleave registrations and emission
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        for t in threads:
+            t.start()
+        while any(t.is_alive() for t in threads):
+            table.fill_entries([])
+            table.fill_array_entries([], 0.0)
+            probe.get_batch(1.0, True, filtered = True)
+        for t in threads:
+            t.join()
+    finally:
+        sys.setswitchinterval(interval)
+    assert errors == []
+    assert len(table) == nthreads * per_thread + 1
+    mids = [d.mid for d in table.get_descriptors()]
+    assert mids == list(range(len(table)))
+    assert len(table.fill_entries([])) == len(table)
+
+
+def test_table_reuses_released_mids():
+    table = MetricTable()
+    a = table.register('a', '#', 'a')
+    b = table.register('b', '#', 'b')
+    table.set_val(a, 1.0, 5.0)
+    version = table.version
+    table.unregister(a)
+    assert table.version == version + 1
+    assert table.get_descriptor(a) is None
+    assert table.get_val(a) is None
+    assert table.register('c', '#', 'c') == a
+    assert table.get_descriptor(a).name == 'c'
+    assert len(table) == 2
+    assert b == 1
+
+
+def run_threads(n, target, *args):
+    threads = [Thread(target = target, args = args) for _ in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def test_shards_fold_the_cells_of_exited_threads():
+    shards = _Shards(2)
+
+    def work():
+        c = shards.cell()
+        for _ in range(1000):
+            c[0] += 1
+            c[1] += 2
+    run_threads(4, work)
+    assert shards.merge() == [4000, 8000]
+    # the cells of the exited threads got retired, merging again counts them once
+    assert shards._cells == []
+    assert shards.merge() == [4000, 8000]
+    shards.cell()[0] += 1
+    assert shards.merge() == [4001, 8000]
+
+
+def test_concurrent_counter_totals_are_exact():
+    counter = ConcurrentCounterMetric('calls', delta = True)
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        run_threads(8, lambda: [counter.inc() for _ in range(20000)])
+    finally:
+        sys.setswitchinterval(interval)
+    assert counter.get_count() == 160000
+    counter.refresh()
+    assert counter.get_val() == 160000
+    run_threads(2, counter.inc, 5)
+    counter.refresh()
+    # with delta the value is the increase since the previous emission
+    assert counter.get_val() == 10
+
+
+def test_concurrent_gauge_moves_from_set():
+    gauge = ConcurrentGaugeMetric('in_flight')
+    run_threads(4, lambda: [gauge.add() for _ in range(100)])
+    gauge.set(10)
+    run_threads(2, gauge.sub, 3)
+    gauge.refresh()
+    assert gauge.get_val() == 4
+
+
+def test_concurrent_histogram_from_threads():
+    h = ConcurrentHistogramMetric('latency', bounds = (1.0, 10.0))
+
+    def observe():
+        for val in (0.5, 5.0, 50.0):
+            h.observe(val)
+    run_threads(4, observe)
+    hist = h.get_histogram()
+    assert hist['count'] == 12
+    assert hist['sum'] == 4 * 55.5
+    assert hist['buckets'] == [[1.0, 4], [10.0, 8], [float('inf'), 12]]
+
+
+def test_filter_deadband_compares_with_the_last_emitted_value():
+    f = EmissionFilter(deadband = 1.0)
+    assert [f.passes(v, 0.0) for v in (10.0, 10.5, 10.9, 11.5, 11.0)] == [True, False, False, True, False]
+    assert (f.emitted, f.suppressed) == (2, 3)
+    assert f.last_val == 11.5
+
+
+def test_filter_relative_and_on_change():
+    f = EmissionFilter(relative = 0.1)
+    assert [f.passes(v, 0.0) for v in (100.0, 105.0, 111.0)] == [True, False, True]
+    f = EmissionFilter()
+    assert [f.passes(v, 0.0) for v in ('up', 'up', 'down')] == [True, False, True]
+    f = EmissionFilter(on_change = False)
+    assert [f.passes(v, 0.0) for v in (1, 1)] == [True, True]
+
+
+def test_filter_heartbeat_forces_an_emission():
+    f = EmissionFilter(deadband = 1.0, heartbeat = 10.0)
+    assert f.passes(5.0, 0.0)
+    assert not f.passes(5.0, 9.0)
+    assert f.passes(5.0, 10.0)
+    # the heartbeat counts from the last emission
+    assert not f.passes(5.0, 19.0)
+    f.reset()
+    assert f.passes(5.0, 19.5)
+    assert MutedFilter().copy().passes(5.0, 0.0) is False
+
+
+def test_fill_array_entries_applies_the_filters():
+    table = MetricTable()
+    metric = SimpleMetric('object', '#', 'Metric object', 0)
+    table.register_metric(metric)
+    metric.set_val(1)
+    a = table.register('a', '#', 'a')
+    b = table.register('b', '#', 'b')
+    unset = table.register('unset', '#', 'never set')
+    table.set_val(a, 1.0, 100.0)
+    table.set_val(b, 2.0, 100.0)
+    table.set_filter(b, EmissionFilter(deadband = 5.0))
+    # Metric objects and values never set are left out, without now every value set is returned
+    assert table.fill_array_entries([]) == [(a, 100.0, 1.0), (b, 100.0, 2.0)]
+    assert table.fill_array_entries([], 0.0) == [(a, 100.0, 1.0), (b, 100.0, 2.0)]
+    table.set_val(b, 4.0, 101.0)
+    assert table.fill_array_entries([], 1.0) == [(a, 100.0, 1.0)]
+    table.set_val(b, 8.0, 102.0)
+    assert table.fill_array_entries([], 2.0) == [(a, 100.0, 1.0), (b, 102.0, 8.0)]
+    assert table.get_filter(b).suppressed == 1
+    table.unregister(a)
+    assert table.fill_array_entries([]) == [(b, 102.0, 8.0)]
+    assert unset not in [mid for mid, ts, val in table.fill_entries([])]
+
+
+def test_probe_emission_filter_suppresses_legacy_values():
+    probe = StaticProbe()
+    probe.set_emission_filter(deadband = 0.5, heartbeat = 3600)
+    q = probe.attachQueue()
+    for _ in range(3):
+        probe._tick()
+    # the constant value goes out once, the heartbeat is far off
+    assert q.qsize() == 1
+    assert probe.get_metric('m').filter.suppressed == 2
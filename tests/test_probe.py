@@ -0,0 +1,100 @@
+import os
+import time
+
+from Catascopia.Probe import Probe
+from Catascopia.Metrics import SimpleMetric
+
+
+class StaticProbe(Probe):
+
+    def __init__(self, name = 'StaticProbe', periodicity = 1, **kwargs):
+        super(StaticProbe, self).__init__(name, periodicity, **kwargs)
+        self.m = SimpleMetric('m', '#', 'static metric', 0)
+        self.add_metric(self.m)
+
+    def get_desc(self):
+        return "StaticProbe sets a constant"
+
+    def collect(self):
+        self.m.set_val(1)
+
+
+def test_set_logging_writes_to_rotating_file(tmp_path):
+    probe = StaticProbe()
+    probe.set_logging(str(tmp_path))
+    assert probe.logging
+    probe._writeToLog('hello')
+    with open(os.path.join(str(tmp_path), 'logs', 'StaticProbe', 'StaticProbe.log')) as f:
+        assert 'hello' in f.read()
+
+
+def test_removed_metric_is_forgotten_everywhere():
+    from Catascopia.Metrics import SimpleMetric
+    probe = StaticProbe()
+    extra = SimpleMetric('extra', '#', 'extra metric', 0)
+    probe.add_metric(extra)
+    extra.set_val(5)
+    probe.set_batching(True)
+    probe.set_aggregation(60)
+    mid = extra.mid
+    probe._tick()
+    version = probe.get_metric_table().version
+    probe.remove_metric('extra')
+    table = probe.get_metric_table()
+    assert table.version > version
+    assert table.get_descriptor(mid) is None
+    assert mid not in probe.get_aggregator()._summaries
+    assert [d['name'] for d in table.get_descriptor_dicts()] == ['m']
+    # emission filters and batches skip the released mid
+    probe.set_emission_filter(deadband = 1)
+    assert probe.get_batch(descriptors = True).descriptors == table.get_descriptor_dicts()
+    # the mid is reused by the next registration, with its own descriptor
+    assert table.register('array', '#', 'array backed') == mid
+    assert table.get_descriptor(mid).name == 'array'
+
+
+def test_legacy_emission_includes_array_backed_values():
+    probe = StaticProbe()
+    table = probe.get_metric_table()
+    mid = table.register('requests', '#', 'requests served', group = 'web')
+    table.register('unset', '#', 'value never set')
+    table.set_val(mid, 7.0, 100.0)
+    q = probe.attachQueue()
+    probe._tick()
+    items = [q.get_nowait() for _ in range(q.qsize())]
+    assert len(items) == 2
+    assert items[0] == str(probe.m)
+    assert items[1] == str({'name': 'requests', 'units': '#', 'desc': 'requests served', 'timestamp': 100.0,
+                            'val': 7.0, 'higherIsBetter': True, 'minVal': float('-inf'), 'maxVal': float('inf'),
+                            'group': 'web'})
+    assert probe.get_emission_stats()['emitted'] == 2
+
+
+class TogglingProbe(StaticProbe):
+
+    def __init__(self):
+        super(TogglingProbe, self).__init__('TogglingProbe', 0.01)
+        self.rounds = 0
+
+    def collect(self):
+        self.rounds += 1
+        if self.rounds == 2:
+            # pausing and resuming from collect() restarts the deadline grid mid round
+            self.deactivate()
+            self.activate()
+        self.m.set_val(self.rounds)
+
+
+def test_reactivation_during_collect_reseeds_the_deadline():
+    probe = TogglingProbe()
+    probe.activate()
+    try:
+        end = time.monotonic() + 5
+        while probe.rounds < 5 and time.monotonic() < end:
+            time.sleep(0.01)
+        assert probe.rounds >= 5
+        assert probe.is_alive()
+        assert probe.errors == 0
+    finally:
+        probe.terminate()
+        probe.join(1)
@@ -0,0 +1,136 @@
+import queue
+import time
+import uuid
+
+import pytest
+
+from Catascopia.Batch import MetricBatch, StructSerializer
+from Catascopia.Channel import RingBufferChannel
+from Catascopia.ProbeHost import ProbeHost
+from Catascopia.SharedRing import SharedRing, CatascopiaRingException
+
+
+def wait_for(cond, timeout = 10.0):
+    end = time.monotonic() + timeout
+    while not cond():
+        if time.monotonic() > end:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_ring_round_trip_and_wrap(tmp_path):
+    ring = SharedRing.create(256, str(tmp_path))
+    reader = SharedRing(ring.path)
+    try:
+        for i in range(50):
+            assert ring.put(b'record-%03d' % i)
+            assert reader.get() == b'record-%03d' % i
+        assert reader.get() is None
+        assert ring.get_drops() == 0
+    finally:
+        reader.close()
+        ring.close(unlink = True)
+
+
+def test_ring_drops_when_full(tmp_path):
+    ring = SharedRing.create(128, str(tmp_path))
+    try:
+        puts = sum(ring.put(b'x' * 20) for _ in range(10))
+        assert 0 < puts < 10
+        assert ring.get_drops() == 10 - puts
+        # records larger than half the ring never fit
+        assert not ring.put(b'x' * 100)
+        assert len(ring.drain()) == puts
+    finally:
+        ring.close(unlink = True)
+
+
+def test_ring_rejects_bad_capacity(tmp_path):
+    with pytest.raises(CatascopiaRingException):
+        SharedRing(str(tmp_path / 'ring'), 100)
+
+
+class FailingQueue(object):
+
+    def put_nowait(self, item):
+        raise RuntimeError('consumer broke')
+
+
+def encoded(probeid, descriptors = None):
+    return StructSerializer().encode(MetricBatch(probeid, 'probe', 1.0, [(0, 1.0, 2.0)], descriptors))
+
+
+def test_deliver_counts_full_queue_and_survives_errors():
+    host = ProbeHost()
+    probeid = uuid.uuid4()
+    host.attachQueue(queue.Queue(maxsize = 1))
+    host._safe_deliver(encoded(probeid))
+    host._safe_deliver(encoded(probeid))
+    assert host.batches == 2
+    assert host.drops == 1
+    host.attachQueue(FailingQueue())
+    host._safe_deliver(encoded(probeid))
+    assert host.errors == 1
+    assert host.get_stats()['drops'] == 1
+
+
+def test_deliver_resends_descriptors_to_late_queue():
+    host = ProbeHost()
+    probeid = uuid.uuid4()
+    descriptors = [{'mid': 0, 'name': 'a', 'units': '#', 'desc': 'a', 'minVal': 0, 'maxVal': 10,
+                    'higherIsBetter': True, 'group': 'probe'}]
+    host._safe_deliver(encoded(probeid, descriptors))
+    q = host.attachQueue()
+    host._safe_deliver(encoded(probeid))
+    host._safe_deliver(encoded(probeid))
+    first, second = q.get(), q.get()
+    assert first.descriptors == descriptors
+    assert second.descriptors is None
+
+
+@pytest.fixture
+def host():
+    h = ProbeHost(poll_interval = 0.001)
+    yield h
+    h.terminate()
+
+
+def test_host_spawns_and_delivers(host):
+    remote = host.add_probe('tests.servers:SyntheticProbe', 3)
+    q = host.attachQueue(RingBufferChannel(1000))
+    host.start()
+    assert host.get_probe('SyntheticProbe') is remote
+    remote.set_periodicity(0.05)
+    remote.activate()
+    assert wait_for(lambda: q.qsize() >= 2)
+    first = q.get()
+    assert first.probe == 'SyntheticProbe'
+    assert first.probeid == remote.get_probeid()
+    assert len(first.descriptors) == len(first.entries) == 3
+    # a queue attached late gets the descriptors again on its first batch
+    q = host.attachQueue(RingBufferChannel(1000))
+    assert wait_for(lambda: q.qsize() >= 1)
+    assert len(q.get().descriptors) == 3
+    remote.deactivate()
+    assert remote.refresh() == remote.get_probestatus()
+
+
+def test_host_full_queue_does_not_stall_reader(host):
+    remote = host.add_probe('tests.servers:SyntheticProbe', 1)
+    host.attachQueue(queue.Queue(maxsize = 1))
+    host.start()
+    remote.set_periodicity(0.02)
+    remote.activate()
+    assert wait_for(lambda: host.drops >= 3)
+    assert host.get_stats()['workers'][0]['alive']
+    assert host._reader.is_alive()
+
+
+def test_terminate_is_idempotent():
+    host = ProbeHost()
+    host.add_probe('tests.servers:SyntheticProbe', 1)
+    host.start()
+    host.terminate()
+    host.terminate()
+    assert host.get_stats()['workers'] == []
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+from Catascopia.ProcFS import physical_disks, get_backend
+
+
+def test_physical_disks_leave_out_virtual_devices(tmp_path):
+    devices = tmp_path / 'devices'
+    block = tmp_path / 'block'
+    block.mkdir()
+    for name, parent in (('sda', 'pci0000:00/0000:00:1f.2/ata1/host0/target0:0:0/0:0:0:0/block'),
+                         ('nvme0n1', 'pci0000:00/0000:00:1d.0/nvme/nvme0/block'),
+                         ('dm-0', 'virtual/block'), ('loop0', 'virtual/block'), ('zram0', 'virtual/block'),
+                         ('md0', 'virtual/block')):
+        target = devices / parent / name
+        target.mkdir(parents = True)
+        os.symlink(str(target), str(block / name))
+    assert physical_disks(str(block)) == ['nvme0n1', 'sda']
+    assert physical_disks(str(tmp_path / 'missing')) is None
+
+
+@pytest.mark.skipif(not os.path.exists('/proc/meminfo'), reason = 'requires /proc')
+def test_memory_matches_psutil():
+    psutil = pytest.importorskip('psutil')
+    vm = psutil.virtual_memory()
+    m = get_backend('procfs').memory()
+    assert m.total == vm.total
+    # the two reads are apart in time, page cache and usage may move a little
+    assert m.used == pytest.approx(vm.used, rel = 0.05)
+    assert m.cached == pytest.approx(vm.cached, rel = 0.05)
+    assert m.buffers == pytest.approx(vm.buffers, rel = 0.05)
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from Catascopia.Probe import OverrunPolicy
+from Catascopia.Scheduler import ProbeScheduler
+
+from tests.test_probe import StaticProbe
+
+
+def probe_at(deadline, policy, periodicity = 1.0):
+    probe = StaticProbe()
+    probe.set_periodicity(periodicity)
+    probe.set_overrun_policy(policy)
+    probe._deadline = deadline
+    return probe
+
+
+@pytest.mark.parametrize('policy', [OverrunPolicy.SKIP, OverrunPolicy.CATCHUP, OverrunPolicy.COALESCE])
+def test_on_time_round_keeps_the_grid(policy):
+    probe = probe_at(100.0, policy)
+    assert probe._advance_deadline(100.4) == 101.0
+    assert probe._advance_deadline(101.2) == 102.0
+    assert probe.get_timing_stats()['missed_ticks'] == 0
+
+
+def test_skip_waits_for_the_first_deadline_ahead():
+    probe = probe_at(100.0, OverrunPolicy.SKIP)
+    # the round took 3.5 periods, deadlines 101, 102 and 103 were missed
+    assert probe._advance_deadline(103.5) == 104.0
+    assert probe.get_timing_stats()['missed_ticks'] == 3
+
+
+def test_catchup_keeps_every_grid_deadline():
+    probe = probe_at(100.0, OverrunPolicy.CATCHUP)
+    assert probe._advance_deadline(103.5) == 101.0
+    assert probe._advance_deadline(103.6) == 102.0
+    assert probe._advance_deadline(103.7) == 103.0
+    assert probe._advance_deadline(103.8) == 104.0
+    assert probe.get_timing_stats()['missed_ticks'] == 0
+
+
+def test_coalesce_runs_one_immediate_round():
+    probe = probe_at(100.0, OverrunPolicy.COALESCE)
+    deadline = probe._advance_deadline(103.5)
+    assert deadline == 103.0
+    assert probe._advance_deadline(103.6) == 104.0
+    assert probe.get_timing_stats()['missed_ticks'] == 2
+
+
+def test_error_backoff_never_runs_back_to_back():
+    probe = probe_at(100.0, OverrunPolicy.CATCHUP)
+    # 3 consecutive errors stretch the period to 3s, aligned on the stretched grid
+    assert probe._advance_deadline(100.5, backoff = 3) == 103.0
+    assert probe._advance_deadline(110.0, backoff = 3) == 112.0
+
+
+def test_lateness_is_measured_against_the_deadline(monkeypatch):
+    probe = probe_at(100.0, OverrunPolicy.SKIP)
+    monkeypatch.setattr(time, 'monotonic', lambda: 100.25)
+    probe._tick_started()
+    stats = probe.get_timing_stats()
+    assert stats['lateness_last'] == pytest.approx(0.25)
+    assert stats['late_ticks'] == 0
+
+
+def test_scheduler_runs_probes_on_their_period():
+    scheduler = ProbeScheduler(workers = 2)
+    probes = [StaticProbe() for _ in range(3)]
+    for probe in probes:
+        probe.set_periodicity(0.02)
+        probe.attachQueue(capacity = 1000)
+        scheduler.add_probe(probe)
+    scheduler.start()
+    for probe in probes:
+        probe.activate()
+    time.sleep(0.3)
+    scheduler.shutdown(terminate_probes = True)
+    for probe in probes:
+        ticks = probe.get_timing_stats()['ticks']
+        assert 5 <= ticks <= 20
+        assert not probe.is_alive()
@@ -0,0 +1,100 @@
+import os
+
+from Catascopia.SegmentStore import SegmentStore, Segment
+
+from tests.test_probe import StaticProbe
+
+
+def entries(n, start = 0):
+    return [(i % 3, 1000.0 + i, float(i)) for i in range(start, start + n)]
+
+
+def test_reopen_resumes_after_the_last_record(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_records = 16)
+    assert store.append_entries(entries(40)) == 40
+    store.close()
+
+    store = SegmentStore(str(tmp_path), segment_records = 16)
+    assert store.next_seq() == 40
+    assert store.append(0, 2000.0, 40.0) == 40
+    records, seq = store.read(0, 100)
+    assert seq == 41
+    assert [val for mid, ts, val in records] == [float(i) for i in range(41)]
+    store.close()
+
+
+def test_non_numeric_values_are_skipped(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    assert store.append_entries([(0, 1.0, 1.0), (1, 1.0, 'up'), (2, None, 2.0), (3, 1.0, True), (4, 1.0, 5)]) == 2
+    assert store.read(0)[0] == [(0, 1.0, 1.0), (4, 1.0, 5.0)]
+    store.close()
+
+
+def test_torn_write_marks_the_end_of_the_data(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_records = 16)
+    store.append_entries(entries(10))
+    path = store._active.path
+    store.close()
+    # corrupt the value of record 6, as a write cut short by a crash
+    with open(path, 'r+b') as f:
+        f.seek(Segment.HEADER_SIZE + 6 * Segment.RECORD.size + 8)
+        f.write(b'\xff' * 4)
+    store = SegmentStore(str(tmp_path), segment_records = 16)
+    assert store.next_seq() == 6
+    store.close()
+
+
+def test_named_cursor_replays_from_its_committed_position(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_records = 8)
+    store.append_entries(entries(20))
+    cursor = store.cursor('exporter')
+    assert len(cursor.read(12)) == 12
+    cursor.commit()
+    assert len(cursor.read(100)) == 8
+    store.close()
+
+    # restarted consumer resumes at the committed position, not where it stopped reading
+    store = SegmentStore(str(tmp_path), segment_records = 8)
+    store.append_entries(entries(5, 20))
+    cursor = store.cursor('exporter')
+    assert cursor.get_position() == 12
+    assert cursor.lag() == 13
+    assert [val for mid, ts, val in cursor] == [float(i) for i in range(12, 25)]
+    assert store.cursor('other', start = 'latest').read() == []
+    store.close()
+
+
+def test_retention_drops_old_segments_and_counts_lost_records(tmp_path):
+    size = Segment.HEADER_SIZE + 8 * Segment.RECORD.size
+    store = SegmentStore(str(tmp_path), segment_records = 8, max_bytes = 2 * size)
+    cursor = store.cursor()
+    store.append_entries(entries(40))
+    assert store.get_stats()['segments'] <= 3
+    assert store.first_seq() > 0
+    records = cursor.read(100)
+    assert cursor.lost == store.first_seq()
+    assert len(records) + cursor.lost == 40
+    assert len([n for n in os.listdir(str(tmp_path)) if n.endswith('.seg')]) == store.get_stats()['segments']
+    store.close()
+
+
+def test_readonly_reader_follows_the_writer(tmp_path):
+    writer = SegmentStore(str(tmp_path), segment_records = 8)
+    writer.append_entries(entries(5))
+    reader = SegmentStore(str(tmp_path), readonly = True)
+    cursor = reader.cursor()
+    assert len(cursor.read()) == 5
+    writer.append_entries(entries(10, 5))
+    assert len(cursor.read()) == 10
+    reader.close()
+    writer.close()
+
+
+def test_probe_store_persists_descriptors(tmp_path):
+    probe = StaticProbe()
+    store = probe.attachStore(path = str(tmp_path))
+    probe._tick()
+    probe._tick()
+    assert [val for mid, ts, val in store.read(0)[0]] == [1.0, 1.0]
+    assert store.get_descriptors()[0]['name'] == 'm'
+    probe.dettachStore()
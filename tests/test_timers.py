@@ -0,0 +1,83 @@
+import time
+from threading import Event
+
+import pytest
+
+from Catascopia.Metrics import TimerMetric
+from Catascopia.Timers import TimerService
+
+
+@pytest.fixture
+def service():
+    s = TimerService('TestTimerService')
+    yield s
+    s.shutdown()
+
+
+def test_timers_fire_in_deadline_order(service):
+    fired = []
+    done = Event()
+    service.schedule(0.06, lambda: (fired.append('c'), done.set()))
+    service.schedule(0.02, fired.append, 'a')
+    service.schedule(0.04, fired.append, 'b')
+    assert done.wait(2)
+    assert fired == ['a', 'b', 'c']
+    assert service.pending() == 0
+
+
+def test_cancelled_timers_never_fire(service):
+    fired = []
+    done = Event()
+    handle = service.schedule(0.02, fired.append, 'cancelled')
+    service.schedule(0.04, done.set)
+    handle.cancel()
+    assert handle.cancelled and not handle.fired
+    assert service.pending() == 1
+    assert done.wait(2)
+    assert fired == []
+
+
+def test_rescheduling_fires_only_the_new_timer(service):
+    fired = []
+    done = Event()
+    first = service.schedule(0.02, fired.append, 'first')
+    first.cancel()
+    second = service.schedule(0.03, lambda: (fired.append('second'), done.set()))
+    assert done.wait(2)
+    assert fired == ['second']
+    assert second.fired and not second.cancelled
+    # cancelling a fired timer has no effect on the pending count
+    second.cancel()
+    assert not second.cancelled
+    assert service.pending() == 0
+
+
+def test_failing_callback_does_not_stop_the_service(service):
+    done = Event()
+    service.schedule(0.01, lambda: 1 / 0)
+    service.schedule(0.02, done.set)
+    assert done.wait(2)
+
+
+def test_timer_metric_watchdog_ends_a_stuck_timer():
+    timer = TimerMetric('t', maxVal = 0.05)
+    timer.timer_start()
+    end = time.monotonic() + 2
+    while timer.timer_status != TimerMetric.FINISHED and time.monotonic() < end:
+        time.sleep(0.01)
+    assert timer.timer_status == TimerMetric.FINISHED
+    assert timer.get_val() >= 0.05
+
+
+def test_timer_metric_restart_ignores_the_previous_watchdog():
+    timer = TimerMetric('t', maxVal = 0.1)
+    timer.timer_start()
+    timer.timer_end()
+    timer.timer_reset_and_start()
+    time.sleep(0.15)
+    # the watchdog of the first run got cancelled, the second run ends on its own watchdog
+    assert timer.timer_status == TimerMetric.FINISHED
+    timer.timer_reset_and_start()
+    time.sleep(0.02)
+    assert timer.timer_status == TimerMetric.STARTED
+    timer.timer_end()